@@ -1,11 +1,19 @@
 import requests
 import os
 import csv
+import hashlib
 import sqlite3
 import json
 import pathlib
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+import numpy as np
 
 from .fetch_districts import DB_PATH, npc_to_district, CACHE_DIR
+from . import fetcher
+import database
 # from ..controllers import Notifications
 from controllers import Notifications
 
@@ -17,6 +25,67 @@ CACHE_CRIME_DATA_FILE = os.path.join(CACHE_DIR, "crimes.csv")
 CACHE_CRIME_RATE_FILE = os.path.join(CACHE_DIR, "crimes_by_npc.csv")
 CACHE_POPULATION_SIZE_FILE = os.path.join(CACHE_DIR, "population_size.csv")
 
+# crime_events column -> crimes.csv column, records are returned with the CSV names
+CRIME_EVENT_COLUMNS = (
+    ('date_text', 'Date'),
+    ('time', 'Time'),
+    ('crime_type', 'Type of Crime'),
+    ('planning_area', 'Planning Area'),
+    ('summary', 'Summary'),
+    ('link', 'Link to Reference'),
+)
+
+# The source publishes full dates, and month or year only for some older cases
+CRIME_DATE_FORMATS = ('%d %b %Y', '%d %B %Y', '%b %Y', '%B %Y', '%Y')
+
+# crimes.csv columns that identify a crime, a later edit of the summary is not a new crime
+CRIME_IDENTITY_COLUMNS = ('Date', 'Planning Area', 'Type of Crime')
+
+# One row per reported crime, date is ISO yyyy-mm-dd (first day of the month or year when
+# only those are known) so ranges compare as text, date_text keeps the published value.
+# content_hash is crime_hash() of the row, used to find new crimes without reading them all
+CRIME_EVENTS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS crime_events (
+        event_id INTEGER PRIMARY KEY,
+        planning_area TEXT NOT NULL,
+        date TEXT,
+        date_text TEXT,
+        time TEXT,
+        crime_type TEXT,
+        summary TEXT,
+        link TEXT,
+        content_hash INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_crime_events_area_date ON crime_events (planning_area, date)",
+    "CREATE INDEX IF NOT EXISTS idx_crime_events_hash ON crime_events (content_hash)",
+]
+
+# Hashes looked up per query when diffing a fetch against crime_events
+HASH_LOOKUP_BATCH_SIZE = 500
+
+# Reported crimes of every NPC (Neighbourhood Police Centre) and year, as published
+CRIME_COUNTS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS crime_counts (
+    npc TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    division TEXT,
+    crimes INTEGER,
+    PRIMARY KEY (npc, year)
+)
+'''
+
+# Crimes per million residents of every location and year, locations.crime_rate holds the latest year
+CRIME_RATES_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS crime_rates (
+    location_name TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    crime_rate REAL,
+    PRIMARY KEY (location_name, year)
+)
+'''
+
 
 def load_crime_data_from_cache(file=CACHE_CRIME_DATA_FILE):
     """
@@ -26,72 +95,121 @@ def load_crime_data_from_cache(file=CACHE_CRIME_DATA_FILE):
         reader = csv.DictReader(file)
         return list(reader)
 
-def fetch_crime_data_from_api():
+def fetch_crime_data_from_api(api_url=API_URL, db_path=DB_PATH):
     """
-    Fetch crime data from the API, save it to a CSV file, and log new crimes to notifications.
-    
+    Fetch crime data from the API, store the crimes not seen before and log them to notifications.
+
+    New crimes are found by probing the content_hash index of crime_events, then inserted and
+    logged in one transaction and appended to the CSV cache, so the writes grow with the number
+    of new crimes rather than with the whole history.
+
     Returns:
         tuple: (records, new_notifications) - All records and list of new notification IDs
     """
-    response = requests.get(API_URL)
-    if response.status_code == 200:
-        data = response.json()
-        records = data.get("result", {}).get("records", [])
-        
-        # Check for new crime data by comparing with cache
-        new_crimes = []
-        existing_crimes = []
-        
-        # Load existing cache if it exists
-        if os.path.exists(CACHE_CRIME_DATA_FILE):
-            with open(CACHE_CRIME_DATA_FILE, mode="r", encoding="utf-8") as file:
-                reader = csv.DictReader(file)
-                existing_crimes = list(reader)
-        
-        # Find new crimes (not in the existing cache)
-        existing_identifiers = set()
-        for crime in existing_crimes:
-            # Create a unique identifier for each crime using date, location and type
-            identifier = f"{crime.get('Date')}-{crime.get('Planning Area')}-{crime.get('Type of Crime')}"
-            existing_identifiers.add(identifier)
-        
-        # Check each new record against the existing ones
-        for record in records:
-            identifier = f"{record.get('Date')}-{record.get('Planning Area')}-{record.get('Type of Crime')}"
-            if identifier not in existing_identifiers:
-                new_crimes.append(record)
-        
-        # Save all data to CSV
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        with open(CACHE_CRIME_DATA_FILE, mode="w", newline="", encoding="utf-8") as file:
-            writer = csv.DictWriter(file, fieldnames=records[0].keys())
+    # All pages, fetched concurrently, raises if a page still fails after retries
+    records = [
+        record
+        for _, result in fetcher.fetch_pages(api_url)
+        for record in result.get("records", [])
+    ]
+
+    # Previously cached crimes are the baseline on the first run
+    if ensure_crime_events(db_path=db_path) is False:
+        return records, []
+
+    hashes = [crime_hash(record) for record in records]
+    known_hashes = get_known_crime_hashes(hashes, db_path=db_path)
+    new_crimes = [record for record, content_hash in zip(records, hashes) if content_hash not in known_hashes]
+
+    if not new_crimes:
+        return records, []
+
+    try:
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
+            _insert_crime_events(cursor, new_crimes)
+            new_notifications = _log_crime_notifications(conn, new_crimes)
+
+            # Invalidate the in-memory crime index
+            database.bump_data_version('crimes', conn=conn)
+            conn.commit()
+    except Exception as e:
+        print(f"Error saving new crimes: {e}")
+        return records, []
+
+    append_crimes_to_cache(new_crimes)
+
+    print(f"Saved {len(new_crimes)} new crimes")
+    return records, new_notifications
+
+def crime_hash(crime: dict) -> int:
+    """
+    Return: Signed 64-bit hash of a crime's CRIME_IDENTITY_COLUMNS, fits an SQLite INTEGER.
+    """
+    key = "\x1f".join(str(crime.get(column) or '') for column in CRIME_IDENTITY_COLUMNS)
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def get_known_crime_hashes(hashes, db_path=DB_PATH) -> set:
+    """
+    Return: The subset of hashes already in crime_events, looked up through its hash index.
+    """
+    hashes = list(set(hashes))
+    known = set()
+    with database.connect(db_path) as conn:
+        for start in range(0, len(hashes), HASH_LOOKUP_BATCH_SIZE):
+            batch = hashes[start:start + HASH_LOOKUP_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT content_hash FROM crime_events WHERE content_hash IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            known.update(row[0] for row in rows)
+    return known
+
+def append_crimes_to_cache(crimes: list, file=None):
+    """
+    Append crimes to the cached CSV, keeping its columns, creating it with a header if missing.
+
+    Args:
+        file: CSV path, CACHE_CRIME_DATA_FILE if None
+    """
+    file = file or CACHE_CRIME_DATA_FILE
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+
+    fieldnames = None
+    needs_newline = False
+    if os.path.exists(file) and os.path.getsize(file) > 0:
+        with open(file, mode="r", newline="", encoding="utf-8") as f:
+            fieldnames = next(csv.reader(f), None)
+        with open(file, mode="rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b"\n", b"\r")
+
+    with open(file, mode="a", newline="", encoding="utf-8") as f:
+        if needs_newline:
+            f.write("\r\n")
+        writer = csv.DictWriter(f, fieldnames=fieldnames or list(crimes[0].keys()), extrasaction="ignore")
+        if not fieldnames:
             writer.writeheader()
-            writer.writerows(records)
-        
-        # Log new crimes to notifications
-        new_notifications = []
-        for crime in new_crimes:
-            location = crime.get('Planning Area', 'Unknown')
-            crime_type = crime.get('Type of Crime', 'Unknown')
-            date = crime.get('Date', 'Unknown date')
-            summary = crime.get('Summary', 'No details available')
-            
-            # Create notification message
-            message = f"New crime reported: {crime_type} in {location} on {date}. {summary}"
-            
-            # Log notification
-            notification_id = Notifications.NotificationsController.create_notification_log(
-                location_name=location,
-                notification_type='crime',
-                message=message
-            )
-            
-            if notification_id != -1:
-                new_notifications.append(notification_id)
-        
-        return records, new_notifications
-    else:
-        raise Exception(f"Failed to fetch data from API. Status code: {response.status_code}")
+        writer.writerows(crimes)
+
+def _log_crime_notifications(conn, crimes: list) -> list:
+    """
+    Log one crime notification per crime on the caller's transaction.
+
+    Return: IDs of the created notification logs, in crimes order
+    """
+    events = []
+    for crime in crimes:
+        location = crime.get('Planning Area', 'Unknown')
+        crime_type = crime.get('Type of Crime', 'Unknown')
+        date = crime.get('Date', 'Unknown date')
+        summary = crime.get('Summary', 'No details available')
+
+        # Create notification message
+        message = f"New crime reported: {crime_type} in {location} on {date}. {summary}"
+        events.append({'location_name': location, 'notification_type': 'crime', 'message': message})
+
+    notification_ids = Notifications.NotificationsController.create_notification_logs_bulk(events, conn=conn)
+    return [notification_id for notification_id in notification_ids if notification_id != -1]
     
 def fetch_all_crimes():
     """
@@ -195,220 +313,467 @@ def load_population_data_from_cache():
             
     return pop_dict
 
-def fetch_crime_rate_by_location(location_name: str):
+def load_crime_counts():
     """
-    Fetch crime rate filtered by location.
+    Load the NPC x year crime count matrix from crimes_by_npc.csv.
+
+    Return: (npcs, divisions, years, counts), years ascending and counts an int array of
+        shape (len(npcs), len(years)), 'na' counted as 0. Only the first row of an NPC listed
+        twice is kept.
     """
-    crime_rates = fetch_all_crime_rate()
+    crime_counts = fetch_all_crime_rate()
+    if isinstance(crime_counts, str):
+        print(crime_counts)
+        return [], [], [], np.zeros((0, 0), dtype=np.int64)
+
+    years = sorted(int(column) for column in crime_counts[0] if column.isdigit()) if crime_counts else []
+
+    first_rows = {}
+    for crime_count in crime_counts:
+        first_rows.setdefault(crime_count['NPC'], crime_count)
+
+    npcs = list(first_rows)
+    divisions = [first_rows[npc]['Division'] for npc in npcs]
+    counts = np.array(
+        [[first_rows[npc][str(year)] for year in years] for npc in npcs], dtype=np.int64
+    ).reshape(len(npcs), len(years))
+
+    return npcs, divisions, years, counts
+
+def compute_crime_rates(location_names: list, crime_counts=None):
+    """
+    Crime rate of every location for every year in crimes_by_npc.csv, in one pass.
+
+    Both CSVs are read once, each location is joined to its NPC (through npc_to_district,
+    case-insensitive) and its population, then all rates are computed as one array operation.
+
+    Args:
+        location_names: Planning area names
+        crime_counts: load_crime_counts() result, loaded here if None
+    Return: (years, rates), years ascending and rates a float array of shape
+        (len(location_names), len(years)) in crimes per million residents, 0 where the
+        location has no NPC, no population or no count
+    """
+    npcs, divisions, years, counts = crime_counts or load_crime_counts()
+    if not years:
+        return [], np.zeros((len(location_names), 0))
 
     population_size_by_district = load_population_data_from_cache()
+    npc_rows = {npc: row_index for row_index, npc in enumerate(npcs)}
 
-    # Find matching key in npc_to_district (case-insensitive)
-    location_name_lower = location_name.lower()
-    matching_key = None
+    # The first key wins when location names differ only in case
+    district_keys = {}
     for key in npc_to_district:
-        if key.lower() == location_name_lower:
-            matching_key = key
-            break
+        district_keys.setdefault(key.lower(), key)
 
-    district_pop_size = population_size_by_district.get(matching_key)
+    location_rows = np.full(len(location_names), -1, dtype=np.int64)
+    populations = np.zeros(len(location_names), dtype=np.float64)
+    for i, location_name in enumerate(location_names):
+        key = district_keys.get(location_name.lower())
+        if key is None:
+            continue
+        location_rows[i] = npc_rows.get(npc_to_district[key], -1)
+        populations[i] = population_size_by_district.get(key) or 0
 
-    print("district_pop_size ", district_pop_size)
-    print('location_name ', location_name)
-    
-    location_npc = npc_to_district[matching_key]
-    print("location_npc:", location_npc)
+    # Crimes per million people
+    has_data = (location_rows >= 0) & (populations > 0)
+    rates = np.zeros((len(location_names), len(years)), dtype=np.float64)
+    rates[has_data] = counts[location_rows[has_data]] / populations[has_data, None] * 1000000
 
-    for crime_rate_by_npc in crime_rates:
-        npc = crime_rate_by_npc["NPC"]
-        if npc == location_npc:
+    return years, rates
 
-            #CALCULATE CRIME RATE, number of crime per million people
-            if district_pop_size == 0:
-                return 0
+def fetch_crime_rate_by_location(location_name: str, year: int = None):
+    """
+    Fetch crime rate filtered by location.
 
-            crime_rate = ( crime_rate_by_npc["2023"] / district_pop_size ) * 1000000
-            return crime_rate
+    Args:
+        year: Year of the rate, the latest year if None
+    Return: Crimes per million residents, 0 if unknown
+    """
+    years, rates = compute_crime_rates([location_name])
+    if not years:
+        return 0
 
-    return 0
+    year = years[-1] if year is None else int(year)
+    if year not in years:
+        return 0
+    return float(rates[0, years.index(year)])
 
-def save_crime_rate_to_db(db_path=DB_PATH):
+def save_crime_rate_to_db(db_path=DB_PATH, year: int = None):
     """
-    Save location crime rate for each location in crime_rate column in locations table in app.db.
+    Save the crime counts of every NPC and year to the crime_counts table, the crime rate of
+    every location and year to the crime_rates table, and the one for year to the crime_rate
+    column in locations table in app.db.
+
+    Args:
+        year: Year saved to the locations table, the latest year if None
     """
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
-            # Set row_factory to get dictionary instead of tuple
-            conn.row_factory = sqlite3.Row
+        with database.connect(db_path) as conn:
             cursor = conn.cursor()
-            
+            cursor.execute(CRIME_COUNTS_SCHEMA)
+            cursor.execute(CRIME_RATES_SCHEMA)
+
             # Get all location names from the locations table
             cursor.execute("SELECT location_name FROM locations")
-            locations = cursor.fetchall()
-            
-            for location in locations:
-                location_name = location['location_name']
-                print(location_name)
-                
-                # Get crime rate for this location
-                crime_rate = fetch_crime_rate_by_location(location_name=location_name)
+            locations = [row[0] for row in cursor.fetchall()]
 
-                print(crime_rate, type(crime_rate))
-                
-                # Update the locations table with the crime rate
-                query = "UPDATE locations SET crime_rate = ? WHERE location_name = ?"
-                cursor.execute(query, (crime_rate, location_name))
-            
-            # Commit changes
+            crime_counts = load_crime_counts()
+            years, rates = compute_crime_rates(locations, crime_counts=crime_counts)
+            if not years:
+                print("Error: No crime counts to compute crime rates from")
+                return False
+
+            year = years[-1] if year is None else int(year)
+            column = years.index(year) if year in years else None
+
+            cursor.executemany(
+                "UPDATE locations SET crime_rate = ? WHERE location_name = ?",
+                [(float(rates[i, column]) if column is not None else 0, location_name)
+                 for i, location_name in enumerate(locations)]
+            )
+
+            cursor.execute("DELETE FROM crime_rates")
+            cursor.executemany(
+                "INSERT INTO crime_rates (location_name, year, crime_rate) VALUES (?, ?, ?)",
+                [(location_name, row_year, float(rates[i, j]))
+                 for i, location_name in enumerate(locations) for j, row_year in enumerate(years)]
+            )
+
+            npcs, divisions, _, counts = crime_counts
+            cursor.execute("DELETE FROM crime_counts")
+            cursor.executemany(
+                "INSERT INTO crime_counts (npc, year, division, crimes) VALUES (?, ?, ?, ?)",
+                [(npc, row_year, divisions[i], int(counts[i, j]))
+                 for i, npc in enumerate(npcs) for j, row_year in enumerate(years)]
+            )
+
+            # Invalidate in-memory caches built from the locations and crime tables
+            database.bump_data_version('locations', conn=conn)
+            database.bump_data_version('crime_rates', conn=conn)
             conn.commit()
-            return True
+
+        print(f"Updated crime rates for {len(locations)} locations and {len(years)} years")
+        return True
     
     except Exception as e:
         print(f"Error occurred: {e}")
         return False
 
-def fetch_all_crimes_by_location(location: str):
+def ensure_crime_rates(db_path=DB_PATH):
     """
-    Fetch crimes filtered by location.
+    Save the crime rates if they were never saved, e.g. a database created before crime_rates existed.
+
+    Return: False on error
     """
-    crimes = fetch_all_crimes()
-    
-    # Check if Planning Area is correctly formatted in the crimes data
-    if crimes and 'Planning Area' not in crimes[0]:
-        # Check for case sensitivity issues
-        keys = list(crimes[0].keys())
-        print(f"Available keys in crime data: {keys}")
-        # Try to find the correct key
-        planning_area_key = next((k for k in keys if k.lower() == 'planning area'), None)
-        if planning_area_key:
-            # Filter using the correct key
-            return [crime for crime in crimes if crime.get(planning_area_key) == location]
-        else:
-            print("Planning Area column not found in crime data!")
-            return []
-    
-    # Process each crime and check if it matches the location
-    matching_crimes = []
-    for crime in crimes:
-        crime_location = crime.get("Planning Area", "")
-        # # Print sample data to verify structure
-        # if len(matching_crimes) == 0 and crime_location:
-        #     print(f"Sample location in data: '{crime_location}'")
-        #     print(f"Looking for location: '{location}'")
-        
-        if crime_location == location:
-            matching_crimes.append(crime)
-            
-    return matching_crimes
+    if database.get_data_version('crime_rates', db_path=db_path) == 0:
+        return save_crime_rate_to_db(db_path=db_path)
+    return True
 
-def save_crimes_to_db(db_path=DB_PATH):
+def get_location_crime_rates(db_path=DB_PATH) -> dict:
     """
-    Save location crimes for each location in crimes column in location_details table in app.db.
+    Returns:
+        dict: {location_name: {year: crime_rate}} from the crime_rates table, empty if it doesn't exist yet
     """
     try:
-        # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
-            # Set row_factory to get dictionary instead of tuple
-            conn.row_factory = sqlite3.Row
+        rows = database.fetch_all("SELECT location_name, year, crime_rate FROM crime_rates ORDER BY year", db_path=db_path)
+    except sqlite3.OperationalError:
+        return {}
+
+    crime_rates = {}
+    for row in rows:
+        crime_rates.setdefault(row['location_name'], {})[row['year']] = row['crime_rate']
+    return crime_rates
+
+class CrimeTrends:
+    """
+    Crime rate history of every location: the location x year rate matrix, the change from
+    the previous year and the least-squares slope of each location's rates.
+    """
+
+    def __init__(self, version, location_names: list, years: list, rates):
+        """
+        Args:
+            version: 'crime_rates' data version the trends were built from
+            location_names: Row labels of rates
+            years: Column labels of rates, ascending
+            rates: Float array of crimes per million residents, (locations, years)
+        """
+        self.version = version
+        self.location_names = location_names
+        self.location_index = {location_name: i for i, location_name in enumerate(location_names)}
+        self.years = years
+        self.rates = rates
+
+        # Change from the previous year, the first year has none
+        self.changes = np.full(rates.shape, np.nan)
+        self.changes[:, 1:] = np.diff(rates, axis=1)
+
+        # Least-squares slope against centred years, crimes per million per year
+        x = np.asarray(years, dtype=np.float64)
+        x -= x.mean() if len(x) else 0
+        denominator = x @ x
+        self.slopes = rates @ x / denominator if denominator > 0 else np.zeros(len(location_names))
+
+    def for_location(self, location_name: str):
+        """
+        Return: Dict with keys 'location_name', 'years', 'crime_rate', 'change' (None for the first
+        year) and 'slope', None if the location has no crime rates
+        """
+        i = self.location_index.get(location_name)
+        if i is None:
+            return None
+
+        return {
+            'location_name': location_name,
+            'years': list(self.years),
+            'crime_rate': self.rates[i].tolist(),
+            'change': [None if np.isnan(change) else change for change in self.changes[i].tolist()],
+            'slope': float(self.slopes[i]),
+        }
+
+    def all(self) -> list:
+        """Return: for_location() of every location, by name."""
+        return [self.for_location(location_name) for location_name in sorted(self.location_names)]
+
+# db_path -> CrimeTrends
+_crime_trends_cache = {}
+_crime_trends_lock = threading.Lock()
+
+def get_crime_trends(db_path=DB_PATH) -> CrimeTrends:
+    """
+    Crime trends of every location from the crime_rates table, rebuilt when the 'crime_rates'
+    data version changes. Read only, empty until save_crime_rate_to_db has run, see ensure_crime_rates.
+    """
+    version = database.get_data_version('crime_rates', db_path=db_path)
+
+    cached = _crime_trends_cache.get(db_path)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _crime_trends_lock:
+        cached = _crime_trends_cache.get(db_path)
+        if cached is not None and cached.version == version:
+            return cached
+
+        crime_rates = get_location_crime_rates(db_path=db_path)
+        location_names = list(crime_rates)
+        years = sorted({year for location_rates in crime_rates.values() for year in location_rates})
+
+        rates = np.zeros((len(location_names), len(years)), dtype=np.float64)
+        year_index = {year: j for j, year in enumerate(years)}
+        for i, location_name in enumerate(location_names):
+            for year, crime_rate in crime_rates[location_name].items():
+                rates[i, year_index[year]] = crime_rate or 0
+
+        trends = CrimeTrends(version, location_names, years, rates)
+        _crime_trends_cache[db_path] = trends
+        return trends
+
+def parse_crime_date(text: str):
+    """
+    Return: ISO date string of a published crime date, None if it can't be parsed.
+    """
+    text = (text or "").strip()
+    for date_format in CRIME_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def save_crime_events_to_db(crimes=None, db_path=DB_PATH):
+    """
+    Replace the crime_events table with the given crimes.
+
+    Args:
+        crimes: List of crime dicts with the crimes.csv columns, the cached CSV if None
+    Return: Number of events saved, False on error
+    """
+    if crimes is None:
+        if not os.path.exists(CACHE_CRIME_DATA_FILE):
+            print("Error: crimes file not found.")
+            return False
+        crimes = load_crime_data_from_cache(CACHE_CRIME_DATA_FILE)
+
+    try:
+        with database.connect(db_path) as conn:
             cursor = conn.cursor()
-            
-            # Verify database tables and columns
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='location_details'")
-            if not cursor.fetchone():
-                print("Error: location_details table does not exist")
-                return False
-                
-            # Get all location names from the locations table
-            cursor.execute("SELECT location_name FROM location_details")
-            locations = cursor.fetchall()
-            
-            # Print current values for debugging
-            cursor.execute("SELECT location_name, crimes FROM location_details LIMIT 3")
-            sample_rows = cursor.fetchall()
-            print("Current sample data in database:")
-            for row in sample_rows:
-                print(f"  {row['location_name']}: {row['crimes'][:30]}...")
-            
-            # Debug flag to track if any changes were made
-            changes_made = False
-            
-            for location in locations:
-                location_name = location['location_name']
-                print(f"\nProcessing location: {location_name}")
-                
-                # Get all crimes for this location
-                crimes = fetch_all_crimes_by_location(location=location_name)
-                
-                # If no crimes found, continue to next location
-                if not crimes:
-                    print(f"No crimes found for location: {location_name}")
-                    continue
-                
-                # Convert to JSON string
-                json_crimes = json.dumps(crimes)
-                print(f"Saving {len(crimes)} crimes for location: {location_name}")
-                print(f"JSON length: {len(json_crimes)} characters")
-                
-                # Update the location_details table with the crimes
-                query = "UPDATE location_details SET crimes = ? WHERE location_name = ?"
-                cursor.execute(query, (json_crimes, location_name))
-                
-                # Check if the update actually changed anything
-                if cursor.rowcount > 0:
-                    print(f"Updated {cursor.rowcount} rows for {location_name}")
-                    changes_made = True
-                else:
-                    print(f"No rows updated for {location_name}")
-            
-            # Verify that changes were made
-            if changes_made:
-                # Commit changes
-                conn.commit()
-                print("Changes committed to database")
-                
-                # Verify changes were saved
-                cursor.execute("SELECT location_name, crimes FROM location_details WHERE json_array_length(crimes) > 0 LIMIT 3")
-                updated_rows = cursor.fetchall()
-                if updated_rows:
-                    print("Successfully updated rows in database:")
-                    for row in updated_rows:
-                        print(f"  {row['location_name']}: {row['crimes'][:30]}...")
-                else:
-                    print("No rows with non-empty crimes array found after update!")
-            else:
-                print("No changes made to database")
-            
-            return True
-    
+            _ensure_crime_events_table(cursor)
+
+            cursor.execute("DELETE FROM crime_events")
+            saved = _insert_crime_events(cursor, crimes)
+
+            # Invalidate the in-memory crime index
+            database.bump_data_version('crimes', conn=conn)
+            conn.commit()
     except Exception as e:
-        print(f"Error occurred: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Error saving crime events: {e}")
         return False
+
+    return saved
+
+def _ensure_crime_events_table(cursor):
+    """Create crime_events, adding content hashes to a table created before they existed."""
+    cursor.execute(CRIME_EVENTS_SCHEMA[0])
+
+    cursor.execute("PRAGMA table_info(crime_events)")
+    if 'content_hash' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE crime_events ADD COLUMN content_hash INTEGER")
+        cursor.execute("SELECT event_id, date_text, planning_area, crime_type FROM crime_events")
+        cursor.executemany("UPDATE crime_events SET content_hash = ? WHERE event_id = ?", [
+            (crime_hash(dict(zip(CRIME_IDENTITY_COLUMNS, row[1:]))), row[0]) for row in cursor.fetchall()
+        ])
+
+    for schema in CRIME_EVENTS_SCHEMA[1:]:
+        cursor.execute(schema)
+
+def _insert_crime_events(cursor, crimes: list) -> int:
+    """
+    Insert crimes into crime_events on the caller's transaction.
+
+    Return: Number of events inserted
+    """
+    columns = [column for column, _ in CRIME_EVENT_COLUMNS]
+    rows = []
+    for crime in crimes:
+        values = {column: crime.get(csv_column) for column, csv_column in CRIME_EVENT_COLUMNS}
+        values['planning_area'] = values['planning_area'] or ''
+        rows.append((crime_hash(crime), parse_crime_date(crime.get('Date')), *(values[column] for column in columns)))
+
+    cursor.executemany(
+        f"INSERT INTO crime_events (content_hash, date, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 2))})",
+        rows
+    )
+    return len(rows)
+
+def ensure_crime_events(db_path=DB_PATH):
+    """
+    Make sure crime_events exists with content hashes, importing the cached crimes.csv if the
+    table was never filled.
+
+    Return: False on error
+    """
+    if database.get_data_version('crimes', db_path=db_path) == 0 and os.path.exists(CACHE_CRIME_DATA_FILE):
+        return save_crime_events_to_db(db_path=db_path) is not False
+
+    try:
+        with database.connect(db_path) as conn:
+            _ensure_crime_events_table(conn.cursor())
+            conn.commit()
+    except Exception as e:
+        print(f"Error creating crime events table: {e}")
+        return False
+    return True
+
+# db_path -> (version, {planning_area: (dates, positions, records)}), see get_crime_index
+_crime_index_cache = {}
+_crime_index_lock = threading.Lock()
+
+def _load_crime_index(db_path):
+    select = ", ".join(["date"] + [column for column, _ in CRIME_EVENT_COLUMNS])
+    rows = database.fetch_all(
+        f"SELECT {select} FROM crime_events ORDER BY planning_area, event_id", db_path=db_path
+    )
+
+    grouped = {}
+    for row in rows:
+        event_dates, records = grouped.setdefault(row['planning_area'], ([], []))
+        # Undated events sort first and are left out of date ranges
+        event_dates.append(row['date'] or '')
+        records.append({csv_column: row[column] for column, csv_column in CRIME_EVENT_COLUMNS})
+
+    index = {}
+    for planning_area, (event_dates, records) in grouped.items():
+        # Stable sort, events on the same date keep their crimes.csv order
+        positions = sorted(range(len(records)), key=event_dates.__getitem__)
+        index[planning_area] = ([event_dates[i] for i in positions], positions, records)
+    return index
+
+def get_crime_index(db_path=DB_PATH) -> dict:
+    """
+    In-memory index of crime_events by planning area, rebuilt when the 'crimes' data version changes.
+    Imports the cached crimes.csv the first time if crime_events was never filled.
+
+    Return: Dict of planning area -> (ISO dates sorted by date, positions of those events in records,
+        crime records in crimes.csv order)
+    """
+    version = database.get_data_version('crimes', db_path=db_path)
+
+    cached = _crime_index_cache.get(db_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _crime_index_lock:
+        cached = _crime_index_cache.get(db_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        if version == 0:
+            # crime_events never filled, e.g. a database created before it existed
+            if ensure_crime_events(db_path=db_path) is False:
+                return {}
+            version = database.get_data_version('crimes', db_path=db_path)
+
+        index = _load_crime_index(db_path)
+
+        _crime_index_cache[db_path] = (version, index)
+        return index
+
+def _as_iso_date(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+def fetch_all_crimes_by_location(location: str, start_date=None, end_date=None, db_path=DB_PATH):
+    """
+    Fetch crimes filtered by location and optionally by date.
+
+    Args:
+        location: Planning area name, as published in the crime data
+        start_date, end_date: Optional inclusive bounds, date objects or ISO yyyy-mm-dd strings
+    Return: List of crime dicts with the crimes.csv columns, in crimes.csv order
+    """
+    dates, positions, records = get_crime_index(db_path=db_path).get(location, ([], [], []))
+
+    if start_date is None and end_date is None:
+        return [dict(record) for record in records]
+
+    # Undated events are stored as '' and sort first, a date range leaves them out
+    start, end = bisect_right(dates, ''), len(dates)
+    if start_date is not None:
+        start = max(start, bisect_left(dates, _as_iso_date(start_date)))
+    if end_date is not None:
+        end = bisect_right(dates, _as_iso_date(end_date))
+
+    return [dict(records[i]) for i in sorted(positions[start:end])]
+
+def save_crimes_to_db(db_path=DB_PATH):
+    """
+    Save the cached crimes to the crime_events table in app.db.
+    """
+    return save_crime_events_to_db(db_path=db_path) is not False
     
 # Comment out all code above to insert
 from datetime import datetime
 def create_dummy_notification_log():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    dummy_log = {
-        "type": "crime",
-        "location_name": "Bishan",
-        "message": "Test alert: Dummy crime reported in Bishan on 2025-04-09.",
-        "sent": False,
-        "created_at": datetime.now().isoformat()
-    }
-
-    cursor.execute('''
-        INSERT INTO notification_logs (type, location_name, message, sent, created_at)
-        VALUES (:type, :location_name, :message, :sent, :created_at)
-    ''', dummy_log)
-
-    conn.commit()
-    inserted_id = cursor.lastrowid
-    conn.close()
+    with database.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+
+        dummy_log = {
+            "type": "crime",
+            "location_name": "Bishan",
+            "message": "Test alert: Dummy crime reported in Bishan on 2025-04-09.",
+            "sent": False,
+            "created_at": datetime.now().isoformat()
+        }
+
+        cursor.execute('''
+            INSERT INTO notification_logs (type, location_name, message, sent, created_at)
+            VALUES (:type, :location_name, :message, :sent, :created_at)
+        ''', dummy_log)
+
+        conn.commit()
+        inserted_id = cursor.lastrowid
     
     print(f"Dummy notification log created with ID: {inserted_id}")
 
@@ -9,6 +9,8 @@ import json
 import csv
 import pathlib
 from dotenv import load_dotenv
+from . import geometry
+import database
 
 # Use absolute paths based on the location of the current script
 SCRIPT_DIR = pathlib.Path(__file__).parent.absolute()
@@ -17,6 +19,42 @@ CACHE_DIR = os.path.join(PROJECT_ROOT, "api_cache")
 CACHE_LOCATION_COORDINATES_FILE = os.path.join(CACHE_DIR, "locations_coordinates.csv")
 DB_PATH = os.path.join(PROJECT_ROOT, 'app.db')
 
+# Simplified planning-area outlines, one row per location per LOD level
+LOCATION_GEOMETRY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS location_geometry (
+    location_name TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    num_points INTEGER,
+    coordinates TEXT,
+    PRIMARY KEY (location_name, level),
+    FOREIGN KEY (location_name) REFERENCES locations (location_name)
+)
+'''
+
+# Bounding box and centroid per location, the R*Tree mirrors the box for fast viewport queries
+LOCATION_BOUNDS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS location_bounds (
+        id INTEGER PRIMARY KEY,
+        location_name TEXT UNIQUE NOT NULL,
+        min_lon REAL,
+        min_lat REAL,
+        max_lon REAL,
+        max_lat REAL,
+        centroid_lon REAL,
+        centroid_lat REAL,
+        FOREIGN KEY (location_name) REFERENCES locations (location_name)
+    )
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS location_bounds_rtree USING rtree(
+        id,
+        min_lon, max_lon,
+        min_lat, max_lat
+    )
+    ''',
+]
+
 # Ignore this i shifted it here to resolve circular import error
 npc_to_district = {
     "Ang Mo Kio": "Ang Mo Kio South NPC",
@@ -163,7 +201,7 @@ def save_location_name_to_db(db_path=DB_PATH):
     
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             # Set row_factory to get dictionary instead of tuple
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
@@ -190,6 +228,8 @@ def save_location_name_to_db(db_path=DB_PATH):
                     cursor.execute(query, (location_name,))
             
             # Commit changes
+            # Invalidate in-memory caches built from the locations table
+            database.bump_data_version('locations', conn=conn)
             conn.commit()
             return True
     
@@ -206,7 +246,7 @@ def save_location_coords_to_db(db_path=DB_PATH):
 
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             # Set row_factory to get dictionary instead of tuple
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
@@ -229,7 +269,12 @@ def save_location_coords_to_db(db_path=DB_PATH):
                         # Insert new record
                         query = "INSERT INTO location_details (location_name, coordinates) VALUES (?, ?)"
                         cursor.execute(query, (location_name, coordinates_json))
-            
+
+            # Rebuild the simplified copies alongside the raw polygons
+            save_location_lods_to_db(conn=conn, locations_geodata=locations_geodata)
+            save_location_bounds_to_db(conn=conn, locations_geodata=locations_geodata)
+            database.bump_data_version('geometry', conn=conn)
+
             # Commit changes
             conn.commit()
             return True
@@ -238,6 +283,101 @@ def save_location_coords_to_db(db_path=DB_PATH):
         print(f"Error occurred: {e}")
         return False
     
+def save_location_lods_to_db(conn, locations_geodata: list):
+    """
+    Precompute every location's outer ring at each LOD level in geometry.LOD_LEVELS
+    and store them in the location_geometry table.
+
+    Args:
+        conn: Open database connection, caller commits
+        locations_geodata: List of dicts, key is location name and value is coordinates
+    """
+    cursor = conn.cursor()
+    cursor.execute(LOCATION_GEOMETRY_SCHEMA)
+
+    rows = []
+    for location_geodata in locations_geodata:
+        for location_name, coordinates in location_geodata.items():
+            if not isinstance(coordinates, list) or len(coordinates) == 0:
+                continue
+
+            for level, ring in geometry.build_lods(geometry.outer_ring(coordinates)).items():
+                rows.append((location_name, level, len(ring), json.dumps(ring, separators=(",", ":"))))
+
+    cursor.execute("DELETE FROM location_geometry")
+    cursor.executemany('''
+        INSERT INTO location_geometry (location_name, level, num_points, coordinates)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+
+    print(f"Saved {len(rows)} LOD polygons")
+
+def save_location_bounds_to_db(conn, locations_geodata: list):
+    """
+    Rebuild location_bounds and its R*Tree from raw polygons, inside the caller's transaction.
+    """
+    cursor = conn.cursor()
+    cursor.execute(LOCATION_BOUNDS_SCHEMA[0])
+    try:
+        cursor.execute(LOCATION_BOUNDS_SCHEMA[1])
+        has_rtree = True
+    except sqlite3.OperationalError:
+        # SQLite built without R*Tree, bbox queries fall back to location_bounds
+        print("Warning: SQLite R*Tree module not available")
+        has_rtree = False
+
+    rows = []
+    for location_geodata in locations_geodata:
+        for location_name, coordinates in location_geodata.items():
+            if not isinstance(coordinates, list) or len(coordinates) == 0:
+                continue
+
+            ring = geometry.outer_ring(coordinates)
+            rows.append((len(rows) + 1, location_name, *geometry.ring_bounds(ring), *geometry.ring_centroid(ring)))
+
+    cursor.execute("DELETE FROM location_bounds")
+    cursor.executemany('''
+        INSERT INTO location_bounds (id, location_name, min_lon, min_lat, max_lon, max_lat, centroid_lon, centroid_lat)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    if has_rtree:
+        cursor.execute("DELETE FROM location_bounds_rtree")
+        cursor.execute('''
+            INSERT INTO location_bounds_rtree (id, min_lon, max_lon, min_lat, max_lat)
+            SELECT id, min_lon, max_lon, min_lat, max_lat FROM location_bounds
+        ''')
+
+def get_location_names_in_bbox(bbox, db_path=DB_PATH):
+    """
+    Args:
+        bbox: (min_lon, min_lat, max_lon, max_lat)
+    Return: List of location names whose bounding box intersects bbox, None if the bounds index was never built
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    params = (min_lon, max_lon, min_lat, max_lat)
+
+    queries = [
+        '''
+        SELECT b.location_name FROM location_bounds_rtree r
+        JOIN location_bounds b ON b.id = r.id
+        WHERE r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?
+        ''',
+        # Without the R*Tree
+        '''
+        SELECT location_name FROM location_bounds
+        WHERE max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?
+        ''',
+    ]
+
+    for query in queries:
+        try:
+            return [row['location_name'] for row in database.fetch_all(query, params, db_path=db_path)]
+        except sqlite3.OperationalError:
+            continue
+
+    return None
+
 def get_all_location_geodata_from_csv(csv_filename=CACHE_LOCATION_COORDINATES_FILE) -> list:
     """
     Return: list of dicts, each location has 1 dict, with key as location name and value as location coordinates.
@@ -263,7 +403,7 @@ def get_location_geodata(location_name: str, db_path=DB_PATH):
     """
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -281,14 +421,44 @@ def get_location_geodata(location_name: str, db_path=DB_PATH):
     
     return None  # Return None if location is not found
 
-def get_all_locations_geodata(db_path=DB_PATH):
+def get_all_locations_geodata(db_path=DB_PATH, level=0, bbox=None):
+    """
+    Args:
+        level: LOD level from geometry.LOD_LEVELS, 0 is the full resolution polygon
+        bbox: Optional (min_lon, min_lat, max_lon, max_lat), only locations whose bounding box intersects it are returned
+
+    Return: List of dicts, each location has 1 dict with keys location_name and geodata (outer ring coordinates)
+    """
+    location_names = None
+    if bbox is not None:
+        location_names = get_location_names_in_bbox(bbox, db_path=db_path)
+        if location_names is None:
+            print("Warning: No location bounds index, filtering bbox on the fly")
+            return [
+                location for location in get_all_locations_geodata(db_path=db_path, level=level)
+                if geometry.bounds_intersect(geometry.ring_bounds(location['geodata']), bbox)
+            ]
+        if not location_names:
+            return []
+
+    if level:
+        result = get_all_locations_lod_geodata(db_path=db_path, level=level, location_names=location_names)
+        if result:
+            return result
+        print(f"Warning: No precomputed LOD {level} polygons, simplifying on the fly")
+
     result = []
     try:
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             query = "SELECT location_name, coordinates FROM location_details"
-            cursor.execute(query)
+            params = ()
+            if location_names is not None:
+                # Keep table order, the IN lookup would otherwise return them by name
+                query += f" WHERE location_name IN ({','.join('?' * len(location_names))}) ORDER BY rowid"
+                params = tuple(location_names)
+            cursor.execute(query, params)
             
             rows = cursor.fetchall()
             for row in rows:
@@ -298,8 +468,7 @@ def get_all_locations_geodata(db_path=DB_PATH):
                 # Ensure coordinates are in the correct format
                 if isinstance(coordinates, list) and len(coordinates) > 0:
                     # Extract the innermost coordinate array
-                    while isinstance(coordinates[0][0], list):
-                        coordinates = coordinates[0]
+                    coordinates = geometry.outer_ring(coordinates)
                         
                     # # Make sure coordinates form a closed loop
                     # if coordinates[0] != coordinates[-1]:
@@ -307,6 +476,9 @@ def get_all_locations_geodata(db_path=DB_PATH):
 
                      # Debug log
                     # print(f"Raw coordinates for {location_name}:", coordinates)
+
+                    if level:
+                        coordinates = geometry.simplify_ring(coordinates, geometry.tolerance_for_level(level))
                     
                     result.append({
                         "location_name": location_name,
@@ -320,6 +492,40 @@ def get_all_locations_geodata(db_path=DB_PATH):
     
     return result
 
+def get_all_locations_lod_geodata(db_path=DB_PATH, level=0, location_names=None):
+    """
+    Precomputed simplified outlines from the location_geometry table.
+
+    Args:
+        location_names: Optional list of locations to restrict to
+    Return: List of dicts like get_all_locations_geodata, empty if the level was never built
+    """
+    query = '''
+        SELECT d.location_name, g.coordinates
+        FROM location_details d
+        JOIN location_geometry g ON g.location_name = d.location_name
+        WHERE g.level = ?
+    '''
+    params = (level,)
+    if location_names is not None:
+        query += f" AND d.location_name IN ({','.join('?' * len(location_names))})"
+        params += tuple(location_names)
+    # Same order as get_all_locations_geodata, whatever join order SQLite picks
+    query += " ORDER BY d.rowid"
+
+    try:
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+
+            return [
+                {"location_name": row['location_name'], "geodata": json.loads(row['coordinates'])}
+                for row in cursor.fetchall()
+            ]
+    except sqlite3.OperationalError:
+        # location_geometry not created yet
+        return []
+
 def fetch_coordinates_from_building_name(building_name: str, access_token):
     """
     Function that takes in a building name / postal code / other building details and passes it to the api for elastic search.
@@ -8,6 +8,9 @@ import pathlib
 from datetime import datetime
 
 from .fetch_districts import DB_PATH, CACHE_DIR
+from . import poi_index
+import database
+from controllers import Notifications
 
 CACHE_LOCATION_COORDINATES_FILE = os.path.join(CACHE_DIR, "malls_coordinates.csv")
 
@@ -42,9 +45,9 @@ def fetch_malls(mall_name: str) -> dict:
     # Return an empty dict if not found
     return {}
 
-def fetch_all_malls() -> list:
+def load_malls_from_cache() -> list:
     """
-    Fetch all malls from the cache or API.
+    Parse the malls CSV cache.
     
     Return: List of dicts with mall information.
     """
@@ -64,6 +67,24 @@ def fetch_all_malls() -> list:
     
     return malls
 
+def get_malls_index():
+    """
+    Return: In-memory POI index over the malls CSV, reloaded only when the file changes.
+    """
+    return poi_index.get_index(
+        CACHE_LOCATION_COORDINATES_FILE,
+        loader=load_malls_from_cache,
+        area_of=lambda mall: mall['planning_area'],
+    )
+
+def fetch_all_malls() -> list:
+    """
+    Fetch all malls from the in-memory index.
+    
+    Return: List of dicts with mall information.
+    """
+    return get_malls_index().all()
+
 def get_all_malls_by_location(location_name: str) -> list:
     """
     Return: All malls in a location. List of dicts with mall information.
@@ -71,16 +92,7 @@ def get_all_malls_by_location(location_name: str) -> list:
     Args:
         location_name: Name of the location/district to search in.
     """
-    # Get all malls
-    all_malls = fetch_all_malls()
-    
-    # Filter malls by planning area
-    nearby_malls = []
-    for mall in all_malls:
-        if mall['planning_area'].lower() == location_name.lower():
-            nearby_malls.append(mall)
-    
-    return nearby_malls
+    return get_malls_index().in_area(location_name)
 
 def get_num_malls_by_district(district_name: str) -> int:
     """
@@ -89,16 +101,7 @@ def get_num_malls_by_district(district_name: str) -> int:
     Args:
         district_name: Name of the district/planning area.
     """
-    # Get all malls
-    all_malls = fetch_all_malls()
-    
-    # Filter malls by planning area
-    count = 0
-    for mall in all_malls:
-        if mall['planning_area'].lower() == district_name.lower():
-            count += 1
-    
-    return count
+    return get_malls_index().count_in_area(district_name)
 
 def save_num_malls_to_db(db_path=DB_PATH):
     """
@@ -106,15 +109,16 @@ def save_num_malls_to_db(db_path=DB_PATH):
     """
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             # Set row_factory to get dictionary instead of tuple
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            # Get all location names from the locations table
-            cursor.execute("SELECT location_name FROM locations")
+            # Get all location names and their current count from the locations table
+            cursor.execute("SELECT location_name, num_malls FROM locations")
             locations = cursor.fetchall()
             
+            changes = []
             for location in locations:
                 location_name = location['location_name']
                 
@@ -124,8 +128,20 @@ def save_num_malls_to_db(db_path=DB_PATH):
                 # Update the locations table with the number of malls
                 query = "UPDATE locations SET num_malls = ? WHERE location_name = ?"
                 cursor.execute(query, (num_malls, location_name))
+
+                # Notify about counts that changed, not about the first count saved
+                if location['num_malls'] is not None and location['num_malls'] != num_malls:
+                    changes.append({
+                        'location_name': location_name,
+                        'notification_type': 'malls',
+                        'message': f"Number of malls in {location_name} changed from {location['num_malls']:.0f} to {num_malls}",
+                    })
+
+            Notifications.NotificationsController.create_notification_logs_bulk(changes, conn=conn)
             
             # Commit changes
+            # Invalidate in-memory caches built from the locations table
+            database.bump_data_version('locations', conn=conn)
             conn.commit()
             return True
     
@@ -1,4 +1,3 @@
-import requests
 import os
 import csv
 import sqlite3
@@ -6,8 +5,16 @@ import json
 import pathlib
 from datetime import datetime
 import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
 
 from .fetch_districts import DB_PATH, CACHE_DIR
+from . import fetcher, resale_snapshot
+import database
+from controllers import Notifications
 
 # Constants
 DATASET_ID = "d_8b84c4ee58e3cfc0ece0d773c8ca6abc"
@@ -16,158 +23,670 @@ API_URL = f"https://data.gov.sg/api/action/datastore_search?resource_id={DATASET
 # Use absolute paths based on the location of the current script
 CACHE_RESALE_DATA_FILE = os.path.join(CACHE_DIR, "hdb_resale_prices.csv")
 
+# Monthly rollup of resale_transactions, maintained at ingest so readers never scan raw rows
+RESALE_MONTHLY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS resale_monthly (
+    town TEXT NOT NULL,
+    flat_type TEXT NOT NULL,
+    month TEXT NOT NULL,
+    num_transactions INTEGER NOT NULL,
+    mean_price REAL,
+    median_price REAL,
+    min_price REAL,
+    max_price REAL,
+    PRIMARY KEY (town, flat_type, month)
+)
+'''
+
+# Checkpoint of the last incremental sync per remote source
+SYNC_STATE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sync_state (
+    source TEXT PRIMARY KEY,
+    last_offset INTEGER NOT NULL DEFAULT 0,
+    last_id INTEGER,
+    last_month TEXT,
+    pending_towns TEXT,
+    updated_at TEXT
+)
+'''
+
+# Resale transactions are stored normalised: integer keys, lookup tables for the repeated
+# text columns and month as a yyyymm integer, e.g. 2024-01 -> 202401
+RESALE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS towns (
+        town_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS flat_types (
+        flat_type_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS streets (
+        street_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    # sale_id is the API's _id, or the row number for rows loaded from the CSV export
+    '''
+    CREATE TABLE IF NOT EXISTS resale_sales (
+        sale_id INTEGER PRIMARY KEY,
+        month INTEGER,
+        town_id INTEGER NOT NULL REFERENCES towns (town_id),
+        flat_type_id INTEGER NOT NULL REFERENCES flat_types (flat_type_id),
+        block TEXT,
+        street_id INTEGER NOT NULL REFERENCES streets (street_id),
+        resale_price REAL
+    )
+    ''',
+]
+
+# Indices for common query fields
+RESALE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_resale_sales_month ON resale_sales (month)',
+    # Keyset pagination of a town's transactions, see get_transactions_page
+    'CREATE INDEX IF NOT EXISTS idx_resale_sales_town_month ON resale_sales (town_id, month, sale_id)',
+    # Latest month and trailing window per town and flat type, see compute_location_prices
+    'CREATE INDEX IF NOT EXISTS idx_resale_sales_town_flat_type ON resale_sales (town_id, flat_type_id, month)',
+]
+
+# The old row layout, for ad-hoc queries and older readers. Filter on the s.* columns
+# when querying RESALE_TRANSACTIONS_SELECT directly so the integer indices are used
+RESALE_TRANSACTIONS_SELECT = '''
+SELECT s.sale_id AS _id,
+       CASE WHEN s.month IS NULL THEN '' ELSE printf('%04d-%02d', s.month / 100, s.month % 100) END AS month,
+       t.name AS town,
+       f.name AS flat_type,
+       s.block,
+       st.name AS street_name,
+       s.resale_price
+FROM resale_sales s
+JOIN towns t ON t.town_id = s.town_id
+JOIN flat_types f ON f.flat_type_id = s.flat_type_id
+JOIN streets st ON st.street_id = s.street_id
+'''
+
+RESALE_TRANSACTIONS_VIEW = "CREATE VIEW IF NOT EXISTS resale_transactions AS" + RESALE_TRANSACTIONS_SELECT
+
+# Lookup table -> (id column, name of the text column it replaces)
+RESALE_LOOKUPS = {
+    'towns': ('town_id', 'town'),
+    'flat_types': ('flat_type_id', 'flat_type'),
+    'streets': ('street_id', 'street_name'),
+}
+
+SYNC_SOURCE = "hdb_resale"
+
+def month_to_int(month):
+    """
+    Returns:
+        int: yyyymm of a 'YYYY-MM' month, None if it isn't one
+    """
+    try:
+        year, month_of_year = str(month).split('-')[:2]
+        return int(year) * 100 + int(month_of_year)
+    except ValueError:
+        return None
+
+def month_to_str(month):
+    """
+    Returns:
+        str: 'YYYY-MM' of a yyyymm month, '' if it is None
+    """
+    if month is None:
+        return ''
+    return f"{month // 100:04d}-{month % 100:02d}"
+
+def _lookup_ids(cursor, table: str, names) -> dict:
+    """
+    Ids of names in a lookup table, adding the names that are new.
+
+    Returns:
+        dict: {name: id}
+    """
+    id_column, _ = RESALE_LOOKUPS[table]
+    # New names get ids in name order
+    cursor.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in sorted(set(names))])
+    cursor.execute(f"SELECT name, {id_column} FROM {table}")
+    return dict(cursor.fetchall())
+
+def _migrate_legacy_table(cursor):
+    """
+    Move rows of the old denormalised resale_transactions table into resale_sales, then drop it.
+    Numeric _ids (from the API) are kept, other rows are numbered after them.
+    """
+    for table, (_, column) in RESALE_LOOKUPS.items():
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (name) SELECT DISTINCT COALESCE({column}, '') FROM resale_transactions")
+
+    select = '''
+    SELECT {sale_id},
+           CASE WHEN r.month GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'
+                THEN CAST(substr(r.month, 1, 4) AS INTEGER) * 100 + CAST(substr(r.month, 6, 2) AS INTEGER) END,
+           t.town_id, f.flat_type_id, r.block, st.street_id, r.resale_price
+    FROM resale_transactions r
+    JOIN towns t ON t.name = COALESCE(r.town, '')
+    JOIN flat_types f ON f.name = COALESCE(r.flat_type, '')
+    JOIN streets st ON st.name = COALESCE(r.street_name, '')
+    WHERE {condition}
+    ORDER BY r.rowid
+    '''
+    numeric = "r._id <> '' AND r._id NOT GLOB '*[^0-9]*'"
+    insert = "INSERT OR REPLACE INTO resale_sales (sale_id, month, town_id, flat_type_id, block, street_id, resale_price) "
+
+    cursor.execute(insert + select.format(sale_id="CAST(r._id AS INTEGER)", condition=numeric))
+    # NULL sale_id takes the next free id
+    cursor.execute(insert + select.format(sale_id="NULL", condition=f"NOT ({numeric})"))
+
+    cursor.execute("DROP TABLE resale_transactions")
+
+# db paths whose resale schema was checked in this process
+_schema_checked = set()
+_schema_lock = threading.Lock()
+
+def ensure_resale_schema(db_path=DB_PATH):
+    """
+    Create the normalised resale tables, indices and the resale_transactions view,
+    converting a database that still has the old resale_transactions table.
+    """
+    if db_path in _schema_checked:
+        return
+
+    with _schema_lock:
+        if db_path in _schema_checked:
+            return
+
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT type FROM sqlite_master WHERE name = 'resale_transactions'")
+            row = cursor.fetchone()
+            legacy = row is not None and row[0] == 'table'
+
+            for schema in RESALE_SCHEMA:
+                cursor.execute(schema)
+            if legacy:
+                print("Converting resale_transactions to the normalised schema...")
+                _migrate_legacy_table(cursor)
+            for index in RESALE_INDEXES:
+                cursor.execute(index)
+            cursor.execute(RESALE_TRANSACTIONS_VIEW)
+            conn.commit()
+
+            if legacy:
+                # Give the space of the old table and its text indices back
+                conn.execute("VACUUM")
+
+        _schema_checked.add(db_path)
+
 def fetch_data_from_api():
     """
-    Fetch HDB resale price data from the API with pagination and save it directly to SQLite.
+    Fetch the whole HDB resale price dataset from the API and save it directly to SQLite.
+    Returns the number of records fetched.
     """
-    # Create the cache directory if it doesn't exist
-    os.makedirs(DB_PATH, exist_ok=True)
-    
-    # Initialize the database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Fetch data with pagination
-    offset = 0
-    limit = 1000
-    total_records = 0
-    
-    print(f"Fetching data from API...")
-    while True:
-        paginated_url = f"{API_URL}&limit={limit}&offset={offset}"
-        response = requests.get(paginated_url)
-        
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch data from API. Status code: {response.status_code}")
-        
-        data = response.json()
-        records = data.get("result", {}).get("records", [])
-        
-        if not records:
-            break
-            
-        # Insert records into the database
-        records_to_insert = []
-        for record in records:
-            # Convert numeric fields to the right type
-            resale_price = float(record.get('resale_price', 0)) if record.get('resale_price') else 0
-            
-            records_to_insert.append((
-                record.get('_id', ''),
-                record.get('month', ''),
-                record.get('town', ''),
-                record.get('flat_type', ''),
-                record.get('block', ''),
-                record.get('street_name', ''),
-                resale_price,
-            ))
-        
-        cursor.executemany('''
-        INSERT OR REPLACE INTO resale_transactions 
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', records_to_insert)
-        
+    return sync_resale_data(full=True, update_prices=False)
+
+def get_sync_state(db_path=DB_PATH, source=SYNC_SOURCE):
+    """
+    Returns:
+        dict: last_offset, last_id, last_month, pending_towns (JSON list of towns whose price is not
+        saved yet) and updated_at of the last sync, None if never synced
+    """
+    try:
+        return database.fetch_one("SELECT * FROM sync_state WHERE source = ?", (source,), db_path=db_path)
+    except sqlite3.OperationalError:
+        return None
+
+def _ensure_sync_state_table(cursor):
+    """Create sync_state, adding pending_towns to a table created before it existed."""
+    cursor.execute(SYNC_STATE_SCHEMA)
+    cursor.execute("PRAGMA table_info(sync_state)")
+    if 'pending_towns' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE sync_state ADD COLUMN pending_towns TEXT")
+
+def _save_sync_state(cursor, offset, last_id, last_month, pending_towns):
+    cursor.execute('''
+    INSERT OR REPLACE INTO sync_state (source, last_offset, last_id, last_month, pending_towns, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', (SYNC_SOURCE, offset, last_id, last_month, json.dumps(sorted(pending_towns)),
+          datetime.now().isoformat(timespec='seconds')))
+
+def sync_resale_data(api_url=API_URL, db_path=DB_PATH, limit=1000, full=False, update_prices=True, max_workers=fetcher.MAX_WORKERS):
+    """
+    Fetch only resale records added since the last sync, using the offset checkpoint in sync_state.
+
+    Records are requested in _id order, so rows already synced keep their offsets and new rows
+    are appended at the end. Every page is committed together with its resale_monthly groups and
+    the checkpoint, which also lists the towns whose locations.price still has to be recomputed,
+    so an interrupted sync resumes where it stopped and the next run finishes the price update.
+    If the remote dataset shrank (it was republished), the stored rows are deleted and
+    everything is fetched again.
+
+    Args:
+        api_url (str): datastore_search URL including resource_id, overridable for a local stand-in server
+        db_path (str): Database holding resale_transactions
+        limit (int): Records per page
+        full (bool): Ignore the checkpoint and fetch from offset 0
+        update_prices (bool): Refresh locations.price for towns that got new records
+        max_workers (int): Pages fetched concurrently
+
+    Returns:
+        int: Number of records fetched
+    """
+    ensure_resale_schema(db_path)
+
+    with database.connect(db_path) as conn:
+        cursor = conn.cursor()
+        _ensure_sync_state_table(cursor)
         conn.commit()
-        total_records += len(records)
-        offset += limit
-        
-        print(f"Fetched {total_records} records so far...")
-        
-        # Check if we've reached the end of the dataset
-        if len(records) < limit:
-            break
-    
-    print(f"Successfully fetched {total_records} records from API")
-    conn.close()
+
+        state = get_sync_state(db_path=db_path)
+        # Towns synced by an earlier run that stopped before their prices were saved
+        pending_towns = set(json.loads(state['pending_towns'] or '[]')) if state else set()
+        if full:
+            state = None
+        offset = state['last_offset'] if state else 0
+        last_id = state['last_id'] if state else None
+        last_month = state['last_month'] if state else None
+        total_records = 0
+
+        print(f"Fetching data from API from offset {offset}...")
+        restart = True
+        while restart:
+            restart = False
+
+            # Pages arrive in offset order, this thread is the only writer
+            for page_offset, result in fetcher.fetch_pages(api_url, page_size=limit, start_offset=offset,
+                                                           params={"sort": "_id asc"}, max_workers=max_workers):
+                records = result.get("records", [])
+
+                if page_offset and result.get("total") is not None and result["total"] < page_offset:
+                    print(f"Remote dataset shrank to {result['total']} records, syncing from scratch")
+
+                    # Drop the old rows, every town's price has to be recomputed from the new ones
+                    cursor.execute("SELECT name FROM towns")
+                    pending_towns.update(row[0] for row in cursor.fetchall())
+                    cursor.execute("DELETE FROM resale_sales")
+                    cursor.execute(RESALE_MONTHLY_SCHEMA)
+                    cursor.execute("DELETE FROM resale_monthly")
+                    database.bump_data_version('resale', conn=conn)
+
+                    offset, last_id, last_month = 0, None, None
+                    _save_sync_state(cursor, offset, last_id, last_month, pending_towns)
+                    conn.commit()
+
+                    restart = True
+                    break
+
+                if not records:
+                    break
+
+                # Resolve the page's text columns to lookup ids once
+                ids = {
+                    table: _lookup_ids(cursor, table, (record.get(column) or '' for record in records))
+                    for table, (_, column) in RESALE_LOOKUPS.items()
+                }
+
+                # Insert records into the database
+                records_to_insert = []
+                for record in records:
+                    # Convert numeric fields to the right type
+                    resale_price = float(record.get('resale_price', 0)) if record.get('resale_price') else 0
+                    sale_id = record.get('_id')
+
+                    records_to_insert.append((
+                        int(sale_id) if str(sale_id).isdigit() else None,
+                        month_to_int(record.get('month', '')),
+                        ids['towns'][record.get('town') or ''],
+                        ids['flat_types'][record.get('flat_type') or ''],
+                        record.get('block', ''),
+                        ids['streets'][record.get('street_name') or ''],
+                        resale_price,
+                    ))
+
+                cursor.executemany('''
+                INSERT OR REPLACE INTO resale_sales (sale_id, month, town_id, flat_type_id, block, street_id, resale_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', records_to_insert)
+
+                # (town, flat_type, month) groups whose rollup needs recomputing, done with this page
+                groups = {(record.get('town') or '', record.get('flat_type') or '', month_to_str(month_to_int(record.get('month', ''))))
+                          for record in records}
+                refresh_resale_monthly(conn, groups=groups)
+                pending_towns.update(town for town, _, _ in groups)
+
+                total_records += len(records)
+                offset = page_offset + len(records)
+                last_id = max([int(record['_id']) for record in records if str(record.get('_id', '')).isdigit()] + [last_id or 0])
+                last_month = max([record.get('month', '') for record in records] + [last_month or ''])
+
+                _save_sync_state(cursor, offset, last_id, last_month, pending_towns)
+                conn.commit()
+
+                print(f"Fetched {total_records} records so far...")
+
+        print(f"Successfully fetched {total_records} records from API")
+
+    if total_records:
+        resale_snapshot.export_snapshot(db_path=db_path)
+
+    # Only towns with new transactions can have a new latest price
+    if pending_towns and update_prices and save_resale_price_to_db(db_path=db_path, location_names=pending_towns):
+        with database.connect(db_path) as conn:
+            conn.execute("UPDATE sync_state SET pending_towns = '[]' WHERE source = ?", (SYNC_SOURCE,))
+            conn.commit()
+
     return total_records
 
-def _migrate_csv_to_db():
+def _migrate_csv_to_db(csv_path=CACHE_RESALE_DATA_FILE, db_path=DB_PATH, chunk_size=100000):
     """
     Migrate existing CSV data to SQLite database.
+
+    Bulk load: the CSV is parsed in chunks with pandas and each chunk is inserted as soon as it
+    is parsed, all in a single transaction with relaxed pragmas. The secondary indices are built
+    after the load, and the sync checkpoint is reset to the loaded rows in the same transaction.
     Returns the number of records migrated.
     """
-    if not os.path.exists(CACHE_RESALE_DATA_FILE):
+    if not os.path.exists(csv_path):
         return 0
 
     print(f"Migrating CSV data to SQLite database...")
+    start = time.perf_counter()
+    total_records = 0
 
-    # Create the database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    columns = ['month', 'town', 'flat_type', 'block', 'street_name']
+    chunks = pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunk_size, encoding='utf-8')
 
-    cursor.execute("DROP TABLE IF EXISTS resale_transactions")
+    with database.connect(db_path) as conn, database.bulk_load(conn):
+        cursor = conn.cursor()
 
-    print("table dropped")
+        cursor.execute("DROP VIEW IF EXISTS resale_transactions")
+        cursor.execute("DROP TABLE IF EXISTS resale_transactions")
+        cursor.execute("DROP TABLE IF EXISTS resale_sales")
+        for table in RESALE_LOOKUPS:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
 
-    # Create the table (with more fields)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS resale_transactions (
-        _id TEXT PRIMARY KEY,
-        month TEXT,
-        town TEXT,
-        flat_type TEXT,
-        block TEXT,
-        street_name TEXT,
-        resale_price REAL
-    )
-    ''')
+        # Create the tables, indices come after the load
+        for schema in RESALE_SCHEMA:
+            cursor.execute(schema)
 
-    # Create indices for common query fields
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_town ON resale_transactions (town)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_month ON resale_transactions (month)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_flat_type ON resale_transactions (flat_type)')
+        # sale_id of each sale key inserted so far, a later duplicate replaces the earlier row
+        sale_ids = {}
+        for chunk in chunks:
+            for column in columns + ['resale_price']:
+                if column not in chunk:
+                    chunk[column] = ''
 
-    total_records = 0
+            parsed_price = pd.to_numeric(chunk['resale_price'], errors='coerce')
+            chunk['resale_price'] = parsed_price.fillna(0).astype(float)
 
-    with open(CACHE_RESALE_DATA_FILE, 'r', encoding='utf-8') as f:
-        csv_reader = csv.DictReader(f)
-        
-        batch_size = 5000
-        batch = []
-
-        for row in csv_reader:
-            try:
-                resale_price = float(row.get('resale_price', 0)) if row.get('resale_price') else 0
-            except (ValueError, TypeError):
-                resale_price = 0
-
-            # Generate a unique _id (can also use UUID)
-            unique_id = f"{row.get('month', '')}-{row.get('town', '')}-{row.get('block', '')}-{row.get('street_name', '')}-{resale_price}"
-            unique_id = unique_id.replace(" ", "_")  # Ensure no spaces or special characters
-
-            batch.append((
-                unique_id,
-                row.get('month', ''),
-                row.get('town', ''),
-                row.get('flat_type', ''),
-                row.get('block', ''),
-                row.get('street_name', ''),
-                resale_price,
-            ))
-
-            total_records += 1
-
-            if len(batch) >= batch_size:
-                cursor.executemany('''
-                INSERT OR REPLACE INTO resale_transactions 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', batch)
-                conn.commit()
-                batch = []
-                print(f"Migrated {total_records} records so far...")
+            # Rows with the same month, address and price are one sale, missing or invalid prices count as 0
+            chunk['key'] = (
+                chunk['month'] + '-' + chunk['town'] + '-' + chunk['block'] + '-' + chunk['street_name'] + '-'
+                + chunk['resale_price'].map(str).where(parsed_price.notna(), '0')
+            ).str.replace(' ', '_', regex=False)
+
+            # Row number in the file, which is the dataset's _id for a data.gov.sg export
+            chunk['sale_id'] = np.arange(total_records + 1, total_records + len(chunk) + 1)
+            total_records += len(chunk)
+
+            # 'YYYY-MM' -> yyyymm
+            parts = chunk['month'].str.extract(r'^(\d{4})-(\d{1,2})')
+            month_id = pd.to_numeric(parts[0]) * 100 + pd.to_numeric(parts[1])
+            chunk['month_id'] = month_id.astype('Int64').astype(object).where(month_id.notna(), None)
 
-        # Insert any remaining records
-        if batch:
+            # Same result as INSERT OR REPLACE row by row (last duplicate wins), rows stay in
+            # sale_id order so inserts append to the primary key b-tree
+            chunk = chunk.drop_duplicates('key', keep='last')
+            replaced = [(sale_ids[key],) for key in chunk['key'] if key in sale_ids]
+            cursor.executemany("DELETE FROM resale_sales WHERE sale_id = ?", replaced)
+            sale_ids.update(zip(chunk['key'], chunk['sale_id'].tolist()))
+
+            ids = {
+                table: chunk[column].map(_lookup_ids(cursor, table, chunk[column])).tolist()
+                for table, (_, column) in RESALE_LOOKUPS.items()
+            }
             cursor.executemany('''
-            INSERT OR REPLACE INTO resale_transactions 
+            INSERT INTO resale_sales (sale_id, month, town_id, flat_type_id, block, street_id, resale_price)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', batch)
-            conn.commit()
+            ''', zip(chunk['sale_id'].tolist(), chunk['month_id'].tolist(), ids['towns'], ids['flat_types'],
+                     chunk['block'].tolist(), ids['streets'], chunk['resale_price'].tolist()))
+
+            print(f"Loaded {total_records} records so far...")
+
+        # Create indices for common query fields
+        for index in RESALE_INDEXES:
+            cursor.execute(index)
+        cursor.execute(RESALE_TRANSACTIONS_VIEW)
 
-    print(f"Successfully migrated {total_records} records from CSV to database")
-    conn.close()
+        # Tables were dropped above, rebuild every group
+        refresh_resale_monthly(conn)
+
+        # The next sync continues after the loaded rows, prices still have to be computed for every town
+        _ensure_sync_state_table(cursor)
+        cursor.execute("SELECT MAX(month) FROM resale_sales")
+        last_month = cursor.fetchone()[0]
+        cursor.execute("SELECT name FROM towns")
+        _save_sync_state(cursor, total_records, total_records or None, month_to_str(last_month) or None,
+                         {row[0] for row in cursor.fetchall()})
+
+    _schema_checked.add(db_path)
+    resale_snapshot.export_snapshot(db_path=db_path)
+
+    elapsed = time.perf_counter() - start
+    print(f"Successfully migrated {total_records} records from CSV to database in {elapsed:.1f}s "
+          f"({total_records / max(elapsed, 1e-9):,.0f} rows/s)")
     return total_records
 
+def _monthly_rollup(transactions) -> list:
+    """
+    Aggregate transactions into resale_monthly rows.
+
+    Args:
+        transactions: DataFrame with columns town, flat_type, month, resale_price
+    Return: List of (town, flat_type, month, num_transactions, mean_price, median_price, min_price, max_price)
+    """
+    if transactions.empty:
+        return []
+
+    stats = (
+        transactions.groupby(['town', 'flat_type', 'month'], sort=True)['resale_price']
+        .agg(['count', 'mean', 'median', 'min', 'max'])
+        .reset_index()
+    )
+    return list(zip(*(stats[column].tolist() for column in stats.columns)))
+
+def refresh_resale_monthly(conn, groups=None, transactions=None):
+    """
+    Recompute resale_monthly rows from resale_sales, inside the caller's transaction.
+
+    Args:
+        conn: Open connection to the database holding resale_sales
+        groups: Iterable of (town, flat_type, month) to recompute, None rebuilds the whole table
+        transactions: For a full rebuild, DataFrame of the table's current rows if the caller
+            already has it, saves reading the table back
+    Returns:
+        int: Number of rollup rows written
+    """
+    cursor = conn.cursor()
+    cursor.execute(RESALE_MONTHLY_SCHEMA)
+
+    if groups is None:
+        cursor.execute("DELETE FROM resale_monthly")
+        if transactions is None:
+            transactions = pd.read_sql_query("SELECT town, flat_type, month, resale_price FROM resale_transactions", conn)
+    else:
+        groups = list(groups)
+        if not groups:
+            return 0
+
+        # Stage the keys in a temp table instead of a huge OR chain
+        cursor.execute("DROP TABLE IF EXISTS temp.resale_monthly_refresh")
+        cursor.execute("CREATE TEMP TABLE resale_monthly_refresh (town TEXT, flat_type TEXT, month TEXT, month_id INTEGER)")
+        cursor.executemany("INSERT INTO resale_monthly_refresh VALUES (?, ?, ?, ?)",
+                           [(town, flat_type, month, month_to_int(month)) for town, flat_type, month in groups])
+        cursor.execute('''
+        DELETE FROM resale_monthly
+        WHERE (town, flat_type, month) IN (SELECT town, flat_type, month FROM resale_monthly_refresh)
+        ''')
+        transactions = pd.read_sql_query('''
+        SELECT g.town, g.flat_type, g.month, s.resale_price
+        FROM resale_monthly_refresh g
+        JOIN towns t ON t.name = g.town
+        JOIN flat_types f ON f.name = g.flat_type
+        JOIN resale_sales s ON s.town_id = t.town_id AND s.flat_type_id = f.flat_type_id AND s.month IS g.month_id
+        ''', conn)
+
+    rollup = _monthly_rollup(transactions)
+
+    cursor.executemany('''
+    INSERT INTO resale_monthly (town, flat_type, month, num_transactions, mean_price, median_price, min_price, max_price)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rollup)
+
+    database.bump_data_version('resale', conn=conn)
+    return len(rollup)
+
+def ensure_rollup_exists(db_path=DB_PATH):
+    """
+    Build resale_monthly from resale_transactions if an older database doesn't have it yet.
+    Returns True if the rollup is available.
+    """
+    if not ensure_db_exists():
+        return False
+
+    try:
+        database.fetch_one("SELECT 1 FROM resale_monthly LIMIT 1", db_path=db_path)
+        return True
+    except sqlite3.OperationalError:
+        pass
+
+    try:
+        with database.connect(db_path) as conn:
+            print(f"Building resale_monthly rollup: {refresh_resale_monthly(conn)} rows")
+            conn.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"Error occurred: {e}")
+        return False
+
+def get_monthly_summary_by_location(location_name: str, flat_type: str = None):
+    """
+    Monthly resale statistics for a location, read from the rollup only.
+
+    Args:
+        location_name (str): The town/location to get statistics for
+        flat_type (str): Optional flat type to filter by, all flat types if None
+
+    Returns:
+        list: Dicts with month, flat_type, num_transactions, mean_price, median_price, min_price and max_price,
+              newest month first
+    """
+    if not ensure_rollup_exists():
+        return []
+
+    query = '''
+    SELECT month, flat_type, num_transactions, mean_price, median_price, min_price, max_price
+    FROM resale_monthly
+    WHERE town = ?
+    '''
+    params = (location_name,)
+    if flat_type is not None:
+        query += " AND flat_type = ?"
+        params += (flat_type,)
+    query += " ORDER BY month DESC, flat_type"
+
+    return database.fetch_all(query, params)
+
+# Percentiles drawn by the fan chart
+PRICE_BAND_QUANTILES = (10, 25, 50, 75, 90)
+
+# db_path -> (resale data version, {town: {flat_type: series}})
+_price_bands_cache = {}
+_price_bands_lock = threading.Lock()
+
+def compute_price_bands(db_path=DB_PATH):
+    """
+    Price percentiles per town, flat type and month in one vectorised pass over the columnar
+    resale snapshot. Percentiles use linear interpolation, same as numpy.percentile.
+
+    Returns:
+        dict: {town: {flat_type: {'months': [...], 'count': [...], 'p10': [...], ..., 'p90': [...]}}},
+              months ascending, prices rounded to the dollar
+    """
+    snapshot = resale_snapshot.load_snapshot(db_path=db_path)
+    if snapshot is None or not len(snapshot):
+        return {}
+
+    town_ids = snapshot.codes['town'].astype(np.int64)
+    flat_type_ids = snapshot.codes['flat_type'].astype(np.int64)
+    month_ids = snapshot.codes['month'].astype(np.int64)
+    town_names = snapshot.dictionaries['town']
+    flat_type_names = snapshot.dictionaries['flat_type']
+    month_names = snapshot.dictionaries['month']
+
+    # Integer code per (town, flat_type, month) group, ordered like the tuples themselves.
+    # Snapshot rows are sorted by group then price, so each group is a contiguous sorted run
+    codes = (town_ids * len(flat_type_names) + flat_type_ids) * len(month_names) + month_ids
+    starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    counts = np.diff(np.append(starts, len(codes)))
+    group_codes = codes[starts]
+    sorted_prices = snapshot.prices
+
+    bands = {}
+    for q in PRICE_BAND_QUANTILES:
+        position = starts + (counts - 1) * (q / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, starts + counts - 1)
+        bands[q] = np.rint(sorted_prices[lower] + (sorted_prices[upper] - sorted_prices[lower]) * (position - lower))
+
+    # Codes are sorted, so months come out ascending within each town and flat type
+    group_towns = town_names[group_codes // (len(flat_type_names) * len(month_names))].tolist()
+    group_flat_types = flat_type_names[group_codes // len(month_names) % len(flat_type_names)].tolist()
+    group_months = month_names[group_codes % len(month_names)].tolist()
+
+    result = {}
+    for i, (town, flat_type, month) in enumerate(zip(group_towns, group_flat_types, group_months)):
+        series = result.setdefault(town, {}).setdefault(flat_type, {
+            'months': [], 'count': [], **{f"p{q}": [] for q in PRICE_BAND_QUANTILES}
+        })
+        series['months'].append(month)
+        series['count'].append(int(counts[i]))
+        for q in PRICE_BAND_QUANTILES:
+            series[f"p{q}"].append(int(bands[q][i]))
+
+    return result
+
+def get_price_bands_by_location(location_name: str, flat_type: str = None, db_path=DB_PATH):
+    """
+    Fan-chart series for a location, computed once per resale data version for all towns.
+
+    Args:
+        location_name (str): The town/location
+        flat_type (str): Optional flat type, all flat types if None
+
+    Returns:
+        dict: {flat_type: series} as in compute_price_bands, empty if there are no transactions
+    """
+    if not ensure_db_exists():
+        return {}
+
+    version = database.get_data_version('resale', db_path=db_path)
+
+    cached = _price_bands_cache.get(db_path)
+    if not cached or cached[0] != version:
+        with _price_bands_lock:
+            cached = _price_bands_cache.get(db_path)
+            if not cached or cached[0] != version:
+                cached = (version, compute_price_bands(db_path=db_path))
+                _price_bands_cache[db_path] = cached
+
+    town_bands = cached[1].get(location_name, {})
+    if flat_type is not None:
+        return {flat_type: town_bands[flat_type]} if flat_type in town_bands else {}
+    return town_bands
 
 def ensure_db_exists():
     """
@@ -175,6 +694,8 @@ def ensure_db_exists():
     Returns True if database exists or was successfully created.
     """
     if os.path.exists(DB_PATH):
+        # Converts a database created before the normalised schema, once per process
+        ensure_resale_schema(DB_PATH)
         return True
     
     if os.path.exists(CACHE_RESALE_DATA_FILE):
@@ -197,35 +718,109 @@ def get_all_transactions_by_location(location_name: str):
         return []
     
     # Query the database
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with database.connect(DB_PATH) as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+    
+        cursor.execute('''
+        SELECT s.month, s.resale_price, f.name AS flat_type
+        FROM resale_sales s
+        JOIN flat_types f ON f.flat_type_id = s.flat_type_id
+        WHERE s.town_id = (SELECT town_id FROM towns WHERE name = ?)
+        ORDER BY s.month DESC
+        ''', (location_name,))
+    
+        # Convert to list of dictionaries
+        simplified_transactions = [
+            {
+                'month': month_to_str(row['month']), 
+                'resale_price': row['resale_price'],
+                'flat_type': row['flat_type']
+            } 
+            for row in cursor.fetchall()
+        ]
     
-    cursor.execute('''
-    SELECT month, resale_price, flat_type
-    FROM resale_transactions 
-    WHERE town = ? 
-    ORDER BY month DESC
-    ''', (location_name,))
-    
-    # Convert to list of dictionaries
-    simplified_transactions = [
-        {
-            'month': row['month'], 
-            'resale_price': row['resale_price'],
-            'flat_type': row['flat_type']
-        } 
-        for row in cursor.fetchall()
-    ]
-    
-    conn.close()
     return simplified_transactions
 
+# Rows per query when streaming transactions
+TRANSACTIONS_BATCH_SIZE = 1000
+
+def get_transactions_page(location_name: str, flat_type: str = None, start_month: str = None, end_month: str = None,
+                          after=None, limit: int = 100, db_path=DB_PATH) -> list:
+    """
+    One page of a location's resale transactions, newest first.
+
+    Rows are ordered by (month, _id) descending and the page starts strictly after the
+    given key, so the query is a range scan on idx_resale_sales_town_month however deep the page is.
+
+    Args:
+        location_name (str): The town/location
+        flat_type (str): Optional flat type filter
+        start_month (str): Optional first month (YYYY-MM), inclusive
+        end_month (str): Optional last month (YYYY-MM), inclusive
+        after (tuple): (month, _id) of the last row of the previous page, None for the first page
+        limit (int): Maximum number of rows
+
+    Returns:
+        list: Transaction dicts with _id, month, flat_type, block, street_name and resale_price
+    """
+    if not ensure_db_exists():
+        return []
+    ensure_resale_schema(db_path)
+
+    conditions = ["s.town_id = (SELECT town_id FROM towns WHERE name = ?)"]
+    params = [location_name]
+    if flat_type is not None:
+        conditions.append("s.flat_type_id = (SELECT flat_type_id FROM flat_types WHERE name = ?)")
+        params.append(flat_type)
+    if start_month is not None:
+        conditions.append("s.month >= ?")
+        params.append(month_to_int(start_month))
+    if end_month is not None:
+        conditions.append("s.month <= ?")
+        params.append(month_to_int(end_month))
+    if after is not None:
+        conditions.append("(s.month, s.sale_id) < (?, ?)")
+        params.extend((month_to_int(after[0]), after[1]))
+
+    with database.connect(db_path) as conn:
+        cursor = conn.execute(f'''
+        SELECT s.sale_id AS _id, s.month, f.name AS flat_type, s.block, st.name AS street_name, s.resale_price
+        FROM resale_sales s
+        JOIN flat_types f ON f.flat_type_id = s.flat_type_id
+        JOIN streets st ON st.street_id = s.street_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY s.month DESC, s.sale_id DESC
+        LIMIT ?
+        ''', (*params, limit))
+        return [dict(row, month=month_to_str(row['month'])) for row in cursor.fetchall()]
+
+def iter_transaction_pages(location_name: str, flat_type: str = None, start_month: str = None, end_month: str = None,
+                           after=None, page_size: int = TRANSACTIONS_BATCH_SIZE, db_path=DB_PATH):
+    """
+    Walk every matching transaction page by page, see get_transactions_page.
+
+    Each page is its own short query, so memory stays at one page and a slow consumer
+    never holds a pooled connection open.
+
+    Yields:
+        list: Transaction dicts, newest first across pages
+    """
+    while True:
+        rows = get_transactions_page(location_name, flat_type=flat_type, start_month=start_month, end_month=end_month,
+                                     after=after, limit=page_size, db_path=db_path)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]['month'], rows[-1]['_id'])
+
 def fetch_all_resale_transactions():
     """
     For compatibility with existing code. Returns all transactions.
     WARNING: This will be very memory-intensive for large datasets.
-    Consider using get_all_transactions_by_location() instead.
+    Consider using get_all_transactions_by_location() instead, or
+    resale_snapshot.load_snapshot() for analysis over every row.
     """
     # Ensure the database exists
     if not ensure_db_exists():
@@ -234,19 +829,18 @@ def fetch_all_resale_transactions():
     print("Warning: Fetching all transactions - this may be memory intensive")
     
     # Query all transactions
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with database.connect(DB_PATH) as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM resale_transactions')
-    transactions = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('SELECT * FROM resale_transactions')
+        transactions = [dict(row) for row in cursor.fetchall()]
     
-    conn.close()
     return transactions
 
 def calculate_average_resale_price_by_location(location: str):
     """
-    Calculate average resale price for a specific location/district using efficient SQL query.
+    Calculate average resale price for a specific location/district from the monthly rollup.
     
     Args:
         location (str): The district/location to calculate average price for
@@ -258,17 +852,19 @@ def calculate_average_resale_price_by_location(location: str):
     if not ensure_db_exists():
         return None
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    if not ensure_rollup_exists():
+        return None
+
+    with database.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-    SELECT AVG(resale_price) as avg_price
-    FROM resale_transactions
-    WHERE town = ?
-    ''', (location,))
+        cursor.execute('''
+        SELECT SUM(mean_price * num_transactions) / SUM(num_transactions) as avg_price
+        FROM resale_monthly
+        WHERE town = ?
+        ''', (location,))
     
-    result = cursor.fetchone()
-    conn.close()
+        result = cursor.fetchone()
     
     if result and result[0]:
         return round(float(result[0]), 2)
@@ -290,32 +886,109 @@ def get_latest_resale_price_by_location(location: str, flat_type: str = '3 ROOM'
     if not ensure_db_exists():
         return None
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with database.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-    SELECT resale_price
-    FROM resale_transactions
-    WHERE town = ? AND flat_type = ?
-    ORDER BY month DESC
-    LIMIT 1
-    ''', (location, flat_type))
+        cursor.execute('''
+        SELECT resale_price
+        FROM resale_transactions
+        WHERE town = ? AND flat_type = ?
+        ORDER BY month DESC
+        LIMIT 1
+        ''', (location, flat_type))
     
-    result = cursor.fetchone()
-    conn.close()
+        result = cursor.fetchone()
     
     if result:
         return float(result[0])
     return None
 
-def save_resale_price_to_db(db_path=DB_PATH, flat_type='3 ROOM'):
+# Flat type behind locations.price, other flat types are in location_prices
+DEFAULT_FLAT_TYPE = '3 ROOM'
+
+# Price summary per location and flat type, see save_resale_price_to_db
+LOCATION_PRICES_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS location_prices (
+    location_name TEXT NOT NULL,
+    flat_type TEXT NOT NULL,
+    price REAL,
+    latest_price REAL,
+    price_volume INTEGER,
+    PRIMARY KEY (location_name, flat_type)
+)
+'''
+
+# Months of transactions behind locations.price, counting the latest month
+PRICE_WINDOW_MONTHS = 12
+
+# Columns added to locations after the table was first created
+LOCATION_PRICE_COLUMNS = {
+    'latest_price': 'REAL',
+    'price_volume': 'INTEGER',
+}
+
+def _ensure_location_price_columns(cursor):
+    """Add the price summary columns to a locations table created before they existed."""
+    cursor.execute("PRAGMA table_info(locations)")
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, column_type in LOCATION_PRICE_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE locations ADD COLUMN {column} {column_type}")
+
+def compute_location_prices(cursor) -> dict:
     """
-    Save the latest resale price for a specified flat type for each location
-    in the resale_price column in locations table in app.db.
+    Price summary of every town and flat type in one pass over resale_sales.
+
+    Args:
+        cursor: Cursor on the database holding resale_sales
+
+    Returns:
+        dict: {(town, flat_type): (median_price, latest_price, volume)} where median_price and volume
+              cover the PRICE_WINDOW_MONTHS months up to the latest month of that town and flat type,
+              latest_price is the median of the latest month alone
+    """
+    cursor.execute(f'''
+    WITH latest AS (
+        SELECT town_id, flat_type_id, MAX(month) AS latest_month,
+               (MAX(month) / 100) * 12 + MAX(month) % 100 - 1 - {PRICE_WINDOW_MONTHS - 1} AS start_index
+        FROM resale_sales
+        GROUP BY town_id, flat_type_id
+    ),
+    trailing AS (
+        SELECT s.town_id, s.flat_type_id, s.month, s.resale_price, l.latest_month,
+               ROW_NUMBER() OVER (PARTITION BY s.town_id, s.flat_type_id ORDER BY s.resale_price) AS position,
+               COUNT(*) OVER (PARTITION BY s.town_id, s.flat_type_id) AS volume,
+               ROW_NUMBER() OVER (PARTITION BY s.town_id, s.flat_type_id, s.month ORDER BY s.resale_price) AS month_position,
+               COUNT(*) OVER (PARTITION BY s.town_id, s.flat_type_id, s.month) AS month_volume
+        FROM latest l
+        JOIN resale_sales s ON s.town_id = l.town_id AND s.flat_type_id = l.flat_type_id
+        -- yyyymm of the window's first month, counted back from the latest month
+        WHERE s.month BETWEEN (l.start_index / 12) * 100 + l.start_index % 12 + 1 AND l.latest_month
+    )
+    SELECT t.name, f.name,
+           AVG(CASE WHEN position IN ((volume + 1) / 2, (volume + 2) / 2) THEN resale_price END),
+           AVG(CASE WHEN month = latest_month AND month_position IN ((month_volume + 1) / 2, (month_volume + 2) / 2)
+                    THEN resale_price END),
+           MAX(volume)
+    FROM trailing
+    JOIN towns t ON t.town_id = trailing.town_id
+    JOIN flat_types f ON f.flat_type_id = trailing.flat_type_id
+    GROUP BY trailing.town_id, trailing.flat_type_id
+    ''')
+
+    return {(row[0], row[1]): (row[2], row[3], row[4]) for row in cursor.fetchall()}
+
+def save_resale_price_to_db(db_path=DB_PATH, flat_type=DEFAULT_FLAT_TYPE, location_names=None):
+    """
+    Save the resale price summary of every flat type for each location to the location_prices
+    table, and the one for flat_type to the locations table in app.db: price is the trailing
+    PRICE_WINDOW_MONTHS month median, latest_price the latest month's median and price_volume
+    the number of transactions behind price.
     
     Args:
         db_path (str): Path to the SQLite database file
-        flat_type (str): The flat type to save prices for (default: '3 ROOM')
+        flat_type (str): The flat type saved to the locations table (default: '3 ROOM')
+        location_names (set): Only update these locations, all locations if None
     
     Returns:
         bool: True if successful, False otherwise
@@ -325,42 +998,52 @@ def save_resale_price_to_db(db_path=DB_PATH, flat_type='3 ROOM'):
         return False
     
     try:
-        # Open connections to both databases
-        app_conn = sqlite3.connect(db_path)
-        app_conn.row_factory = sqlite3.Row
-        app_cursor = app_conn.cursor()
-        
-        # Get all location names from the locations table
-        app_cursor.execute("SELECT location_name FROM locations")
-        locations = app_cursor.fetchall()
-        
-        # Execute transactions in a batch
-        updates = []
-        for location in locations:
-            location_name = location['location_name']
-            
-            # Get latest resale price directly from cache DB
-            app_cursor.execute('''
-            SELECT resale_price
-            FROM resale_transactions
-            WHERE town = ? AND flat_type = ?
-            ORDER BY month DESC
-            LIMIT 1
-            ''', (location_name, flat_type))
-            
-            result = app_cursor.fetchone()
-            if result:
-                latest_price = float(result['resale_price'])
-                updates.append((latest_price, location_name))
-            if not result:
-                updates.append((0, location_name))
-        
-        # Perform batch update
-        app_cursor.executemany("UPDATE locations SET price = ? WHERE location_name = ?", updates)
-        app_conn.commit()
-        
-        # Close connections
-        app_conn.close()
+        with database.connect(db_path) as app_conn:
+            app_cursor = app_conn.cursor()
+            _ensure_location_price_columns(app_cursor)
+            app_cursor.execute(LOCATION_PRICES_SCHEMA)
+
+            # Get all location names and their current price from the locations table
+            app_cursor.execute("SELECT location_name, price FROM locations")
+            previous_prices = {row[0]: row[1] for row in app_cursor.fetchall()}
+            locations = list(previous_prices)
+            if location_names is not None:
+                locations = [location_name for location_name in locations if location_name in location_names]
+
+            prices = compute_location_prices(app_cursor)
+
+            # Locations without transactions get 0 like before
+            updates = [(*prices.get((location_name, flat_type), (0, 0, 0)), location_name) for location_name in locations]
+
+            # Notify about locations whose price moved, not about the first price saved
+            price_changes = [
+                {
+                    'location_name': location_name,
+                    'notification_type': 'price',
+                    'message': f"{flat_type} resale price in {location_name} changed from "
+                               f"${previous_prices[location_name]:,.0f} to ${price:,.0f}",
+                }
+                for price, _, _, location_name in updates
+                if previous_prices[location_name] and price and price != previous_prices[location_name]
+            ]
+
+            # Perform batch update
+            app_cursor.executemany(
+                "UPDATE locations SET price = ?, latest_price = ?, price_volume = ? WHERE location_name = ?", updates
+            )
+
+            in_scope = set(locations)
+            app_cursor.executemany("DELETE FROM location_prices WHERE location_name = ?", [(name,) for name in locations])
+            app_cursor.executemany(
+                "INSERT INTO location_prices (location_name, flat_type, price, latest_price, price_volume) VALUES (?, ?, ?, ?, ?)",
+                [(town, town_flat_type, *summary) for (town, town_flat_type), summary in prices.items() if town in in_scope]
+            )
+
+            Notifications.NotificationsController.create_notification_logs_bulk(price_changes, conn=app_conn)
+
+            # Invalidate in-memory caches built from the locations table
+            database.bump_data_version('locations', conn=app_conn)
+            app_conn.commit()
         
         print(f"Updated prices for {len(updates)} locations")
         return True
@@ -369,6 +1052,21 @@ def save_resale_price_to_db(db_path=DB_PATH, flat_type='3 ROOM'):
         print(f"Error occurred: {e}")
         return False
 
+def get_location_flat_type_prices(db_path=DB_PATH) -> dict:
+    """
+    Returns:
+        dict: {location_name: {flat_type: price}} from the location_prices table, empty if it doesn't exist yet
+    """
+    try:
+        rows = database.fetch_all("SELECT location_name, flat_type, price FROM location_prices", db_path=db_path)
+    except sqlite3.OperationalError:
+        return {}
+
+    prices = {}
+    for row in rows:
+        prices.setdefault(row['location_name'], {})[row['flat_type']] = row['price']
+    return prices
+
 def get_unique_districts():
     """
     Retrieve a list of unique planning areas in the resale transactions dataset.
@@ -380,13 +1078,15 @@ def get_unique_districts():
     if not ensure_db_exists():
         return []
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with database.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('SELECT DISTINCT town FROM resale_transactions')
-    districts = [row[0] for row in cursor.fetchall()]
+        cursor.execute('''
+        SELECT name FROM towns t
+        WHERE EXISTS (SELECT 1 FROM resale_sales s WHERE s.town_id = t.town_id)
+        ''')
+        districts = [row[0] for row in cursor.fetchall()]
     
-    conn.close()
     return districts
 
 def filter_transactions_by_year(year: int):
@@ -403,20 +1103,18 @@ def filter_transactions_by_year(year: int):
     if not ensure_db_exists():
         return []
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with database.connect(DB_PATH) as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
     
-    year_pattern = f"{year}-%"
-    cursor.execute('SELECT * FROM resale_transactions WHERE month LIKE ?', (year_pattern,))
-    transactions = [dict(row) for row in cursor.fetchall()]
+        cursor.execute(RESALE_TRANSACTIONS_SELECT + "WHERE s.month BETWEEN ? AND ?", (year * 100 + 1, year * 100 + 12))
+        transactions = [dict(row) for row in cursor.fetchall()]
     
-    conn.close()
     return transactions
 
 def generate_resale_price_summary(location: str):
     """
-    Generate a summary of resale prices for a specific location using SQL aggregation.
+    Generate a summary of resale prices for a specific location from the monthly rollup.
     
     Args:
         location (str): The town/location to generate summary for
@@ -428,21 +1126,23 @@ def generate_resale_price_summary(location: str):
     if not ensure_db_exists():
         return None
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    if not ensure_rollup_exists():
+        return None
+
+    with database.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-    SELECT 
-        COUNT(*) as total_transactions,
-        AVG(resale_price) as average_price,
-        MIN(resale_price) as min_price,
-        MAX(resale_price) as max_price
-    FROM resale_transactions
-    WHERE town = ?
-    ''', (location,))
+        cursor.execute('''
+        SELECT 
+            COALESCE(SUM(num_transactions), 0) as total_transactions,
+            SUM(mean_price * num_transactions) / SUM(num_transactions) as average_price,
+            MIN(min_price) as min_price,
+            MAX(max_price) as max_price
+        FROM resale_monthly
+        WHERE town = ?
+        ''', (location,))
     
-    result = cursor.fetchone()
-    conn.close()
+        result = cursor.fetchone()
     
     if result and result[0] > 0:
         return {
@@ -471,54 +1171,49 @@ def save_transactions_to_db(db_path=DB_PATH):
     
     try:
         # Open connections to both databases
-        app_conn = sqlite3.connect(db_path)
-        app_conn.row_factory = sqlite3.Row
-        app_cursor = app_conn.cursor()
+        with database.connect(db_path) as app_conn, database.connect(DB_PATH) as cache_conn:
+            app_conn.row_factory = sqlite3.Row
+            app_cursor = app_conn.cursor()
         
-        cache_conn = sqlite3.connect(DB_PATH)
-        cache_conn.row_factory = sqlite3.Row
-        cache_cursor = cache_conn.cursor()
+            cache_conn.row_factory = sqlite3.Row
+            cache_cursor = cache_conn.cursor()
         
-        # Get all location names from the locations table
-        app_cursor.execute("SELECT location_name FROM locations")
-        locations = app_cursor.fetchall()
+            # Get all location names from the locations table
+            app_cursor.execute("SELECT location_name FROM locations")
+            locations = app_cursor.fetchall()
         
-        batch_updates = []
-        for location in locations:
-            location_name = location['location_name']
+            batch_updates = []
+            for location in locations:
+                location_name = location['location_name']
             
-            # Get transactions for this location directly from cache DB
-            cache_cursor.execute('''
-            SELECT month, resale_price, flat_type
-            FROM resale_transactions
-            WHERE town = ?
-            ORDER BY month DESC
-            ''', (location_name,))
+                # Get transactions for this location directly from cache DB
+                cache_cursor.execute('''
+                SELECT month, resale_price, flat_type
+                FROM resale_transactions
+                WHERE town = ?
+                ORDER BY month DESC
+                ''', (location_name,))
             
-            transactions = [
-                {'month': row['month'], 'resale_price': row['resale_price'], 'flat_type': row['flat_type']}
-                for row in cache_cursor.fetchall()
-            ]
+                transactions = [
+                    {'month': row['month'], 'resale_price': row['resale_price'], 'flat_type': row['flat_type']}
+                    for row in cache_cursor.fetchall()
+                ]
             
-            if not transactions:
-                print(f"No transactions found for {location_name}")
-                continue
+                if not transactions:
+                    print(f"No transactions found for {location_name}")
+                    continue
             
-            # Convert transactions to JSON string
-            transactions_json = json.dumps(transactions)
-            batch_updates.append((transactions_json, location_name))
-            print(f"Preparing {location_name} with {len(transactions)} transactions")
-        
-        # Perform batch update
-        app_cursor.executemany(
-            "UPDATE location_details SET retail_prices = ? WHERE location_name = ?", 
-            batch_updates
-        )
-        app_conn.commit()
+                # Convert transactions to JSON string
+                transactions_json = json.dumps(transactions)
+                batch_updates.append((transactions_json, location_name))
+                print(f"Preparing {location_name} with {len(transactions)} transactions")
         
-        # Close connections
-        app_conn.close()
-        cache_conn.close()
+            # Perform batch update
+            app_cursor.executemany(
+                "UPDATE location_details SET retail_prices = ? WHERE location_name = ?", 
+                batch_updates
+            )
+            app_conn.commit()
         
         print(f"Updated transaction data for {len(batch_updates)} locations")
         return True
@@ -533,15 +1228,14 @@ def test_load_resale_data():
     print("\n=== Testing Resale Data Loading ===")
     
     # Get total count directly from database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM resale_transactions")
-    count = cursor.fetchone()[0]
+    with database.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM resale_transactions")
+        count = cursor.fetchone()[0]
     
-    # Get a sample record
-    cursor.execute("SELECT * FROM resale_transactions LIMIT 1")
-    sample = cursor.fetchone()
-    conn.close()
+        # Get a sample record
+        cursor.execute("SELECT * FROM resale_transactions LIMIT 1")
+        sample = cursor.fetchone()
     
     print(f"Total transactions in database: {count}")
     print(f"Sample data (1 record):")
@@ -600,7 +1294,7 @@ def test_database_update():
     print("\n=== Testing Database Price Update ===")
     
     # First, get a few locations from the database to check before values
-    with sqlite3.connect(DB_PATH) as conn:
+    with database.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT location_name, price FROM locations LIMIT 5")
         before_rows = cursor.fetchall()
@@ -615,7 +1309,7 @@ def test_database_update():
     print(f"\nDatabase update {'successful' if success else 'failed'}")
     
     # Check the same locations after update
-    with sqlite3.connect(DB_PATH) as conn:
+    with database.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         location_names = [row['location_name'] for row in before_rows]
         placeholders = ', '.join(['?'] * len(location_names))
@@ -4,6 +4,9 @@ import os
 import csv
 import pathlib
 from .fetch_districts import get_access_token, DB_PATH
+from . import fetcher, poi_index
+import database
+from controllers import Notifications
 from collections import defaultdict
 
 # Define API URL
@@ -33,13 +36,12 @@ def save_to_csv():
 
     print(f"Full request URL: {full_url}")
 
-    response = requests.get(BASE_URL, headers=headers, params=query_params)
-
-    if response.status_code != 200:
-        print(f"Error fetching data: {response.status_code}")
+    try:
+        # Rate limited and retried on transient errors
+        data = fetcher.fetch_json(BASE_URL, params=query_params, headers=headers)
+    except Exception as e:
+        print(f"Error fetching data: {e}")
         return
-    
-    data = response.json()
 
     # Ensure the response contains the expected key
     if "SrchResults" not in data:
@@ -77,15 +79,16 @@ def save_num_schools_to_db(db_path=DB_PATH):
     """
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             # Set row_factory to get dictionary instead of tuple
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            # Get all location names from the locations table
-            cursor.execute("SELECT location_name FROM locations")
+            # Get all location names and their current count from the locations table
+            cursor.execute("SELECT location_name, num_schools FROM locations")
             locations = cursor.fetchall()
             
+            changes = []
             for location in locations:
                 location_name = location['location_name']
                 
@@ -95,8 +98,20 @@ def save_num_schools_to_db(db_path=DB_PATH):
                 # Update the locations table with the number of schools
                 query = "UPDATE locations SET num_schools = ? WHERE location_name = ?"
                 cursor.execute(query, (num_schools, location_name))
+
+                # Notify about counts that changed, not about the first count saved
+                if location['num_schools'] is not None and location['num_schools'] != num_schools:
+                    changes.append({
+                        'location_name': location_name,
+                        'notification_type': 'schools',
+                        'message': f"Number of schools in {location_name} changed from {location['num_schools']:.0f} to {num_schools}",
+                    })
+
+            Notifications.NotificationsController.create_notification_logs_bulk(changes, conn=conn)
             
             # Commit changes
+            # Invalidate in-memory caches built from the locations table
+            database.bump_data_version('locations', conn=conn)
             conn.commit()
             return True
     
@@ -114,6 +129,16 @@ def load_schools_data():
                 schools_data.append(row)
     return schools_data
 
+def get_schools_index():
+    """
+    Return: In-memory POI index over the schools CSV, reloaded only when the file changes.
+    """
+    return poi_index.get_index(
+        CACHE_LOCATION_COORDINATES_FILE,
+        loader=load_schools_data,
+        area_of=lambda school: school.get("Planning Area") or school.get("PlanningArea"),
+    )
+
 def get_all_schools_by_district(location_name: str):
     """
     Get all schools in a specific planning area/district.
@@ -124,15 +149,7 @@ def get_all_schools_by_district(location_name: str):
     Returns:
         List of schools in the specified district.
     """
-    schools_data = load_schools_data()
-    schools_in_district = []
-    
-    for school in schools_data:
-        if school.get("Planning Area", "").lower() == location_name.lower() or \
-           school.get("PlanningArea", "").lower() == location_name.lower():
-            schools_in_district.append(school)
-    
-    return schools_in_district
+    return get_schools_index().in_area(location_name)
 
 def get_num_schools_by_district(location_name: str):
     """
@@ -144,12 +161,11 @@ def get_num_schools_by_district(location_name: str):
     Returns:
         Number of schools in the specified district
     """
-    schools_in_district = get_all_schools_by_district(location_name)
-    return len(schools_in_district)
+    return get_schools_index().count_in_area(location_name)
 
 def list_all_districts():
     """List all unique planning areas/districts in the data."""
-    schools_data = load_schools_data()
+    schools_data = get_schools_index().records
     districts = set()
     
     for school in schools_data:
@@ -161,7 +177,7 @@ def list_all_districts():
 
 def get_district_statistics():
     """Get statistics about schools per district."""
-    schools_data = load_schools_data()
+    schools_data = get_schools_index().records
     district_counts = defaultdict(int)
     
     for school in schools_data:
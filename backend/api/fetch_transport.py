@@ -8,6 +8,9 @@ import pathlib
 from datetime import datetime
 
 from .fetch_districts import DB_PATH
+from . import poi_index
+import database
+from controllers import Notifications
 
 # Use absolute paths based on the location of the current script
 SCRIPT_DIR = pathlib.Path(__file__).parent.absolute()
@@ -46,9 +49,9 @@ def fetch_mrt_stations(station_name: str) -> dict:
     # Return an empty dict if not found
     return {}
 
-def fetch_all_mrt_stations() -> list:
+def load_mrt_stations_from_cache() -> list:
     """
-    Fetch all MRT stations from the cache.
+    Parse the MRT stations CSV cache.
     
     Return: List of dicts with MRT station information.
     """
@@ -67,6 +70,24 @@ def fetch_all_mrt_stations() -> list:
     
     return stations
 
+def get_mrt_stations_index():
+    """
+    Return: In-memory POI index over the MRT stations CSV, reloaded only when the file changes.
+    """
+    return poi_index.get_index(
+        CACHE_LOCATION_COORDINATES_FILE,
+        loader=load_mrt_stations_from_cache,
+        area_of=lambda station: station['planning_area'],
+    )
+
+def fetch_all_mrt_stations() -> list:
+    """
+    Fetch all MRT stations from the in-memory index.
+    
+    Return: List of dicts with MRT station information.
+    """
+    return get_mrt_stations_index().all()
+
 def get_all_stations_by_location(location_name: str) -> list:
     """
     Return: All MRT stations in a location. List of dicts with station information.
@@ -74,16 +95,7 @@ def get_all_stations_by_location(location_name: str) -> list:
     Args:
         location_name: Name of the location/district to search in.
     """
-    # Get all stations
-    all_stations = fetch_all_mrt_stations()
-    
-    # Filter stations by planning area
-    nearby_stations = []
-    for station in all_stations:
-        if station['planning_area'].lower() == location_name.lower():
-            nearby_stations.append(station)
-    
-    return nearby_stations
+    return get_mrt_stations_index().in_area(location_name)
 
 def get_num_stations_by_district(district_name: str) -> int:
     """
@@ -92,16 +104,7 @@ def get_num_stations_by_district(district_name: str) -> int:
     Args:
         district_name: Name of the district/planning area.
     """
-    # Get all stations
-    all_stations = fetch_all_mrt_stations()
-    
-    # Filter stations by planning area
-    count = 0
-    for station in all_stations:
-        if station['planning_area'].lower() == district_name.lower():
-            count += 1
-    
-    return count
+    return get_mrt_stations_index().count_in_area(district_name)
 
 def save_num_stations_to_db(db_path=DB_PATH):
     """
@@ -109,15 +112,16 @@ def save_num_stations_to_db(db_path=DB_PATH):
     """
     try:
         # Establish a database connection
-        with sqlite3.connect(db_path) as conn:
+        with database.connect(db_path) as conn:
             # Set row_factory to get dictionary instead of tuple
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            # Get all location names from the locations table
-            cursor.execute("SELECT location_name FROM locations")
+            # Get all location names and their current count from the locations table
+            cursor.execute("SELECT location_name, num_transport FROM locations")
             locations = cursor.fetchall()
             
+            changes = []
             for location in locations:
                 location_name = location['location_name']
                 
@@ -127,8 +131,20 @@ def save_num_stations_to_db(db_path=DB_PATH):
                 # Update the locations table with the number of MRT stations
                 query = "UPDATE locations SET num_transport = ? WHERE location_name = ?"
                 cursor.execute(query, (num_stations, location_name))
+
+                # Notify about counts that changed, not about the first count saved
+                if location['num_transport'] is not None and location['num_transport'] != num_stations:
+                    changes.append({
+                        'location_name': location_name,
+                        'notification_type': 'transport',
+                        'message': f"Number of MRT stations in {location_name} changed from {location['num_transport']:.0f} to {num_stations}",
+                    })
+
+            Notifications.NotificationsController.create_notification_logs_bulk(changes, conn=conn)
             
             # Commit changes
+            # Invalidate in-memory caches built from the locations table
+            database.bump_data_version('locations', conn=conn)
             conn.commit()
             return True
     
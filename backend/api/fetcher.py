@@ -0,0 +1,177 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+"""
+Shared HTTP fetching for the api/fetch_* modules.
+
+Pages are requested concurrently on a small thread pool, every request goes through a
+per-host token bucket, and failed requests are retried with exponential backoff.
+Pages are handed back to the caller strictly in offset order, so the caller stays the
+only thread writing to SQLite.
+"""
+
+MAX_WORKERS = 4
+
+# Requests per second and burst size allowed per host
+RATE_LIMIT = 5.0
+BURST = 5
+
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+TIMEOUT_SECONDS = 30
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, acquire() blocks until a request may be sent.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT, capacity: int = BURST):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens stored, i.e. the largest burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+# host -> TokenBucket, shared by every fetch against the same API
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(url: str) -> TokenBucket:
+    """
+    Return: The shared rate limiter for the url's host.
+    """
+    host = urlparse(url).netloc
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = TokenBucket()
+        return _rate_limiters[host]
+
+def fetch_json(url: str, params=None, headers=None, session=None, rate_limiter=None):
+    """
+    GET a JSON document, rate limited and retried on connection errors, 429 and 5xx.
+
+    Args:
+        url: Request URL, may already contain a query string
+        params: Extra query parameters
+        headers: Request headers
+        session: Optional requests.Session to reuse connections
+        rate_limiter: TokenBucket to use, the url host's shared bucket if None
+    Return: Decoded JSON
+    Raises: Exception if the request still fails after MAX_RETRIES retries
+    """
+    rate_limiter = rate_limiter or get_rate_limiter(url)
+    http = session or requests
+
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            response = http.get(url, params=params, headers=headers, timeout=TIMEOUT_SECONDS)
+        except requests.RequestException as e:
+            error = f"Request failed: {e}"
+        else:
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code not in RETRY_STATUS_CODES:
+                raise Exception(f"Failed to fetch data from API. Status code: {response.status_code}")
+            error = f"Status code: {response.status_code}"
+
+            # Honour the server's hint when it gives one
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit() and attempt < MAX_RETRIES:
+                time.sleep(int(retry_after))
+                continue
+
+        if attempt < MAX_RETRIES:
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+
+    raise Exception(f"Failed to fetch data from API after {MAX_RETRIES + 1} attempts. {error}")
+
+def fetch_pages(api_url: str, page_size: int = 1000, start_offset: int = 0, params=None, headers=None,
+                max_workers: int = MAX_WORKERS, rate_limiter=None):
+    """
+    Fetch a CKAN datastore_search style dataset (limit/offset paging, result.total) concurrently.
+
+    The first page is fetched alone to learn the total, the remaining pages are fetched on a
+    thread pool with at most 2 * max_workers pages in flight.
+
+    Args:
+        api_url: datastore_search URL including resource_id
+        page_size: Records per page
+        start_offset: Offset of the first page
+        params: Extra query parameters sent with every page, e.g. sort
+        headers: Request headers
+        max_workers: Concurrent requests
+        rate_limiter: TokenBucket to use, the url host's shared bucket if None
+    Yields: (offset, result) in offset order, result is the response's "result" dict
+    """
+    params = dict(params or {})
+    session = requests.Session()
+
+    def get_page(offset):
+        data = fetch_json(api_url, params={**params, "limit": page_size, "offset": offset}, headers=headers,
+                          session=session, rate_limiter=rate_limiter)
+        return data.get("result", {})
+
+    try:
+        first = get_page(start_offset)
+        yield start_offset, first
+
+        records = first.get("records", [])
+        if len(records) < page_size:
+            return
+
+        total = first.get("total")
+        window = 2 * max_workers
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            next_offset = start_offset + page_size
+            pending = []
+
+            while True:
+                # Keep the window full, without a total keep probing until a short page comes back
+                while len(pending) < window and (total is None or next_offset < total):
+                    pending.append((next_offset, executor.submit(get_page, next_offset)))
+                    next_offset += page_size
+
+                if not pending:
+                    return
+
+                offset, future = pending.pop(0)
+                result = future.result()
+                yield offset, result
+
+                if len(result.get("records", [])) < page_size:
+                    return
+        finally:
+            # Also runs when the consumer stops early: drop the queued pages and don't wait for
+            # the ones in flight, their results are not needed
+            executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        session.close()
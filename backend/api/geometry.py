@@ -0,0 +1,171 @@
+import numpy as np
+
+"""
+Geometry helpers for planning-area boundaries.
+Used offline to build multi-resolution copies of the polygons served by /get_all_coords.
+"""
+
+# (level, minimum map zoom, Douglas-Peucker tolerance in degrees)
+# Tolerance is roughly half a screen pixel at the level's minimum zoom, level 0 is the raw polygon
+LOD_LEVELS = [
+    (0, 15, 0.0),
+    (1, 13, 0.00005),
+    (2, 11, 0.0002),
+    (3, 0, 0.0005),
+]
+
+# Decimal places kept for simplified levels, ~0.1m
+LOD_PRECISION = 6
+
+def outer_ring(coordinates):
+    """
+    Return: First ring of the first polygon of a (Multi)Polygon coordinate array, list of [lon, lat].
+    """
+    while isinstance(coordinates[0][0], list):
+        coordinates = coordinates[0]
+    return coordinates
+
+def ring_bounds(ring: list):
+    """
+    Return: (min_lon, min_lat, max_lon, max_lat) of a ring.
+    """
+    points = np.asarray(ring, dtype=np.float64)
+    min_lon, min_lat = points.min(axis=0)
+    max_lon, max_lat = points.max(axis=0)
+    return float(min_lon), float(min_lat), float(max_lon), float(max_lat)
+
+def ring_centroid(ring: list):
+    """
+    Area-weighted centroid of a polygon ring (shoelace formula).
+
+    Return: (lon, lat), the vertex average if the ring has no area
+    """
+    points = np.asarray(ring, dtype=np.float64)
+    x, y = points[:, 0], points[:, 1]
+    x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+
+    cross = x * y_next - x_next * y
+    area = cross.sum() / 2
+    if abs(area) < 1e-15:
+        return float(x.mean()), float(y.mean())
+
+    return float(((x + x_next) * cross).sum() / (6 * area)), float(((y + y_next) * cross).sum() / (6 * area))
+
+def bounds_intersect(a, b) -> bool:
+    """
+    Return: Whether two (min_lon, min_lat, max_lon, max_lat) boxes overlap.
+    """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def level_for_zoom(zoom: float) -> int:
+    """
+    Return: The LOD level to serve for a map zoom.
+    """
+    for level, min_zoom, _ in LOD_LEVELS:
+        if zoom >= min_zoom:
+            return level
+    return LOD_LEVELS[-1][0]
+
+def level_for_tolerance(tolerance: float) -> int:
+    """
+    Return: The coarsest LOD level whose tolerance does not exceed the requested one.
+    """
+    best_level = 0
+    for level, _, level_tolerance in LOD_LEVELS:
+        if level_tolerance <= tolerance:
+            best_level = level
+    return best_level
+
+def tolerance_for_level(level: int) -> float:
+    for lod_level, _, tolerance in LOD_LEVELS:
+        if lod_level == level:
+            return tolerance
+    raise ValueError(f"Unknown LOD level: {level}")
+
+def segment_distances(points, start, end):
+    """Distance of every point to the segment start-end."""
+    segment = end - start
+    length_sq = segment @ segment
+
+    if length_sq == 0:
+        return np.hypot(*(points - start).T)
+
+    t = np.clip(((points - start) @ segment) / length_sq, 0, 1)
+    projection = start + t[:, None] * segment
+    return np.hypot(*(points - projection).T)
+
+def _douglas_peucker_mask(points, tolerance):
+    """
+    Iterative Douglas-Peucker over an open polyline.
+
+    Return: Boolean mask of the points to keep, both endpoints are always kept
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        distances = segment_distances(points[first + 1:last], points[first], points[last])
+        farthest = int(np.argmax(distances))
+
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return keep
+
+def simplify_mask(points, tolerance: float):
+    """
+    Douglas-Peucker over a polyline or closed ring (first point equal to the last).
+
+    A closed ring is split at the vertex farthest from its start so both halves
+    have a proper baseline.
+
+    Args:
+        points: NumPy array of shape (n, 2)
+    Return: Boolean mask of the points to keep, both endpoints are always kept
+    """
+    if not np.array_equal(points[0], points[-1]):
+        return _douglas_peucker_mask(points, tolerance)
+
+    split = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[:split + 1] |= _douglas_peucker_mask(points[:split + 1], tolerance)
+    keep[split:] |= _douglas_peucker_mask(points[split:], tolerance)
+    return keep
+
+def simplify_ring(ring: list, tolerance: float, precision: int = LOD_PRECISION) -> list:
+    """
+    Simplify a polygon ring with Douglas-Peucker.
+    Rings that would collapse below a triangle are kept as is.
+
+    Args:
+        ring: List of [lon, lat]
+        tolerance: Maximum deviation in degrees
+        precision: Decimal places to round the output to
+    Return: Simplified list of [lon, lat]
+    """
+    if tolerance <= 0 or len(ring) < 4:
+        return ring
+
+    points = np.asarray(ring, dtype=np.float64)
+    closed = np.array_equal(points[0], points[-1])
+    keep = simplify_mask(points, tolerance)
+
+    # A closed ring needs 3 distinct vertices plus the closing one
+    if keep.sum() < (4 if closed else 2):
+        return ring
+
+    return np.round(points[keep], precision).tolist()
+
+def build_lods(ring: list) -> dict:
+    """
+    Return: Dict of LOD level to simplified ring, level 0 is the ring unchanged.
+    """
+    return {level: simplify_ring(ring, tolerance) for level, _, tolerance in LOD_LEVELS}
@@ -0,0 +1,118 @@
+import os
+import threading
+
+import numpy as np
+
+"""
+Process-wide, in-memory index over the POI CSVs in api_cache (schools, malls, MRT stations).
+Each CSV is parsed once and rebuilt only when its mtime changes.
+"""
+
+class POIIndex:
+    """
+    Columnar view of one POI file.
+
+    Rows are grouped by planning area so every area maps to one contiguous slice,
+    which makes per-area lookups and counts O(1) with no file I/O.
+    """
+
+    def __init__(self, records: list, area_of):
+        """
+        Args:
+            records: List of POI dicts in file order, each with 'latitude' and 'longitude'
+            area_of: Callable returning the planning area of a record
+        """
+        area_keys = [(area_of(record) or "").lower() for record in records]
+
+        # Stable sort keeps file order within each planning area
+        order = sorted(range(len(records)), key=area_keys.__getitem__)
+
+        self.records = [records[i] for i in order]
+        self.latitude = np.array([_to_float(record.get('latitude')) for record in self.records], dtype=np.float64)
+        self.longitude = np.array([_to_float(record.get('longitude')) for record in self.records], dtype=np.float64)
+
+        # Position of each file row inside self.records, to replay the original order
+        self.file_order = np.argsort(np.array(order, dtype=np.int64), kind='stable')
+
+        self.slices = {}
+        start = 0
+        for end in range(1, len(order) + 1):
+            if end == len(order) or area_keys[order[end]] != area_keys[order[start]]:
+                self.slices[area_keys[order[start]]] = slice(start, end)
+                start = end
+
+    def __len__(self):
+        return len(self.records)
+
+    def all(self) -> list:
+        """Return: All POIs in file order, copies so callers can't mutate the index."""
+        return [dict(self.records[i]) for i in self.file_order]
+
+    def in_area(self, location_name: str) -> list:
+        """Return: All POIs in a planning area (case-insensitive), in file order."""
+        area_slice = self.slices.get(location_name.lower())
+        if area_slice is None:
+            return []
+        return [dict(record) for record in self.records[area_slice]]
+
+    def count_in_area(self, location_name: str) -> int:
+        """Return: Number of POIs in a planning area (case-insensitive)."""
+        area_slice = self.slices.get(location_name.lower())
+        if area_slice is None:
+            return 0
+        return area_slice.stop - area_slice.start
+
+    def coordinates_in_area(self, location_name: str):
+        """Return: (latitudes, longitudes) NumPy views for a planning area."""
+        area_slice = self.slices.get(location_name.lower(), slice(0, 0))
+        return self.latitude[area_slice], self.longitude[area_slice]
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def file_version(csv_path: str) -> int:
+    """Return: mtime of a POI CSV in ns, 0 if it doesn't exist. Changes whenever the index is rebuilt."""
+    try:
+        return os.stat(csv_path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+# csv_path -> (mtime_ns, POIIndex)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(csv_path: str, loader, area_of) -> POIIndex:
+    """
+    Return the index for a POI CSV, rebuilding it only if the file changed on disk.
+
+    Args:
+        csv_path: Path of the cached CSV, used as cache key and for the mtime check
+        loader: Callable with no arguments returning the parsed list of POI dicts
+        area_of: Callable returning the planning area of a record
+    """
+    try:
+        mtime = os.stat(csv_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    cached = _indexes.get(csv_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _indexes_lock:
+        cached = _indexes.get(csv_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        records = loader() if mtime is not None else []
+        index = POIIndex(records, area_of)
+        _indexes[csv_path] = (mtime, index)
+        return index
+
+def clear():
+    """Drop every cached index, next lookup reloads from disk."""
+    with _indexes_lock:
+        _indexes.clear()
@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .fetch_districts import DB_PATH
+import database
+
+"""
+Columnar snapshot of resale_transactions for analytics.
+
+Every column is stored as its own .npy file so the loader can memory-map it instead of
+building one dict per row. Text columns are dictionary encoded: a sorted array of the
+distinct values plus an integer code per row, so comparing or grouping codes is the same
+as comparing the values. Rows are sorted by town, flat type, month and price, which makes
+every (town, flat_type, month) group one contiguous, price-sorted run.
+"""
+
+SNAPSHOT_DIR_NAME = "resale_snapshot"
+MANIFEST_FILE = "manifest.json"
+
+# Dictionary encoded columns, in row sort order
+CATEGORICAL_COLUMNS = ('town', 'flat_type', 'month', 'block', 'street_name')
+PRICE_COLUMN = 'resale_price'
+
+class ResaleSnapshot:
+    """
+    Memory-mapped view of one snapshot.
+
+    codes[column] are the per-row integer codes and dictionaries[column] the values they
+    index into, prices is the resale_price column. All arrays are read-only.
+    """
+
+    def __init__(self, snapshot_dir: str, manifest: dict):
+        self.version = manifest['version']
+        self.codes = {}
+        self.dictionaries = {}
+        for column in CATEGORICAL_COLUMNS:
+            self.codes[column] = _load_column(snapshot_dir, f"{column}.codes.npy")
+            self.dictionaries[column] = _load_column(snapshot_dir, f"{column}.values.npy")
+        self.prices = _load_column(snapshot_dir, f"{PRICE_COLUMN}.npy")
+
+    def __len__(self):
+        return len(self.prices)
+
+    def decode(self, column: str):
+        """Return: The column's values, one per row (materialised, not a view)."""
+        return self.dictionaries[column][self.codes[column]]
+
+    def town_slices(self) -> dict:
+        """Return: Dict of town -> slice of its rows, towns are the leading sort column so each is contiguous."""
+        codes = self.codes['town']
+        present = np.flatnonzero(np.bincount(codes, minlength=len(self.dictionaries['town'])))
+        starts = np.searchsorted(codes, present, side='left')
+        ends = np.searchsorted(codes, present, side='right')
+        return {str(self.dictionaries['town'][code]): slice(int(start), int(end))
+                for code, start, end in zip(present, starts, ends)}
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return: DataFrame with categorical text columns, for pandas based analysis."""
+        frame = {
+            column: pd.Categorical.from_codes(self.codes[column], categories=self.dictionaries[column])
+            for column in CATEGORICAL_COLUMNS
+        }
+        frame[PRICE_COLUMN] = self.prices
+        return pd.DataFrame(frame)
+
+def _load_column(snapshot_dir, file_name):
+    return np.load(os.path.join(snapshot_dir, file_name), mmap_mode='r', allow_pickle=False)
+
+def get_snapshot_dir(db_path=DB_PATH) -> str:
+    """Return: Snapshot folder of a database, in the api_cache folder next to it."""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "api_cache", SNAPSHOT_DIR_NAME)
+
+def _read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def export_snapshot(db_path=DB_PATH, snapshot_dir=None):
+    """
+    Write resale_transactions to a columnar snapshot, replacing the previous one.
+    Call after every ingest, load_snapshot() also rebuilds a stale snapshot on demand.
+
+    Args:
+        db_path: Database holding resale_transactions
+        snapshot_dir: Output folder, get_snapshot_dir(db_path) if None
+    Return: Number of rows written, False on error
+    """
+    snapshot_dir = snapshot_dir or get_snapshot_dir(db_path)
+
+    try:
+        with database.connect(db_path) as conn:
+            # Read the rows and their version in one transaction so they match
+            conn.execute("BEGIN")
+            try:
+                try:
+                    row = conn.execute("SELECT version FROM data_versions WHERE name = 'resale'").fetchone()
+                except sqlite3.OperationalError:
+                    # Database created before data_versions existed
+                    row = None
+                transactions = pd.read_sql_query(
+                    f"SELECT {', '.join(CATEGORICAL_COLUMNS)}, {PRICE_COLUMN} FROM resale_transactions", conn
+                )
+            finally:
+                conn.rollback()
+    except Exception as e:
+        print(f"Error reading resale transactions for snapshot: {e}")
+        return False
+
+    version = row[0] if row else 0
+
+    codes = {}
+    dictionaries = {}
+    for column in CATEGORICAL_COLUMNS:
+        column_codes, values = pd.factorize(transactions[column].fillna(''), sort=True)
+        codes[column] = column_codes.astype(np.min_scalar_type(max(len(values) - 1, 0)))
+        dictionaries[column] = np.array(values, dtype=str) if len(values) else np.array([], dtype='<U1')
+    prices = transactions[PRICE_COLUMN].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # lexsort sorts by the last key first
+    order = np.lexsort((prices, codes['month'], codes['flat_type'], codes['town']))
+
+    manifest = {
+        'version': version,
+        'rows': len(prices),
+        'columns': {column: len(dictionaries[column]) for column in CATEGORICAL_COLUMNS},
+    }
+
+    # Build in a scratch folder and swap it in, open memory maps keep the old files alive
+    staging_dir = snapshot_dir + ".tmp"
+    retired_dir = snapshot_dir + ".old"
+    try:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+
+        for column in CATEGORICAL_COLUMNS:
+            np.save(os.path.join(staging_dir, f"{column}.codes.npy"), codes[column][order])
+            np.save(os.path.join(staging_dir, f"{column}.values.npy"), dictionaries[column])
+        np.save(os.path.join(staging_dir, f"{PRICE_COLUMN}.npy"), prices[order])
+
+        # Manifest last, a folder without one is never loaded
+        with open(os.path.join(staging_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        shutil.rmtree(retired_dir, ignore_errors=True)
+        if os.path.exists(snapshot_dir):
+            os.replace(snapshot_dir, retired_dir)
+        os.replace(staging_dir, snapshot_dir)
+        shutil.rmtree(retired_dir, ignore_errors=True)
+    except Exception as e:
+        print(f"Error writing resale snapshot: {e}")
+        return False
+
+    print(f"Saved resale snapshot with {len(prices)} rows")
+    return len(prices)
+
+# snapshot_dir -> ResaleSnapshot
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def load_snapshot(db_path=DB_PATH, snapshot_dir=None):
+    """
+    Memory-map the snapshot of a database's resale_transactions, re-exporting it first if
+    it is older than the 'resale' data version.
+
+    Return: ResaleSnapshot, None if it could not be built
+    """
+    snapshot_dir = snapshot_dir or get_snapshot_dir(db_path)
+    version = database.get_data_version('resale', db_path=db_path)
+
+    cached = _snapshots.get(snapshot_dir)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _snapshots_lock:
+        cached = _snapshots.get(snapshot_dir)
+        if cached is not None and cached.version == version:
+            return cached
+
+        manifest = _read_manifest(snapshot_dir)
+        if manifest is None or manifest['version'] != version:
+            if export_snapshot(db_path=db_path, snapshot_dir=snapshot_dir) is False:
+                return None
+            manifest = _read_manifest(snapshot_dir)
+
+        try:
+            snapshot = ResaleSnapshot(snapshot_dir, manifest)
+        except (OSError, ValueError) as e:
+            print(f"Error loading resale snapshot: {e}")
+            return None
+
+        _snapshots[snapshot_dir] = snapshot
+        return snapshot
@@ -0,0 +1,295 @@
+import gzip
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from .fetch_districts import DB_PATH, CACHE_DIR
+from . import fetch_districts, fetch_malls, fetch_schools, fetch_transport, geometry, poi_index
+import database
+
+"""
+Pre-cut z/x/y map tiles for planning-area outlines and amenity points.
+
+Tiles are stored in an MBTiles-like SQLite file (tiles + metadata tables, TMS row order).
+Each tile is a gzipped JSON object of layer name -> GeoJSON FeatureCollection, the same
+layer layout as a Mapbox vector tile but without needing a protobuf encoder.
+"""
+
+TILES_DB_PATH = os.path.join(CACHE_DIR, "map_tiles.mbtiles")
+
+MIN_ZOOM = 10
+MAX_ZOOM = 14
+
+# Extra margin around each tile, as a fraction of the tile width, so polygon edges don't show seams
+TILE_BUFFER = 1 / 64
+
+TILES_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS metadata (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS tiles (
+        zoom_level INTEGER NOT NULL,
+        tile_column INTEGER NOT NULL,
+        tile_row INTEGER NOT NULL,
+        tile_data BLOB,
+        PRIMARY KEY (zoom_level, tile_column, tile_row)
+    )
+    ''',
+]
+
+def lonlat_to_tile(lon: float, lat: float, zoom: int):
+    """
+    Return: (x, y) of the XYZ tile containing the point.
+    """
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bounds(zoom: int, x: int, y: int):
+    """
+    Return: (west, south, east, north) of an XYZ tile in degrees.
+    """
+    n = 2 ** zoom
+
+    def lat_of(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat_of(y + 1), (x + 1) / n * 360.0 - 180.0, lat_of(y)
+
+def clip_ring(ring: list, bounds) -> list:
+    """
+    Clip a closed ring to a rectangle (Sutherland-Hodgman).
+
+    Return: Clipped closed ring, empty if the ring lies outside the rectangle
+    """
+    west, south, east, north = bounds
+    edges = [
+        (lambda p: p[0] >= west, lambda a, b: _cross_x(a, b, west)),
+        (lambda p: p[0] <= east, lambda a, b: _cross_x(a, b, east)),
+        (lambda p: p[1] >= south, lambda a, b: _cross_y(a, b, south)),
+        (lambda p: p[1] <= north, lambda a, b: _cross_y(a, b, north)),
+    ]
+
+    points = ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else ring
+    for inside, intersect in edges:
+        if not points:
+            break
+
+        clipped = []
+        previous = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(previous):
+                    clipped.append(intersect(previous, point))
+                clipped.append(point)
+            elif inside(previous):
+                clipped.append(intersect(previous, point))
+            previous = point
+        points = clipped
+
+    if len(points) < 3:
+        return []
+    return points + [points[0]]
+
+def _cross_x(a, b, x):
+    t = (x - a[0]) / (b[0] - a[0])
+    return [x, a[1] + t * (b[1] - a[1])]
+
+def _cross_y(a, b, y):
+    t = (y - a[1]) / (b[1] - a[1])
+    return [a[0] + t * (b[0] - a[0]), y]
+
+def _point_layers():
+    """
+    Return: Dict of layer name -> POIIndex for the amenity layers.
+    """
+    return {
+        "schools": fetch_schools.get_schools_index(),
+        "malls": fetch_malls.get_malls_index(),
+        "mrt_stations": fetch_transport.get_mrt_stations_index(),
+    }
+
+def get_source_version(db_path=DB_PATH) -> str:
+    """
+    Return: Version string of everything the tiles are cut from, changes whenever a source changes.
+    """
+    parts = [str(database.get_data_version('geometry', db_path=db_path))]
+    for csv_path in (fetch_schools.CACHE_LOCATION_COORDINATES_FILE,
+                     fetch_malls.CACHE_LOCATION_COORDINATES_FILE,
+                     fetch_transport.CACHE_LOCATION_COORDINATES_FILE):
+        parts.append(str(poi_index.file_version(csv_path)))
+    return "-".join(parts)
+
+def build_tiles(db_path=DB_PATH, tiles_path=TILES_DB_PATH, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Cut every non-empty tile between min_zoom and max_zoom and replace the tile store's contents.
+
+    Return: Number of tiles written, False on error
+    """
+    source_version = get_source_version(db_path=db_path)
+    polygons = fetch_districts.get_all_locations_geodata(db_path=db_path)
+    point_layers = _point_layers()
+
+    if not polygons:
+        print("Error: No planning-area polygons to cut tiles from")
+        return False
+
+    polygon_bboxes = []
+    for location in polygons:
+        ring = np.asarray(location['geodata'], dtype=np.float64)
+        polygon_bboxes.append((*ring.min(axis=0), *ring.max(axis=0)))
+    polygon_bboxes = np.array(polygon_bboxes)
+
+    west, south = polygon_bboxes[:, 0].min(), polygon_bboxes[:, 1].min()
+    east, north = polygon_bboxes[:, 2].max(), polygon_bboxes[:, 3].max()
+
+    rows = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        tolerance = geometry.tolerance_for_level(geometry.level_for_zoom(zoom))
+        simplified = [geometry.simplify_ring(location['geodata'], tolerance) for location in polygons]
+
+        min_x, min_y = lonlat_to_tile(west, north, zoom)
+        max_x, max_y = lonlat_to_tile(east, south, zoom)
+
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                tile = _cut_tile(zoom, x, y, polygons, simplified, polygon_bboxes, point_layers)
+                if tile is None:
+                    continue
+
+                body = json.dumps(tile, separators=(",", ":")).encode('utf-8')
+                # MBTiles rows count from the bottom (TMS)
+                tms_row = 2 ** zoom - 1 - y
+                rows.append((zoom, x, tms_row, gzip.compress(body, compresslevel=9, mtime=0)))
+
+    metadata = {
+        "name": "home-finder",
+        "format": "json",
+        "compression": "gzip",
+        "minzoom": str(min_zoom),
+        "maxzoom": str(max_zoom),
+        "bounds": ",".join(str(float(v)) for v in (west, south, east, north)),
+        "layers": ",".join(["planning_areas", *point_layers]),
+        "source_version": source_version,
+    }
+
+    try:
+        with database.connect(tiles_path) as conn:
+            cursor = conn.cursor()
+            for schema in TILES_SCHEMA:
+                cursor.execute(schema)
+
+            cursor.execute("DELETE FROM tiles")
+            cursor.executemany("INSERT INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)", rows)
+            cursor.execute("DELETE FROM metadata")
+            cursor.executemany("INSERT INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+            conn.commit()
+    except Exception as e:
+        print(f"Error saving tiles: {e}")
+        return False
+
+    print(f"Saved {len(rows)} tiles")
+    return len(rows)
+
+def _cut_tile(zoom, x, y, polygons, simplified, polygon_bboxes, point_layers):
+    """
+    Return: Dict of layer name -> FeatureCollection for one tile, None if the tile is empty.
+    """
+    west, south, east, north = tile_bounds(zoom, x, y)
+    buffer_x = (east - west) * TILE_BUFFER
+    buffer_y = (north - south) * TILE_BUFFER
+    bounds = (west - buffer_x, south - buffer_y, east + buffer_x, north + buffer_y)
+
+    tile = {}
+
+    features = []
+    overlaps = np.flatnonzero(
+        (polygon_bboxes[:, 0] <= bounds[2]) & (polygon_bboxes[:, 2] >= bounds[0]) &
+        (polygon_bboxes[:, 1] <= bounds[3]) & (polygon_bboxes[:, 3] >= bounds[1])
+    )
+    for i in overlaps:
+        ring = clip_ring(simplified[i], bounds)
+        if ring:
+            features.append(_feature("Polygon", [ring], {"location_name": polygons[i]['location_name']}))
+    if features:
+        tile["planning_areas"] = _feature_collection(features)
+
+    for layer, index in point_layers.items():
+        inside = np.flatnonzero(
+            (index.longitude >= bounds[0]) & (index.longitude <= bounds[2]) &
+            (index.latitude >= bounds[1]) & (index.latitude <= bounds[3])
+        )
+        features = [
+            _feature("Point", [float(index.longitude[i]), float(index.latitude[i])], {"name": index.records[i].get('name')})
+            for i in inside
+        ]
+        if features:
+            tile[layer] = _feature_collection(features)
+
+    return tile or None
+
+def _feature(geometry_type, coordinates, properties):
+    return {"type": "Feature", "geometry": {"type": geometry_type, "coordinates": coordinates}, "properties": properties}
+
+def _feature_collection(features):
+    return {"type": "FeatureCollection", "features": features}
+
+# tiles_path -> source version the store was last checked against
+_checked_versions = {}
+_build_lock = threading.Lock()
+
+def ensure_tiles(db_path=DB_PATH, tiles_path=TILES_DB_PATH):
+    """
+    Rebuild the tile store if any source changed since it was cut.
+
+    Return: Source version the store is now built from
+    """
+    source_version = get_source_version(db_path=db_path)
+    if _checked_versions.get(tiles_path) == source_version:
+        return source_version
+
+    with _build_lock:
+        if _checked_versions.get(tiles_path) == source_version:
+            return source_version
+
+        stored = None
+        try:
+            row = database.fetch_one("SELECT value FROM metadata WHERE name = 'source_version'", db_path=tiles_path)
+            stored = row['value'] if row else None
+        except Exception:
+            # Tile store not created yet
+            pass
+
+        if stored != source_version and not build_tiles(db_path=db_path, tiles_path=tiles_path):
+            return None
+
+        _checked_versions[tiles_path] = source_version
+        return source_version
+
+def get_tile(zoom: int, x: int, y: int, db_path=DB_PATH, tiles_path=TILES_DB_PATH):
+    """
+    Args:
+        zoom, x, y: XYZ tile address, as used by web map clients
+    Return: Dict with keys 'version' and 'gzip' (compressed tile JSON), None if the tile is empty
+    """
+    version = ensure_tiles(db_path=db_path, tiles_path=tiles_path)
+    if version is None:
+        return None
+
+    row = database.fetch_one(
+        "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+        (zoom, x, 2 ** zoom - 1 - y), db_path=tiles_path
+    )
+    if row is None:
+        return None
+
+    return {'version': version, 'gzip': row['tile_data']}
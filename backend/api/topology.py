@@ -0,0 +1,204 @@
+import numpy as np
+
+from . import geometry
+
+"""
+TopoJSON encoding of planning-area boundaries.
+Borders shared by neighbouring areas are stored once as arcs, and arc coordinates are
+quantised to an integer grid and delta-encoded, see https://github.com/topojson/topojson-specification
+"""
+
+# Grid size per axis, ~0.5m for Singapore's extent
+QUANTIZATION = 100000
+
+OBJECT_NAME = "planning_areas"
+
+def build_topology(locations: list, tolerance: float = 0.0, quantization: int = QUANTIZATION) -> dict:
+    """
+    Build a TopoJSON Topology from planning-area outlines.
+
+    Args:
+        locations: List of dicts with keys location_name and geodata (one ring of [lon, lat])
+        tolerance: Douglas-Peucker tolerance in degrees applied to each shared arc, 0 keeps every point
+        quantization: Number of grid steps per axis
+    Return: Topology dict with one GeometryCollection of Polygons, location_name is kept in properties
+    """
+    rings = [np.asarray(location['geodata'], dtype=np.float64).reshape(-1, 2) for location in locations]
+    bbox, scale, translate = _transform(rings, quantization)
+
+    quantized_rings = [_quantize(ring, scale, translate) for ring in rings]
+    junctions = _find_junctions(quantized_rings)
+
+    arcs = []
+    arc_ids = {}
+    geometries = []
+    for location, ring in zip(locations, quantized_rings):
+        ring_pieces = _cut_ring(ring, junctions)
+        # Only a ring made of a single arc may be rotated, otherwise the arcs would no longer chain
+        loop = len(ring_pieces) == 1
+        ring_arcs = [_index_arc(arc, arcs, arc_ids, loop) for arc in ring_pieces]
+
+        geometries.append({
+            "type": "Polygon",
+            "arcs": [ring_arcs] if ring_arcs else [],
+            "properties": {"location_name": location['location_name']},
+        })
+
+    # Simplify after deduplication so both sides of a border stay identical
+    grid_tolerance = tolerance / min(scale) if tolerance > 0 else 0
+    encoded_arcs = [_delta_encode(_simplify_arc(arc, grid_tolerance)) for arc in arcs]
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": {"scale": scale, "translate": translate},
+        "objects": {OBJECT_NAME: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded_arcs,
+    }
+
+def _transform(rings, quantization):
+    """Return: (bbox, scale, translate) mapping lon/lat onto a quantization x quantization grid."""
+    points = [ring for ring in rings if len(ring)]
+    if not points:
+        return [0, 0, 0, 0], [1, 1], [0, 0]
+
+    stacked = np.concatenate(points)
+    x0, y0 = stacked.min(axis=0)
+    x1, y1 = stacked.max(axis=0)
+
+    kx = (x1 - x0) / (quantization - 1) if x1 > x0 else 1
+    ky = (y1 - y0) / (quantization - 1) if y1 > y0 else 1
+
+    return [float(x0), float(y0), float(x1), float(y1)], [float(kx), float(ky)], [float(x0), float(y0)]
+
+def _quantize(ring, scale, translate):
+    """Return: List of (x, y) int tuples, consecutive duplicates and the closing point removed."""
+    if not len(ring):
+        return []
+
+    grid = np.rint((ring - translate) / scale).astype(np.int64)
+
+    # Points closer than a grid step collapse onto each other
+    keep = np.ones(len(grid), dtype=bool)
+    keep[1:] = np.any(grid[1:] != grid[:-1], axis=1)
+    grid = grid[keep]
+
+    if len(grid) > 1 and np.array_equal(grid[0], grid[-1]):
+        grid = grid[:-1]
+
+    return [(int(x), int(y)) for x, y in grid]
+
+def _find_junctions(rings) -> set:
+    """
+    A junction is a point where the neighbouring boundary changes, i.e. the point is
+    visited with different neighbours by different rings (or twice by the same ring).
+    """
+    neighbours = {}
+    junctions = set()
+
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            previous_point, next_point = ring[i - 1], ring[(i + 1) % n]
+            pair = (previous_point, next_point) if previous_point < next_point else (next_point, previous_point)
+
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+
+    return junctions
+
+def _cut_ring(ring, junctions) -> list:
+    """
+    Split a ring at its junctions.
+
+    Return: List of arcs (lists of points), consecutive arcs share their end point
+    """
+    if len(ring) < 3:
+        return []
+
+    starts = [i for i, point in enumerate(ring) if point in junctions]
+    if not starts:
+        # Border is not shared, the whole ring is one closed arc
+        return [ring + [ring[0]]]
+
+    rotated = ring[starts[0]:] + ring[:starts[0]]
+    offset = starts[0]
+    cuts = [(i - offset) % len(ring) for i in starts] + [len(ring)]
+    rotated.append(rotated[0])
+
+    return [rotated[cuts[k]:cuts[k + 1] + 1] for k in range(len(cuts) - 1)]
+
+def _canonical_closed(arc):
+    """Rotate a closed arc to start at its smallest point so identical loops compare equal."""
+    body = arc[:-1]
+    start = body.index(min(body))
+    body = body[start:] + body[:start]
+    return tuple(body + [body[0]])
+
+def _index_arc(arc, arcs, arc_ids, loop=False) -> int:
+    """
+    Args:
+        loop: The arc is a whole ring on its own and can be matched regardless of its start point
+    Return: Index of the arc in arcs, bitwise-negated (~i) if it is stored in the opposite direction.
+    """
+    forward = _canonical_closed(arc) if loop else tuple(arc)
+    backward = _canonical_closed(arc[::-1]) if loop else tuple(reversed(arc))
+
+    if forward in arc_ids:
+        return arc_ids[forward]
+    if backward in arc_ids:
+        return ~arc_ids[backward]
+
+    arc_ids[forward] = len(arcs)
+    arcs.append(list(forward))
+    return arc_ids[forward]
+
+def _simplify_arc(arc, tolerance):
+    if tolerance <= 0 or len(arc) < 3:
+        return arc
+
+    points = np.asarray(arc, dtype=np.float64)
+    keep = geometry.simplify_mask(points, tolerance)
+
+    # Keep a bend in every arc so rings of one or two arcs can't collapse into a line
+    if arc[0] == arc[-1]:
+        if keep.sum() < 4:
+            return arc
+    elif keep.sum() == 2:
+        keep[1 + int(np.argmax(geometry.segment_distances(points[1:-1], points[0], points[-1])))] = True
+
+    return [arc[i] for i in np.flatnonzero(keep)]
+
+def _delta_encode(arc):
+    """Return: First point absolute, every following point relative to the previous one."""
+    encoded = [list(arc[0])]
+    for (px, py), (x, y) in zip(arc, arc[1:]):
+        encoded.append([x - px, y - py])
+    return encoded
+
+def decode_topology(topology: dict) -> list:
+    """
+    Inverse of build_topology, mainly for checking the encoding.
+
+    Return: List of dicts with keys location_name and geodata, like fetch_districts.get_all_locations_geodata
+    """
+    kx, ky = topology['transform']['scale']
+    tx, ty = topology['transform']['translate']
+
+    decoded_arcs = []
+    for arc in topology['arcs']:
+        points = np.cumsum(np.asarray(arc, dtype=np.float64), axis=0)
+        decoded_arcs.append((points * [kx, ky] + [tx, ty]).tolist())
+
+    result = []
+    for geometry_object in topology['objects'][OBJECT_NAME]['geometries']:
+        ring = []
+        for arc_id in (geometry_object['arcs'][0] if geometry_object['arcs'] else []):
+            arc = decoded_arcs[arc_id] if arc_id >= 0 else decoded_arcs[~arc_id][::-1]
+            # Consecutive arcs share their end point
+            ring.extend(arc if not ring else arc[1:])
+
+        result.append({"location_name": geometry_object['properties']['location_name'], "geodata": ring})
+
+    return result
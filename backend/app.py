@@ -1,6 +1,8 @@
 from controllers import Locations, LocationDetails, User, Notifications, Preferences, Favorites
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+import payload_cache
+import re
 import sqlite3
 
 app = Flask(__name__)
@@ -9,25 +11,113 @@ CORS(app)
 App.py only handles handle HTTP logic, aligns with Single Responsibiltiy Principle
 """
 
+def snapshot_response(snapshot: dict, etag: str):
+    """
+    Return: Response with the snapshot's pre-encoded JSON in the best encoding the client accepts,
+    304 if the client's If-None-Match already matches etag
+    """
+    encoding = next((encoding for encoding in payload_cache.ENCODINGS
+                     if request.accept_encodings[encoding] and payload_cache.supports(snapshot, encoding)), None)
+
+    response = app.response_class(payload_cache.get_body(snapshot, encoding), mimetype='application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Data-Version'] = str(snapshot['version'])
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 # Explore route to get map geodata information
 @app.route('/get_all_coords', methods=['GET'])
 def get_all_coords():
     """
+    Optional query params: zoom or tolerance (degrees) to get simplified outlines,
+    bbox=min_lon,min_lat,max_lon,max_lat to only get locations in the viewport,
+    format=topo to get TopoJSON with shared borders encoded once.
+
     Return: Jsonified List of list of dicts, {location name: their geodata}
     """
-    locations = Locations.LocationsController.get_all_locations_geojson()
+    try:
+        zoom = request.args.get('zoom', default=None)
+        zoom = float(zoom) if zoom is not None else None
+        tolerance = request.args.get('tolerance', default=None)
+        tolerance = float(tolerance) if tolerance is not None else None
+    except ValueError:
+        return jsonify({"message": "Invalid zoom or tolerance!"}), 400
+
+    if (zoom is not None and zoom < 0) or (tolerance is not None and tolerance < 0):
+        return jsonify({"message": "Invalid zoom or tolerance!"}), 400
+
+    bbox = request.args.get('bbox', default=None)
+    if bbox is not None:
+        try:
+            bbox = tuple(float(value) for value in bbox.split(','))
+        except ValueError:
+            return jsonify({"message": "Invalid bbox!"}), 400
+
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            return jsonify({"message": "Invalid bbox!"}), 400
+
+    output_format = request.args.get('format', default='geojson')
+    if output_format not in ["geojson", "topo"]:
+        return jsonify({"message": "Unknown format!"}), 400
+
+    if output_format == 'topo' and bbox is not None:
+        return jsonify({"message": "bbox is not supported with format=topo!"}), 400
+
+    # Boundaries only change with the data, serve the pre-encoded payload
+    payload = Locations.LocationsController.get_all_coords_payload(zoom=zoom, tolerance=tolerance, bbox=bbox, output_format=output_format)
+
+    # One ETag per LOD level and viewport, the version alone would match another query's cached response
+    level = Locations.LocationsController.get_lod_level(zoom=zoom, tolerance=tolerance)
+    area = 'all' if bbox is None else ','.join(str(value) for value in bbox)
+    return snapshot_response(payload, etag=f"coords-{output_format}-{level}-{area}-{payload['version']}")
+
+# Reference list of every school, mall or MRT station
+@app.route('/get_all_amenities', methods=['GET'])
+def get_all_amenities():
+    """
+    Query param: type, one of schools, malls, mrt_stations
 
-    # Return list of locations
-    return jsonify(locations)
+    Return: Jsonified List of dicts, each amenity 1 dict with name, latitude, longitude and planning area
+    """
+    amenity_type = request.args.get('type', default=None)
+
+    if not amenity_type:
+        return jsonify({"message": "Missing amenity type!"}), 400
+
+    payload = LocationDetails.LocationsDetailController.get_all_amenities_payload(amenity_type)
+    if payload is None:
+        return jsonify({"message": "Unknown amenity type!"}), 400
+
+    return snapshot_response(payload, etag=f"{amenity_type}-{payload['version']}")
+
+# Map tiles for the viewport, planning-area outlines and amenity points
+@app.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_map_tile(z, x, y):
+    """
+    Return: JSON object of layer name -> GeoJSON FeatureCollection, 204 if the tile is empty
+    """
+    tile = Locations.LocationsController.get_map_tile(z, x, y)
+    if tile is None:
+        return '', 204
+
+    response = snapshot_response(tile, etag=f"{z}-{x}-{y}-{tile['version']}")
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 # Route to get and display all location information
 @app.route('/sort', methods=['GET'])
 def get_all_locations():
     """
+    Optional query param: flat_type, rank or score prices of that flat type instead of 3 ROOM
+
     Return: Jsonified List of list of tuples, (ranked location, their score), location is a dict of location, each db coloumn headder is a key.
     """
     # Get data sent in request
     sorting_category = request.args.get('sort_by', default=None)
+    flat_type = request.args.get('flat_type', default=None)
     user_id = None
 
     if not sorting_category:
@@ -35,14 +125,22 @@ def get_all_locations():
 
     if sorting_category not in ["price", "crime_rate", "num_schools", "num_malls", "num_transport", "score"]:
         return jsonify({"message": "Unknown sorting category!"}), 400
+
+    if flat_type is not None and flat_type not in Locations.LocationsController.get_flat_types():
+        return jsonify({"message": "Unknown flat type!"}), 400
     
     if sorting_category == 'score':
         user_id = request.args.get('user_id', default=None)
 
         if not user_id:
             return jsonify({"message": "Missing required user_id"}), 400
+    else:
+        # Category rankings only change with the data, serve the pre-serialised snapshot
+        snapshot = Locations.LocationsController.get_ranking_snapshot(sorting_category, flat_type=flat_type)
+        etag = f"{sorting_category}-{snapshot['version']}" if flat_type is None else f"{sorting_category}-{flat_type.replace(' ', '_')}-{snapshot['version']}"
+        return snapshot_response(snapshot, etag=etag)
         
-    ranked_locations = Locations.LocationsController.sort_by_category(sorting_category=sorting_category, user_id=user_id)
+    ranked_locations = Locations.LocationsController.sort_by_category(sorting_category=sorting_category, user_id=user_id, flat_type=flat_type)
     
     # Return list of ranked locations
     return jsonify(ranked_locations)
@@ -79,6 +177,101 @@ def search_for_location():
     # If exact match, proceed normally
     return jsonify(LocationDetails.LocationsDetailController.get_location_details(location_name=matched_location))
 
+# Resale price percentiles per month for the fan chart
+@app.route('/price_bands', methods=['GET'])
+def get_price_bands():
+    """
+    Query params: location_name, optional flat_type
+
+    Return: Jsonified Dict with location_name, quantiles and series, one series per flat type
+    """
+    location_name = request.args.get('location_name', default=None)
+    flat_type = request.args.get('flat_type', default=None)
+
+    if not location_name:
+        return jsonify({"message": "Missing location name!"}), 400
+
+    location_name = location_name.strip()
+    payload = LocationDetails.LocationsDetailController.get_price_bands_payload(location_name=location_name, flat_type=flat_type)
+
+    # One ETag per location and flat type, the version alone would match another query's cached response
+    etag = f"price-bands-{location_name}-{flat_type or 'all'}-{payload['version']}".replace(' ', '_')
+    return snapshot_response(payload, etag=etag)
+
+# Crime rate per year, its yearly change and trend slope
+@app.route('/crime_trends', methods=['GET'])
+def get_crime_trends():
+    """
+    Query params: optional location_name, every location if omitted
+
+    Return: Jsonified Dict with location_name, years, crime_rate, change and slope,
+    or a list of them for every location
+    """
+    location_name = request.args.get('location_name', default=None)
+    if location_name is not None:
+        location_name = location_name.strip()
+
+    payload = LocationDetails.LocationsDetailController.get_crime_trends_payload(location_name=location_name)
+    if payload is None:
+        return jsonify({"message": f"No crime rates for '{location_name}'"}), 404
+
+    # One ETag per location, the version alone would match another location's cached response
+    etag = f"crime-trends-{payload['version']}" if location_name is None else f"crime-trends-{location_name.replace(' ', '_')}-{payload['version']}"
+    return snapshot_response(payload, etag=etag)
+
+# Resale transactions of a location, paginated or streamed
+@app.route('/transactions', methods=['GET'])
+def get_transactions():
+    """
+    Query params: location_name, optional flat_type, start_month and end_month (YYYY-MM, inclusive),
+    limit (1-1000, default 100), cursor (next_cursor of the previous page),
+    format=ndjson to stream every matching transaction from the cursor on, one JSON object per line
+
+    Return: Jsonified Dict with location_name, transactions (newest first) and next_cursor, null on the last page
+    """
+    location_name = request.args.get('location_name', default=None)
+    flat_type = request.args.get('flat_type', default=None)
+    start_month = request.args.get('start_month', default=None)
+    end_month = request.args.get('end_month', default=None)
+
+    if not location_name:
+        return jsonify({"message": "Missing location name!"}), 400
+
+    for month in (start_month, end_month):
+        if month is not None and not re.fullmatch(r"\d{4}-\d{2}", month):
+            return jsonify({"message": "Invalid month, expected YYYY-MM!"}), 400
+
+    try:
+        limit = int(request.args.get('limit', default=100))
+    except ValueError:
+        return jsonify({"message": "Invalid limit!"}), 400
+
+    if not 1 <= limit <= 1000:
+        return jsonify({"message": "Invalid limit!"}), 400
+
+    after = None
+    cursor = request.args.get('cursor', default=None)
+    if cursor:
+        after = LocationDetails.LocationsDetailController.decode_transactions_cursor(cursor)
+        if after is None:
+            return jsonify({"message": "Invalid cursor!"}), 400
+
+    output_format = request.args.get('format', default='json')
+    if output_format not in ["json", "ndjson"]:
+        return jsonify({"message": "Unknown format!"}), 400
+
+    location_name = location_name.strip()
+
+    if output_format == 'ndjson':
+        stream = LocationDetails.LocationsDetailController.stream_transactions(
+            location_name=location_name, flat_type=flat_type, start_month=start_month, end_month=end_month, after=after
+        )
+        return app.response_class(stream, mimetype='application/x-ndjson')
+
+    return jsonify(LocationDetails.LocationsDetailController.get_transactions(
+        location_name=location_name, flat_type=flat_type, start_month=start_month, end_month=end_month, after=after, limit=limit
+    ))
+
 # Register Route
 @app.route('/register', methods=['POST'])
 def register():
@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import database
 from typing import List, Dict, Any, Optional
 
 class FavoritesController:
@@ -21,36 +22,34 @@ class FavoritesController:
             A list of dictionaries containing favorite location information
         """
         db_path = FavoritesController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row  # This enables column access by name
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            conn.row_factory = sqlite3.Row  # This enables column access by name
+            cursor = conn.cursor()
         
-        try:
-            # Join with locations table to get all location details
-            cursor.execute('''
-                SELECT f.favourite_id, f.location_name, 
-                       l.crime_rate, l.price, l.num_transport, l.num_malls, l.num_schools
-                FROM favourites f
-                JOIN locations l ON f.location_name = l.location_name
-                WHERE f.user_id = ?
-            ''', (user_id,))
+            try:
+                # Join with locations table to get all location details
+                cursor.execute('''
+                    SELECT f.favourite_id, f.location_name, 
+                           l.crime_rate, l.price, l.num_transport, l.num_malls, l.num_schools
+                    FROM favourites f
+                    JOIN locations l ON f.location_name = l.location_name
+                    WHERE f.user_id = ?
+                ''', (user_id,))
             
-            result = [dict(row) for row in cursor.fetchall()]
+                result = [dict(row) for row in cursor.fetchall()]
             
-            # Convert crime rate to safety score
-            for location in result:
-                if location.get('crime_rate') is not None:
-                    crime_rate = location['crime_rate']
-                    # Calculate safety score (10 = very safe, 0 = least safe)
-                    safety_score = max(0, min(10, 10 - ((crime_rate - 200) / 30)))
-                    location['crime_rate'] = round(safety_score, 1)
+                # Convert crime rate to safety score
+                for location in result:
+                    if location.get('crime_rate') is not None:
+                        crime_rate = location['crime_rate']
+                        # Calculate safety score (10 = very safe, 0 = least safe)
+                        safety_score = max(0, min(10, 10 - ((crime_rate - 200) / 30)))
+                        location['crime_rate'] = round(safety_score, 1)
             
-            return result
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return []
-        finally:
-            conn.close()
+                return result
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return []
     
     @staticmethod
     def add_to_favorites(user_id: str, location_name: str, db_name='app.db') -> bool:
@@ -66,34 +65,32 @@ class FavoritesController:
             Boolean indicating success
         """
         db_path = FavoritesController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            # First check if the location exists
-            cursor.execute('SELECT location_name FROM locations WHERE location_name = ?', (location_name,))
-            if not cursor.fetchone():
-                print(f"Location '{location_name}' does not exist")
-                return False
+            try:
+                # First check if the location exists
+                cursor.execute('SELECT location_name FROM locations WHERE location_name = ?', (location_name,))
+                if not cursor.fetchone():
+                    print(f"Location '{location_name}' does not exist")
+                    return False
             
-            # Add to favorites
-            cursor.execute('''
-                INSERT INTO favourites (user_id, location_name)
-                VALUES (?, ?)
-            ''', (user_id, location_name))
+                # Add to favorites
+                cursor.execute('''
+                    INSERT INTO favourites (user_id, location_name)
+                    VALUES (?, ?)
+                ''', (user_id, location_name))
             
-            conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            # This will catch the UNIQUE constraint violation if the user already has this location favorited
-            print(f"Location '{location_name}' already in favorites for user {user_id}")
-            return False
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
+                conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                # This will catch the UNIQUE constraint violation if the user already has this location favorited
+                print(f"Location '{location_name}' already in favorites for user {user_id}")
+                return False
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                conn.rollback()
+                return False
     
     @staticmethod
     def remove_from_favourites(user_id: str, location_name: str, db_name='app.db') -> bool:
@@ -109,28 +106,26 @@ class FavoritesController:
             Boolean indicating success
         """
         db_path = FavoritesController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('''
-                DELETE FROM favourites
-                WHERE user_id = ? AND location_name = ?
-            ''', (user_id, location_name))
+            try:
+                cursor.execute('''
+                    DELETE FROM favourites
+                    WHERE user_id = ? AND location_name = ?
+                ''', (user_id, location_name))
             
-            if cursor.rowcount == 0:
-                # No rows were deleted, meaning the favorite didn't exist
-                print(f"Location '{location_name}' was not in favorites for user {user_id}")
-                return False
+                if cursor.rowcount == 0:
+                    # No rows were deleted, meaning the favorite didn't exist
+                    print(f"Location '{location_name}' was not in favorites for user {user_id}")
+                    return False
             
-            conn.commit()
-            return True
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
+                conn.commit()
+                return True
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                conn.rollback()
+                return False
     
     @staticmethod
     def count_user_favourites(user_id: str, db_name='app.db') -> int:
@@ -145,18 +140,16 @@ class FavoritesController:
             Number of favorites the user has
         """
         db_path = FavoritesController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('SELECT COUNT(*) FROM favourites WHERE user_id = ?', (user_id,))
-            count = cursor.fetchone()[0]
-            return count
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return 0
-        finally:
-            conn.close()
+            try:
+                cursor.execute('SELECT COUNT(*) FROM favourites WHERE user_id = ?', (user_id,))
+                count = cursor.fetchone()[0]
+                return count
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return 0
     
     @staticmethod
     def is_favorite(user_id: str, location_name: str, db_name='app.db') -> bool:
@@ -172,19 +165,17 @@ class FavoritesController:
             Boolean indicating if the location is a favorite
         """
         db_path = FavoritesController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('''
-                SELECT 1 FROM favourites
-                WHERE user_id = ? AND location_name = ?
-                LIMIT 1
-            ''', (user_id, location_name))
+            try:
+                cursor.execute('''
+                    SELECT 1 FROM favourites
+                    WHERE user_id = ? AND location_name = ?
+                    LIMIT 1
+                ''', (user_id, location_name))
             
-            return cursor.fetchone() is not None
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return False
-        finally:
-            conn.close()
\ No newline at end of file
+                return cursor.fetchone() is not None
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return False
\ No newline at end of file
@@ -1,6 +1,10 @@
-from api import fetch_crimes, fetch_districts, fetch_malls, fetch_resale, fetch_schools, fetch_transport
+from api import fetch_crimes, fetch_districts, fetch_malls, fetch_resale, fetch_schools, fetch_transport, poi_index
 from controllers import Locations, Scoring
+import base64
+import database
+import json
 import os
+import payload_cache
 import sqlite3
 
 class LocationsDetailController:
@@ -34,6 +38,9 @@ class LocationsDetailController:
         # Save location crime news
         fetch_crimes.save_crimes_to_db(db_path=db_path)
 
+        # Save crime rate history, if initialise_db of LocationsController hasn't
+        fetch_crimes.ensure_crime_rates(db_path=db_path)
+
     @staticmethod
     def levenshtein_distance(s1: str, s2: str) -> int:
         """
@@ -138,6 +145,7 @@ class LocationsDetailController:
         # Get crimes and crime_rate
         crimes = fetch_crimes.fetch_all_crimes_by_location(location=location_name)
         crime_rate = location.get('crime_rate', 0.00)
+        crime_trend = fetch_crimes.get_crime_trends().for_location(location_name)
 
         # Get nums schools /and distance to nearest schools
         schools = fetch_schools.get_all_schools_by_district(location_name=location_name)
@@ -163,12 +171,131 @@ class LocationsDetailController:
             'price': past_resale_prices,
             'crime': crimes,
             'crime_rate': crime_rate,
+            'crime_trend': crime_trend,
             'schools': schools,
             'malls': malls,
             'transport': transport,
             # 'score': 1, 
         }
     
+    @staticmethod
+    def get_all_amenities_payload(amenity_type: str):
+        """
+        Pre-encoded list of every school, mall or MRT station, rebuilt only when its CSV changes.
+
+        Args: 'schools', 'malls' or 'mrt_stations'
+        Return: Payload dict from payload_cache.encode_payload, None if the type is unknown
+        """
+        sources = {
+            'schools': (fetch_schools.CACHE_LOCATION_COORDINATES_FILE, fetch_schools.get_schools_index),
+            'malls': (fetch_malls.CACHE_LOCATION_COORDINATES_FILE, fetch_malls.get_malls_index),
+            'mrt_stations': (fetch_transport.CACHE_LOCATION_COORDINATES_FILE, fetch_transport.get_mrt_stations_index),
+        }
+        if amenity_type not in sources:
+            return None
+
+        csv_path, get_index = sources[amenity_type]
+        version = poi_index.file_version(csv_path)
+        return payload_cache.get_payload(('amenities', amenity_type), version, lambda: get_index().all(), precompress=True)
+
+    @staticmethod
+    def get_crime_trends_payload(location_name: str = None):
+        """
+        Pre-encoded crime rate history, rebuilt only when the crime rates change.
+
+        Args: Optional location name, every location if None
+        Return: Payload dict from payload_cache.encode_payload of fetch_crimes.CrimeTrends.for_location(),
+            or of the list of every location's, None if the location has no crime rates
+        """
+        trends = fetch_crimes.get_crime_trends()
+
+        if location_name is None:
+            return payload_cache.get_payload(('crime_trends',), trends.version, trends.all, precompress=True)
+
+        if location_name not in trends.location_index:
+            return None
+        return payload_cache.get_payload(('crime_trends', location_name), trends.version,
+                                         lambda: trends.for_location(location_name))
+
+    @staticmethod
+    def get_price_bands_payload(location_name: str, flat_type: str = None):
+        """
+        Pre-encoded fan-chart series for a location, rebuilt only when resale data changes.
+
+        Args: Unique Location Name, optional flat type
+        Return: Payload dict from payload_cache.encode_payload of
+            {'location_name', 'quantiles': [10, 25, ...], 'series': {flat_type: {'months', 'count', 'p10', ...}}}
+        """
+        version = database.get_data_version('resale')
+
+        def build():
+            return {
+                'location_name': location_name,
+                'quantiles': list(fetch_resale.PRICE_BAND_QUANTILES),
+                'series': fetch_resale.get_price_bands_by_location(location_name=location_name, flat_type=flat_type),
+            }
+
+        return payload_cache.get_payload(('price_bands', location_name, flat_type), version, build)
+
+    @staticmethod
+    def encode_transactions_cursor(transaction: dict) -> str:
+        """
+        Return: Opaque cursor pointing just after a transaction, for get_transactions
+        """
+        key = json.dumps([transaction['month'], transaction['_id']], separators=(",", ":"))
+        return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_transactions_cursor(cursor: str):
+        """
+        Return: (month, _id) keyset of a cursor from encode_transactions_cursor, None if it is malformed
+        """
+        try:
+            month, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError):
+            return None
+
+        if not isinstance(month, str) or not isinstance(transaction_id, int) or isinstance(transaction_id, bool):
+            return None
+        return month, transaction_id
+
+    @staticmethod
+    def get_transactions(location_name: str, flat_type: str = None, start_month: str = None, end_month: str = None,
+                         after=None, limit: int = 100) -> dict:
+        """
+        One keyset page of a location's resale transactions, newest first.
+
+        Args: Unique Location Name, optional flat type and month range, after as returned by
+            decode_transactions_cursor, page size
+        Return: Dict with location_name, transactions and next_cursor (None on the last page)
+        """
+        # One extra row tells whether another page follows
+        rows = fetch_resale.get_transactions_page(location_name, flat_type=flat_type, start_month=start_month,
+                                                  end_month=end_month, after=after, limit=limit + 1)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = LocationsDetailController.encode_transactions_cursor(rows[-1])
+
+        return {
+            'location_name': location_name,
+            'transactions': rows,
+            'next_cursor': next_cursor,
+        }
+
+    @staticmethod
+    def stream_transactions(location_name: str, flat_type: str = None, start_month: str = None, end_month: str = None,
+                            after=None):
+        """
+        Every matching transaction as NDJSON, newest first.
+
+        Return: Generator of str chunks, one JSON object per line, one chunk per database page
+        """
+        for rows in fetch_resale.iter_transaction_pages(location_name, flat_type=flat_type, start_month=start_month,
+                                                        end_month=end_month, after=after):
+            yield "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+
     @staticmethod
     def get_location_coordinates(location_name: str, db_name='app.db') -> list:
         """
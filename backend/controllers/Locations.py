@@ -1,7 +1,27 @@
-from api import fetch_districts, fetch_crimes, fetch_malls, fetch_resale, fetch_schools, fetch_transport
+from api import fetch_districts, fetch_crimes, fetch_malls, fetch_resale, fetch_schools, fetch_transport, geometry, tiles, topology
 from controllers import Preferences, Scoring
+import database
 import os
-import sqlite3
+import payload_cache
+import threading
+
+# db_path -> (locations data version, LocationMatrix, normalised category scores)
+_location_matrix_cache = {}
+_location_matrix_lock = threading.Lock()
+
+# db_path -> (locations data version, {location_name: {flat_type: price}})
+_flat_type_prices_cache = {}
+_flat_type_prices_lock = threading.Lock()
+
+# db_path -> (locations data version, {category or ('price', flat_type): ranking snapshot})
+_ranking_snapshot_cache = {}
+_ranking_snapshot_lock = threading.Lock()
+
+# (db_path, LOD level) -> (geometry data version, TopoJSON dict)
+_topology_cache = {}
+_topology_lock = threading.Lock()
+
+RANKING_CATEGORIES = ["price", "crime_rate", "num_schools", "num_malls", "num_transport"]
 
 class LocationsController:
 
@@ -32,6 +52,12 @@ class LocationsController:
         # Save location resale_prices
         fetch_resale.save_resale_price_to_db(db_path=db_path)
 
+        # Warm the per-category ranking snapshots for the new data version
+        LocationsController.get_ranking_snapshot(RANKING_CATEGORIES[0], db_name=db_name)
+
+        # Re-cut map tiles if boundaries or amenities changed
+        tiles.ensure_tiles(db_path=db_path)
+
     @staticmethod
     def get_locations(db_name='app.db'):
         """
@@ -42,32 +68,9 @@ class LocationsController:
         db_path = LocationsController.get_db_path(db_name)
 
         try:
-            all_location_details = []
-            # Establish a database connection
-            with sqlite3.connect(db_path) as conn:
-                # Set row_factory to get dictionaries instead of tuples
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-
-                # Query to get all locations
-                query = "SELECT * FROM locations"
-                cursor.execute(query)
-                
-                # Fetch all results and convert to dictionaries
-                rows = cursor.fetchall()
-                
-                if rows:
-                    for row in rows:
-                        # Convert each sqlite3.Row to a dictionary
-                        location_details = dict(row)
-
-                        all_location_details.append(location_details)
-                
-                    return all_location_details
-
-                else:
-                    return []
-                
+            # Query to get all locations, each sqlite3.Row converted to a dictionary
+            return database.fetch_all("SELECT * FROM locations", db_path=db_path)
+
         except Exception as e:
             print(f"Error occurred: {e}")
             return []
@@ -82,45 +85,237 @@ class LocationsController:
         db_path = LocationsController.get_db_path(db_name)
 
         try:
-            # Establish a database connection
-            with sqlite3.connect(db_path) as conn:
-                # Set row_factory to get dictionary instead of tuple
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-
-                # Query to get location by name
-                query = "SELECT * FROM locations WHERE location_name = ?"
-                cursor.execute(query, (location_name,))
-                
-                # Fetch the result
-                result = cursor.fetchone()
-
-                if result:
-                    # Convert sqlite3.Row to dictionary
-                    return dict(result)
-                else:
-                    return None
+            # Query to get location by name
+            query = "SELECT * FROM locations WHERE location_name = ?"
+            return database.fetch_one(query, (location_name,), db_path=db_path)
 
         except Exception as e:
             print(f"Error occurred: {e}")
             return None
     
     @staticmethod
-    def get_all_locations_geojson():
+    def get_flat_type_prices(db_name='app.db') -> dict:
         """
-        Return: List of dicts, each location 1 dict
+        Price of every flat type in every location, read once per locations data version.
+
+        Return: Dict {location_name: {flat_type: price}}
+        """
+        db_path = LocationsController.get_db_path(db_name)
+        version = database.get_data_version('locations', db_path=db_path)
+
+        cached = _flat_type_prices_cache.get(db_path)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        with _flat_type_prices_lock:
+            cached = _flat_type_prices_cache.get(db_path)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            prices = fetch_resale.get_location_flat_type_prices(db_path=db_path)
+            if prices:
+                _flat_type_prices_cache[db_path] = (version, prices)
+
+            return prices
+
+    @staticmethod
+    def get_flat_types(db_name='app.db') -> list:
+        """
+        Return: Sorted list of flat types with prices in any location
+        """
+        prices = LocationsController.get_flat_type_prices(db_name)
+        return sorted({flat_type for location_prices in prices.values() for flat_type in location_prices})
+
+    @staticmethod
+    def get_location_matrix(db_name='app.db'):
+        """
+        Location metrics as a NumPy matrix plus their normalised category scores.
+        Materialised once per locations data version and held in memory,
+        so scoring a user does not re-read or re-normalise the table.
+
+        Return: Tuple (LocationMatrix, (scores, is_int))
         """
-        return fetch_districts.get_all_locations_geodata()
+        db_path = LocationsController.get_db_path(db_name)
+        version = database.get_data_version('locations', db_path=db_path)
+
+        cached = _location_matrix_cache.get(db_path)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+
+        with _location_matrix_lock:
+            cached = _location_matrix_cache.get(db_path)
+            if cached and cached[0] == version:
+                return cached[1], cached[2]
+
+            matrix = Scoring.LocationMatrix(LocationsController.get_locations(db_name),
+                                            flat_type_prices=LocationsController.get_flat_type_prices(db_name))
+            category_scores = matrix.normalised_scores()
+
+            # Don't pin an empty result, the table may just not be populated yet
+            if len(matrix):
+                _location_matrix_cache[db_path] = (version, matrix, category_scores)
+
+            return matrix, category_scores
+
+    @staticmethod
+    def get_ranking_snapshot(sorting_category, flat_type=None, db_name='app.db'):
+        """
+        Ready-to-send ranking for a category, serialised once per locations data version.
+        flat_type only changes the price ranking, None ranks the locations table's price.
+
+        Return: Payload dict from payload_cache.encode_payload of the list of (ranked location, their score),
+            'version' is the locations data version it was built from
+        """
+        db_path = LocationsController.get_db_path(db_name)
+        version = database.get_data_version('locations', db_path=db_path)
+        key = ('price', flat_type) if sorting_category == 'price' and flat_type is not None else sorting_category
+
+        cached = _ranking_snapshot_cache.get(db_path)
+        if cached and cached[0] == version:
+            return cached[1].get(key) or payload_cache.encode_payload([], version)
+
+        with _ranking_snapshot_lock:
+            cached = _ranking_snapshot_cache.get(db_path)
+            if cached and cached[0] == version:
+                return cached[1].get(key) or payload_cache.encode_payload([], version)
+
+            snapshots = LocationsController.build_ranking_snapshots(version=version, db_name=db_name)
+
+            if snapshots:
+                _ranking_snapshot_cache[db_path] = (version, snapshots)
+
+            return snapshots.get(key) or payload_cache.encode_payload([], version)
+
+    @staticmethod
+    def build_ranking_snapshots(version: int, db_name='app.db') -> dict:
+        """
+        Rank all locations for every category in one pass over the locations table,
+        plus a price ranking per flat type from the cached price matrix.
+
+        Return: Dict of category or ('price', flat_type) to ranking snapshot, empty if there are no locations
+        """
+        locations = LocationsController.get_locations(db_name)
+        if not locations:
+            return {}
+
+        snapshots = {}
+        for category in RANKING_CATEGORIES:
+            ranked = Scoring.ScoringController.assign_score_n_rank_all_locations(locations=locations, category=category)
+            snapshots[category] = payload_cache.encode_payload(ranked, version, precompress=True)
+
+        matrix, _ = LocationsController.get_location_matrix(db_name)
+        for flat_type in matrix.flat_types:
+            prices = matrix.price_column(flat_type)[0].tolist()
+            # Same location order as the matrix, which was built from the same table version
+            priced = [dict(location, price=price, flat_type=flat_type) for location, price in zip(matrix.locations, prices)]
+            ranked = Scoring.ScoringController.assign_score_n_rank_all_locations(locations=priced, category='price')
+            snapshots[('price', flat_type)] = payload_cache.encode_payload(ranked, version, precompress=True)
+
+        return snapshots
+
+    @staticmethod
+    def get_all_locations_geojson(zoom=None, tolerance=None, bbox=None):
+        """
+        Args:
+            zoom: Map zoom level, picks the matching simplified outline
+            tolerance: Maximum simplification error in degrees, used when zoom is not given
+            bbox: Optional viewport (min_lon, min_lat, max_lon, max_lat), only intersecting locations are returned
+
+        Return: List of dicts, each location 1 dict. Full resolution if neither zoom nor tolerance is given
+        """
+        level = LocationsController.get_lod_level(zoom=zoom, tolerance=tolerance)
+        return fetch_districts.get_all_locations_geodata(level=level, bbox=bbox)
+
+    @staticmethod
+    def get_lod_level(zoom=None, tolerance=None) -> int:
+        """
+        Return: LOD level for a map zoom or simplification tolerance, 0 (full resolution) if neither is given
+        """
+        if zoom is not None:
+            return geometry.level_for_zoom(zoom)
+        if tolerance is not None:
+            return geometry.level_for_tolerance(tolerance)
+        return 0
+
+    @staticmethod
+    def get_all_locations_topology(zoom=None, tolerance=None, db_name='app.db'):
+        """
+        All planning-area outlines as TopoJSON, shared borders are sent once.
+        Built once per geometry data version and LOD level.
+
+        Return: TopoJSON Topology dict
+        """
+        level = LocationsController.get_lod_level(zoom=zoom, tolerance=tolerance)
+        db_path = LocationsController.get_db_path(db_name)
+        version = database.get_data_version('geometry', db_path=db_path)
+        key = (db_path, level)
+
+        cached = _topology_cache.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        with _topology_lock:
+            cached = _topology_cache.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            # Simplify the shared arcs, not each outline, so neighbours keep a common border
+            locations = fetch_districts.get_all_locations_geodata(db_path=db_path)
+            result = topology.build_topology(locations, tolerance=geometry.tolerance_for_level(level))
+
+            if locations:
+                _topology_cache[key] = (version, result)
+
+            return result
     
     @staticmethod
-    def sort_by_category(sorting_category, user_id=None):
+    def get_all_coords_payload(zoom=None, tolerance=None, bbox=None, output_format='geojson', db_name='app.db'):
+        """
+        Pre-encoded /get_all_coords response, serialised once per geometry data version.
+        Only the full map is compressed up front, bbox subsets are compressed when a client asks.
+
+        Args:
+            output_format: 'geojson' for the list of outlines, 'topo' for TopoJSON
+        Return: Payload dict from payload_cache.encode_payload
+        """
+        level = LocationsController.get_lod_level(zoom=zoom, tolerance=tolerance)
+        version = database.get_data_version('geometry', db_path=LocationsController.get_db_path(db_name))
+
+        if output_format == 'topo':
+            build = lambda: LocationsController.get_all_locations_topology(zoom=zoom, tolerance=tolerance, db_name=db_name)
+        else:
+            build = lambda: LocationsController.get_all_locations_geojson(zoom=zoom, tolerance=tolerance, bbox=bbox)
+
+        return payload_cache.get_payload(('coords', output_format, level, bbox), version, build, precompress=bbox is None)
+
+    @staticmethod
+    def get_map_tile(zoom: int, x: int, y: int, db_name='app.db'):
+        """
+        Return: Dict with keys 'version' and 'gzip' (compressed JSON of layer -> FeatureCollection), None if the tile is empty
+        """
+        if not tiles.MIN_ZOOM <= zoom <= tiles.MAX_ZOOM or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+            return None
+
+        return tiles.get_tile(zoom, x, y, db_path=LocationsController.get_db_path(db_name))
+
+    @staticmethod
+    def sort_by_category(sorting_category, user_id=None, flat_type=None):
         """
+        Args: flat_type scores prices of that flat type, None uses the locations table's price
         Return: A list of tuples, (ranked location, their score)
         """
+        if sorting_category == 'score' and user_id:
+            # Per-user score is a weighted product over the cached normalised matrix
+            matrix, category_scores = LocationsController.get_location_matrix()
+            preferences = Preferences.PreferenceController.get_user_preferences(user_id)
+
+            return Scoring.ScoringController.rank_top_k(matrix=matrix, preferences=preferences, category_scores=category_scores,
+                                                        flat_type=flat_type)
 
         locations = LocationsController.get_locations()
 
-        return Scoring.ScoringController.assign_score_n_rank_all_locations(locations=locations, category=sorting_category, user_id=user_id)
+        return Scoring.ScoringController.assign_score_n_rank_all_locations(locations=locations, category=sorting_category, user_id=user_id,
+                                                                           flat_type=flat_type)
             
 
     def summarised_details(location: str, sorting_category='price'):
@@ -1,6 +1,10 @@
 import sqlite3
 import os
-from typing import List, Dict, Any, Optional
+import database
+from typing import Iterable, List, Dict, Any, Optional
+
+# Allowed notification_logs.type values
+NOTIFICATION_TYPES = ('price', 'crime', 'schools', 'malls', 'transport')
 
 class NotificationsController:
     @staticmethod
@@ -23,42 +27,40 @@ class NotificationsController:
             Boolean indicating success
         """
         db_path = NotificationsController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Check if a notification record already exists
-            cursor.execute('''
-                SELECT notification_id, status FROM notifications 
-                WHERE user_id = ? AND location_name = ?
-            ''', (user_id, location_name))
+            try:
+                # Check if a notification record already exists
+                cursor.execute('''
+                    SELECT notification_id, status FROM notifications 
+                    WHERE user_id = ? AND location_name = ?
+                ''', (user_id, location_name))
             
-            result = cursor.fetchone()
+                result = cursor.fetchone()
             
-            if result:
-                # Record exists, update status if needed
-                notification_id, status = result
-                if status == 'disabled':
+                if result:
+                    # Record exists, update status if needed
+                    notification_id, status = result
+                    if status == 'disabled':
+                        cursor.execute('''
+                            UPDATE notifications 
+                            SET status = 'enabled' 
+                            WHERE notification_id = ?
+                        ''', (notification_id,))
+                else:
+                    # No record exists, create a new one
                     cursor.execute('''
-                        UPDATE notifications 
-                        SET status = 'enabled' 
-                        WHERE notification_id = ?
-                    ''', (notification_id,))
-            else:
-                # No record exists, create a new one
-                cursor.execute('''
-                    INSERT INTO notifications (user_id, location_name, status)
-                    VALUES (?, ?, 'enabled')
-                ''', (user_id, location_name))
+                        INSERT INTO notifications (user_id, location_name, status)
+                        VALUES (?, ?, 'enabled')
+                    ''', (user_id, location_name))
             
-            conn.commit()
-            return True
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
+                conn.commit()
+                return True
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                conn.rollback()
+                return False
     
     @staticmethod
     def disable_notification(user_id: str, location_name: str, db_name='app.db') -> bool:
@@ -75,38 +77,36 @@ class NotificationsController:
             Boolean indicating success
         """
         db_path = NotificationsController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Check if a notification record exists
-            cursor.execute('''
-                SELECT notification_id, status FROM notifications 
-                WHERE user_id = ? AND location_name = ?
-            ''', (user_id, location_name))
+            try:
+                # Check if a notification record exists
+                cursor.execute('''
+                    SELECT notification_id, status FROM notifications 
+                    WHERE user_id = ? AND location_name = ?
+                ''', (user_id, location_name))
             
-            result = cursor.fetchone()
+                result = cursor.fetchone()
             
-            if result:
-                # Record exists, update status if needed
-                notification_id, status = result
-                if status == 'enabled':
-                    cursor.execute('''
-                        UPDATE notifications 
-                        SET status = 'disabled' 
-                        WHERE notification_id = ?
-                    ''', (notification_id,))
-                    conn.commit()
-                return True
-            else:
-                # No record exists, nothing to disable
+                if result:
+                    # Record exists, update status if needed
+                    notification_id, status = result
+                    if status == 'enabled':
+                        cursor.execute('''
+                            UPDATE notifications 
+                            SET status = 'disabled' 
+                            WHERE notification_id = ?
+                        ''', (notification_id,))
+                        conn.commit()
+                    return True
+                else:
+                    # No record exists, nothing to disable
+                    return False
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                conn.rollback()
                 return False
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
 
     @staticmethod
     def create_notification_log(location_name: str, notification_type: str, message: str, db_name='app.db') -> int:
@@ -122,31 +122,81 @@ class NotificationsController:
         Returns:
             ID of the created notification log or -1 if failed
         """
-        # Validate notification type
-        valid_types = ['price', 'crime', 'schools', 'malls', 'transport']
-        if notification_type not in valid_types:
-            print(f"Invalid notification type: {notification_type}. Must be one of {valid_types}")
-            return -1
+        return NotificationsController.create_notification_logs_bulk([{
+            'location_name': location_name,
+            'notification_type': notification_type,
+            'message': message,
+        }], db_name=db_name)[0]
+
+    @staticmethod
+    def create_notification_logs_bulk(events: Iterable[dict], db_name='app.db', conn=None) -> List[int]:
+        """
+        Create many notification log entries with one executemany in a single transaction.
         
-        db_path = NotificationsController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
+        Args:
+            events: Dicts with keys location_name, notification_type and message
+            db_name: Name of the database file
+            conn: Optional open connection, the logs are then written on its transaction and
+                  committed by the caller together with its own writes. If the insert fails,
+                  only the logs are rolled back, the caller's writes are kept
+            
+        Returns:
+            ID of each created notification log in events order, -1 for invalid events
+            and for every event if the insert failed
+        """
+        events = list(events)
+        if not events:
+            return []
+
+        if conn is None:
+            db_path = NotificationsController.get_db_path(db_name)
+            with database.connect(db_path) as conn:
+                # Take the write lock up front, no other insert can get IDs in between
+                conn.execute("BEGIN IMMEDIATE")
+                created = NotificationsController.create_notification_logs_bulk(events, db_name=db_name, conn=conn)
+                if any(notification_id != -1 for notification_id in created):
+                    conn.commit()
+                else:
+                    # Nothing valid or the insert failed
+                    conn.rollback()
+                return created
+
+        ids = [-1] * len(events)
+        valid_indices = []
+        for i, event in enumerate(events):
+            if event.get('notification_type') in NOTIFICATION_TYPES and event.get('location_name') and event.get('message'):
+                valid_indices.append(i)
+            else:
+                print(f"Invalid notification log: {event}. Type must be one of {list(NOTIFICATION_TYPES)}, "
+                      f"location_name and message are required")
+
+        if not valid_indices:
+            return ids
+
+        rows = [(events[i]['notification_type'], events[i]['location_name'], events[i]['message']) for i in valid_indices]
+
         cursor = conn.cursor()
-        
+        cursor.execute("SAVEPOINT notification_logs_bulk")
         try:
-            cursor.execute('''
+            cursor.executemany('''
                 INSERT INTO notification_logs (type, location_name, message, sent)
                 VALUES (?, ?, ?, 0)
-            ''', (notification_type, location_name, message))
-            
-            notification_id = cursor.lastrowid
-            conn.commit()
-            return notification_id
+            ''', rows)
+
+            # The transaction holds the write lock since the first insert and AUTOINCREMENT
+            # IDs only grow, so the newest rows are exactly the ones just inserted
+            cursor.execute("SELECT notification_id FROM notification_logs ORDER BY notification_id DESC LIMIT ?", (len(rows),))
+            created = [row[0] for row in reversed(cursor.fetchall())]
+            cursor.execute("RELEASE notification_logs_bulk")
         except sqlite3.Error as e:
-            print(f"Database error when creating notification log: {e}")
-            conn.rollback()
-            return -1
-        finally:
-            conn.close()
+            print(f"Database error when creating notification logs: {e}")
+            cursor.execute("ROLLBACK TO notification_logs_bulk")
+            cursor.execute("RELEASE notification_logs_bulk")
+            return ids
+
+        for i, notification_id in zip(valid_indices, created):
+            ids[i] = notification_id
+        return ids
 
     @staticmethod
     def process_notifications():
@@ -186,56 +236,54 @@ class NotificationsController:
             List of dictionaries containing notification details
         """
         db_path = NotificationsController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row  # This allows accessing columns by name
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            conn.row_factory = sqlite3.Row  # This allows accessing columns by name
+            cursor = conn.cursor()
         
-        unsent_notifications = []
+            unsent_notifications = []
         
-        try:
-            # Get locations where this user has enabled notifications
-            cursor.execute('''
-                SELECT location_name FROM notifications
-                WHERE user_id = ? AND status = 'enabled'
-            ''', (user_id,))
+            try:
+                # Get locations where this user has enabled notifications
+                cursor.execute('''
+                    SELECT location_name FROM notifications
+                    WHERE user_id = ? AND status = 'enabled'
+                ''', (user_id,))
             
-            enabled_locations = [row['location_name'] for row in cursor.fetchall()]
+                enabled_locations = [row['location_name'] for row in cursor.fetchall()]
             
-            if not enabled_locations:
-                return []  # User hasn't enabled notifications for any locations
+                if not enabled_locations:
+                    return []  # User hasn't enabled notifications for any locations
             
-            # Get all unsent notifications for locations this user cares about
-            placeholder = ','.join(['?'] * len(enabled_locations))
-            query = f'''
-                SELECT notification_id, type, location_name, message, created_at
-                FROM notification_logs
-                WHERE sent = 0 AND location_name IN ({placeholder})
-                ORDER BY created_at DESC
-            '''
+                # Get all unsent notifications for locations this user cares about
+                placeholder = ','.join(['?'] * len(enabled_locations))
+                query = f'''
+                    SELECT notification_id, type, location_name, message, created_at
+                    FROM notification_logs
+                    WHERE sent = 0 AND location_name IN ({placeholder})
+                    ORDER BY created_at DESC
+                '''
             
-            cursor.execute(query, enabled_locations)
-            notifications = cursor.fetchall()
+                cursor.execute(query, enabled_locations)
+                notifications = cursor.fetchall()
             
-            # Format each notification for the response
-            for notification in notifications:
-                unsent_notifications.append({
-                    'notification_id': notification['notification_id'],
-                    'type': notification['type'],
-                    'location_name': notification['location_name'],
-                    'message': notification['message'],
-                    'created_at': notification['created_at']
-                })
+                # Format each notification for the response
+                for notification in notifications:
+                    unsent_notifications.append({
+                        'notification_id': notification['notification_id'],
+                        'type': notification['type'],
+                        'location_name': notification['location_name'],
+                        'message': notification['message'],
+                        'created_at': notification['created_at']
+                    })
                 
-                # Optionally mark as sent for this user
-                # If you want to track which users have seen which notifications,
-                # you would need an additional table for that purpose
+                    # Optionally mark as sent for this user
+                    # If you want to track which users have seen which notifications,
+                    # you would need an additional table for that purpose
                 
-            return unsent_notifications
-        except sqlite3.Error as e:
-            print(f"Database error when getting unsent notifications for user {user_id}: {e}")
-            return []
-        finally:
-            conn.close()
+                return unsent_notifications
+            except sqlite3.Error as e:
+                print(f"Database error when getting unsent notifications for user {user_id}: {e}")
+                return []
 
     @staticmethod
     def get_user_notifications(user_id: str, db_name='app.db') -> List[Dict[str, Any]]:
@@ -250,26 +298,24 @@ class NotificationsController:
             List of dictionaries with notification information
         """
         db_path = NotificationsController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row  # This enables column access by name
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            conn.row_factory = sqlite3.Row  # This enables column access by name
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('''
-                SELECT n.notification_id, n.location_name, n.status,
-                       l.crime_rate, l.price, l.num_transport, l.num_malls, l.num_schools
-                FROM notifications n
-                JOIN locations l ON n.location_name = l.location_name
-                WHERE n.user_id = ? AND n.status = 'enabled'
-            ''', (user_id,))
+            try:
+                cursor.execute('''
+                    SELECT n.notification_id, n.location_name, n.status,
+                           l.crime_rate, l.price, l.num_transport, l.num_malls, l.num_schools
+                    FROM notifications n
+                    JOIN locations l ON n.location_name = l.location_name
+                    WHERE n.user_id = ? AND n.status = 'enabled'
+                ''', (user_id,))
             
-            result = [dict(row) for row in cursor.fetchall()]
-            return result
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return []
-        finally:
-            conn.close()
+                result = [dict(row) for row in cursor.fetchall()]
+                return result
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return []
     
     @staticmethod
     def get_notification_status(user_id: str, location_name: str, db_name='app.db') -> str:
@@ -285,21 +331,19 @@ class NotificationsController:
             Status string ('enabled', 'disabled', or 'not_set')
         """
         db_path = NotificationsController.get_db_path(db_name)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with database.connect(db_path) as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('''
-                SELECT status FROM notifications
-                WHERE user_id = ? AND location_name = ?
-            ''', (user_id, location_name))
+            try:
+                cursor.execute('''
+                    SELECT status FROM notifications
+                    WHERE user_id = ? AND location_name = ?
+                ''', (user_id, location_name))
             
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            return 'not_set'
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return 'error'
-        finally:
-            conn.close()
\ No newline at end of file
+                result = cursor.fetchone()
+                if result:
+                    return result[0]
+                return 'not_set'
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return 'error'
\ No newline at end of file
@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import database
 import json
 
 class PreferenceController:
@@ -23,7 +24,7 @@ class PreferenceController:
         
         try:
             # Establish a database connection
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Query to get all preferences for the user
@@ -69,7 +70,7 @@ class PreferenceController:
 
         try:
             # Establish a database connection
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
 
                 # Check if the user_id exists in the preferences table
@@ -1,5 +1,6 @@
 from controllers import Locations, Preferences
 from operator import itemgetter
+import numpy as np
 
 class ScoringController:
     """
@@ -8,7 +9,7 @@ class ScoringController:
     """
     
     @staticmethod
-    def assign_score_n_rank_all_locations(locations: list, category='price', user_id=None):
+    def assign_score_n_rank_all_locations(locations: list, category='price', user_id=None, flat_type=None):
         """
         Used for filter by category 
         Assigns a category score to a list of locations, re orders list of locations based on score.
@@ -19,6 +20,7 @@ class ScoringController:
             locations: List of location dictionaries
             preferences: User preferences
             category: Category used for filter, default is price
+            flat_type: For 'score', score against this flat type's prices
         Return: 
             If unregistered, All locations ranked by category score. 
             If registered, top 5 locations ranked by score.
@@ -35,7 +37,7 @@ class ScoringController:
                 # Get UserID
                 preferences = Preferences.PreferenceController.get_user_preferences(user_id)
 
-                return ScoringController.calculate_score_for_preferences(locations=locations, preferences=preferences)
+                return ScoringController.calculate_score_for_preferences(locations=locations, preferences=preferences, flat_type=flat_type)
 
             # Default all other categories
             case _:
@@ -110,7 +112,7 @@ class ScoringController:
             return [(location, round(location.get(category, 0) / highest, 1)) 
                     for location in ranked_locations]
     @staticmethod
-    def calculate_score_for_preferences(locations: list, preferences: dict):
+    def calculate_score_for_preferences(locations: list, preferences: dict, k: int = 5, flat_type: str = None):
         """
         Calculates weighted scores for locations based on user preferences.
         
@@ -120,91 +122,233 @@ class ScoringController:
                 - importance_rank: List of categories ranked by importance
                 - price: Ideal price
                 - other category preferences
+            k: Number of top locations to return, default is 5
+            flat_type: Score against this flat type's prices instead of the default '3 ROOM' price
         
         Returns:
             List of tuples containing top 5 locations with their scores, sorted by final score (location, normalized_score)
         """
-        # Calculate weights based on importance ranking
+        flat_type_prices = Locations.LocationsController.get_flat_type_prices() if flat_type is not None else None
+        matrix = LocationMatrix(locations, flat_type_prices=flat_type_prices)
+
+        return ScoringController.rank_top_k(matrix=matrix, preferences=preferences, k=k, flat_type=flat_type)
+
+    @staticmethod
+    def importance_weights(importance_rank: list) -> dict:
+        """
+        Weight of each category, the most important category gets the highest weight.
+
+        Return: Dict of category to weight
+        """
         weights = {}
-        number_of_categories = len(preferences['importance_rank'])
+        number_of_categories = len(importance_rank)
         for cat_importance_idx in range(number_of_categories):
-            category = preferences['importance_rank'][cat_importance_idx]
+            category = importance_rank[cat_importance_idx]
             weights[category] = number_of_categories - cat_importance_idx
-        
+        return weights
+
+    @staticmethod
+    def price_scores(matrix: 'LocationMatrix', preferences: dict, flat_type: str = None):
+        """
+        Proximity of every location's price to the user's ideal price, 10 = perfect match, 0 = very far.
+
+        Args:
+            flat_type: Score the price of this flat type, the locations table's price if None
+        Return: (scores, is_int) NumPy arrays, is_int flags scores that are the integer 0
+        """
+        prices, present = matrix.price_column(flat_type)
+
+        if 'price' not in preferences:
+            return np.zeros(len(matrix)), np.ones(len(matrix), dtype=bool)
+
+        ideal_price = preferences['price']
+        if not ideal_price > 0:
+            # Difference is taken as 100%
+            return np.zeros(len(matrix)), np.ones(len(matrix), dtype=bool)
+
+        with np.errstate(invalid='ignore'):
+            price_diff_percentage = np.abs(prices - ideal_price) / ideal_price
+            # Cap at 100% difference, anything above the cap is the integer 1
+            capped = price_diff_percentage > 1
+            scores = 10 * (1 - np.minimum(price_diff_percentage, 1))
+
+        is_int = ~present | capped
+        scores[is_int] = 0
+        return scores, is_int
+
+    @staticmethod
+    def rank_top_k(matrix: 'LocationMatrix', preferences: dict, k: int = 5, category_scores=None, flat_type: str = None):
+        """
+        Weighted score for every location in a few array operations, then the top k.
+
+        Ties on the rounded score keep the original location order, same as a stable sort.
+
+        Args:
+            matrix: LocationMatrix of all locations
+            preferences: Dictionary containing user preferences, see calculate_score_for_preferences
+            k: Number of top locations to return
+            category_scores: Optional precomputed (scores, is_int) from matrix.normalised_scores()
+            flat_type: Score prices of this flat type, returned locations then carry its price and flat_type
+        Returns:
+            List of tuples containing top k locations with their scores, sorted by final score (location, normalized_score)
+        """
+        if len(matrix) == 0:
+            return []
+
+        weights = ScoringController.importance_weights(preferences['importance_rank'])
         total_weight = sum(weights.values())
-        
-        # Find min/max values for normalization
-        min_max_values = {
-            'price': {'min': float('inf'), 'max': 0},
-            'crime_rate': {'min': float('inf'), 'max': 0},
-            'schools': {'min': float('inf'), 'max': 0},
-            'malls': {'min': float('inf'), 'max': 0},
-            'transport': {'min': float('inf'), 'max': 0}
-        }
-        
-        for location in locations:
-            for category in min_max_values.keys():
-                if category in location:
-                    min_max_values[category]['min'] = min(min_max_values[category]['min'], location[category])
-                    min_max_values[category]['max'] = max(min_max_values[category]['max'], location[category])
-        
-        scored_locations = []
-        for location in locations:
-            # Calculate individual category scores
-            category_scores = {}
-            
-            # Special handling for price (proximity to ideal price)
-            if 'price' in location and 'price' in preferences:
-                ideal_price = preferences['price']
-                actual_price = location['price']
-                # Calculate proximity score (10 = perfect match, 0 = very far)
-                price_diff_percentage = abs(actual_price - ideal_price) / ideal_price if ideal_price > 0 else 1
-                # Cap at 100% difference
-                price_diff_percentage = min(price_diff_percentage, 1)
-                category_scores['price'] = 10 * (1 - price_diff_percentage)
-            else:
-                category_scores['price'] = 0
-            
-            # Normalize crime_rate (lower is better)
-            if 'crime_rate' in location:
-                min_val = min_max_values['crime_rate']['min']
-                max_val = min_max_values['crime_rate']['max']
-                if max_val > min_val:
-                    normalized = (max_val - location['crime_rate']) / (max_val - min_val)
-                    category_scores['crime_rate'] = normalized * 10
+
+        if category_scores is None:
+            category_scores = matrix.normalised_scores()
+        scores, is_int = category_scores
+
+        # Price depends on the user's ideal price so it is never precomputed
+        price_scores, price_is_int = ScoringController.price_scores(matrix, preferences, flat_type=flat_type)
+
+        # Weighted matrix-vector product, accumulated column by column in category order
+        # so the float result matches adding the category scores one by one
+        weighted_score = np.zeros(len(matrix))
+        for col, category in enumerate(LocationMatrix.CATEGORIES):
+            if category in weights:
+                column = price_scores if category == 'price' else scores[:, col]
+                weighted_score += column * weights[category]
+
+        if total_weight > 0:
+            final_scores = weighted_score / total_weight
+            top = ScoringController._top_k_by_rounded_score(final_scores, k)
+        else:
+            top = [(idx, 0) for idx in range(min(k, len(matrix)))]
+
+        row_prices = matrix.price_column(flat_type)[0] if flat_type is not None else None
+
+        result = []
+        for idx, final_score in top:
+            row_scores = scores[idx].tolist()
+            row_is_int = is_int[idx].tolist()
+            row_scores[0], row_is_int[0] = float(price_scores[idx]), bool(price_is_int[idx])
+
+            location_copy = matrix.locations[idx].copy()
+            if flat_type is not None:
+                location_copy['price'] = float(row_prices[idx])
+                location_copy['flat_type'] = flat_type
+            location_copy['category_scores'] = {
+                category: round(int(score) if score_is_int else score, 2)
+                for category, score, score_is_int in zip(LocationMatrix.CATEGORIES, row_scores, row_is_int)
+            }
+            result.append((location_copy, final_score))
+
+        return result
+
+    @staticmethod
+    def _top_k_by_rounded_score(final_scores, k: int) -> list:
+        """
+        Select the k best scores after rounding to 2 dp, ties broken by index.
+
+        argpartition finds the k-th best raw score, only scores that can still round
+        to the same value or higher are rounded and sorted in Python.
+
+        Return: List of (index, rounded score)
+        """
+        n = len(final_scores)
+        if n > k:
+            kth_best = final_scores[np.argpartition(final_scores, n - k)[n - k]]
+            candidates = np.flatnonzero(final_scores >= kth_best - 0.011)
+        else:
+            candidates = np.arange(n)
+
+        rounded = [(int(idx), round(float(final_scores[idx]), 2)) for idx in candidates]
+        rounded.sort(key=lambda item: (-item[1], item[0]))
+        return rounded[:k]
+
+class LocationMatrix:
+    """
+    Location metrics held column-wise as a NumPy matrix, one row per location.
+
+    Category names follow the preference importance_rank. The locations table
+    stores num_schools / num_malls / num_transport, so those three columns are
+    only present when the location dicts carry the short names.
+    """
+    # price must stay first, ScoringController.rank_top_k fills it in per user
+    CATEGORIES = ('price', 'crime_rate', 'schools', 'malls', 'transport')
+
+    def __init__(self, locations: list, flat_type_prices: dict = None):
+        """
+        Args:
+            locations: List of location dicts
+            flat_type_prices: Optional {location_name: {flat_type: price}}, to score against flat types
+                other than the one in the locations table
+        """
+        self.locations = locations
+
+        n = len(locations)
+        self.values = np.full((n, len(self.CATEGORIES)), np.nan)
+        self.present = np.zeros((n, len(self.CATEGORIES)), dtype=bool)
+
+        for col, category in enumerate(self.CATEGORIES):
+            column = [location.get(category) for location in locations]
+            present = np.array([value is not None for value in column], dtype=bool)
+            if present.any():
+                self.values[present, col] = [value for value in column if value is not None]
+                self.present[:, col] = present
+
+        # Min/max over present values, max starts at 0
+        self.min = np.min(np.where(self.present, self.values, np.inf), axis=0, initial=np.inf)
+        self.max = np.max(np.where(self.present, self.values, 0), axis=0, initial=0)
+
+        # Location x flat type price matrix, 0 where a location has no transactions of that type
+        flat_type_prices = flat_type_prices or {}
+        self.flat_types = sorted({flat_type for prices in flat_type_prices.values() for flat_type in prices})
+        self.flat_type_index = {flat_type: col for col, flat_type in enumerate(self.flat_types)}
+        self.flat_type_prices = np.zeros((n, len(self.flat_types)))
+        for row, location in enumerate(locations):
+            for flat_type, price in flat_type_prices.get(location.get('location_name'), {}).items():
+                self.flat_type_prices[row, self.flat_type_index[flat_type]] = price or 0
+
+    def __len__(self):
+        return len(self.locations)
+
+    def price_column(self, flat_type: str = None):
+        """
+        Return: (values, present) arrays of every location's price, from the price matrix if flat_type is given
+        """
+        price_col = self.CATEGORIES.index('price')
+        if flat_type is None:
+            return self.values[:, price_col], self.present[:, price_col]
+
+        values = np.zeros(len(self))
+        col = self.flat_type_index.get(flat_type)
+        if col is not None:
+            values = self.flat_type_prices[:, col]
+        return values, np.ones(len(self), dtype=bool)
+
+    def normalised_scores(self):
+        """
+        Min-max normalised 0-10 score of every category that does not depend on the user.
+        crime_rate: lower is better. schools, malls, transport: higher is better.
+        The price column is left at 0, it is filled in per user.
+
+        Return: (scores, is_int), is_int flags scores that are the integer constants 0 or 10
+        """
+        scores = np.zeros(self.values.shape)
+        is_int = np.ones(self.values.shape, dtype=bool)
+
+        for col, category in enumerate(self.CATEGORIES):
+            if category == 'price':
+                continue
+
+            present = self.present[:, col]
+            min_val, max_val = self.min[col], self.max[col]
+
+            if max_val > min_val:
+                if category == 'crime_rate':
+                    normalized = (max_val - self.values[:, col]) / (max_val - min_val)
                 else:
-                    category_scores['crime_rate'] = 10
+                    normalized = (self.values[:, col] - min_val) / (max_val - min_val)
+                scores[present, col] = normalized[present] * 10
+                is_int[present, col] = False
+            elif category == 'crime_rate':
+                scores[present, col] = 10
             else:
-                category_scores['crime_rate'] = 0
-            
-            # Normalize other attributes (higher is better)
-            for category in ['schools', 'malls', 'transport']:
-                if category in location:
-                    min_val = min_max_values[category]['min']
-                    max_val = min_max_values[category]['max']
-                    if max_val > min_val:
-                        normalized = (location[category] - min_val) / (max_val - min_val)
-                        category_scores[category] = normalized * 10
-                    else:
-                        category_scores[category] = 10 if location[category] > 0 else 0
-                else:
-                    category_scores[category] = 0
-            
-            # Calculate final weighted score
-            weighted_score = 0
-            for category, score in category_scores.items():
-                if category in weights:
-                    weighted_score += score * weights[category]
-            
-            # Normalize final score
-            final_score = weighted_score / total_weight if total_weight > 0 else 0
-            final_score = round(final_score, 2)
-            
-            # Store the score in the location
-            location_copy = location.copy()
-            location_copy['category_scores'] = {k: round(v, 2) for k, v in category_scores.items()}
-            
-            scored_locations.append((location_copy, final_score))
-        
-        # Sort by score (highest first) and return top 5
-        return sorted(scored_locations, key=lambda x: x[1], reverse=True)[:5]
\ No newline at end of file
+                scores[present, col] = np.where(self.values[present, col] > 0, 10, 0)
+
+        return scores, is_int
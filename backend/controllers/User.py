@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import database
 from controllers import Preferences
 
 class UserController:
@@ -17,7 +18,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Insert the new user into the database
@@ -48,7 +49,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
 
                 # Check if the user_id exists
@@ -109,7 +110,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 query = "SELECT username, email FROM users WHERE username = ? OR email = ?"
                 cursor.execute(query, (username, email))
@@ -137,7 +138,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 query = "SELECT user_id FROM users WHERE (username = ? OR email = ?) AND password = ?"
                 cursor.execute(query, (username_or_email, username_or_email, password))
@@ -161,7 +162,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Start transaction
@@ -184,14 +185,8 @@ class UserController:
                 
                 return True
         except Exception as e:
+            # database.connect has already rolled the transaction back
             print(f"Error occurred during user deletion: {e}")
-            
-            # Roll back transaction if an error occurs
-            try:
-                cursor.execute("ROLLBACK")
-            except:
-                pass
-                
             return False
         
     @staticmethod
@@ -204,7 +199,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 query = "SELECT user_id FROM users WHERE username = ? AND email = ?"
                 cursor.execute(query, (username, email))
@@ -227,7 +222,7 @@ class UserController:
         db_path = UserController.get_db_path()
         
         try:
-            with sqlite3.connect(db_path) as conn:
+            with database.connect(db_path) as conn:
                 cursor = conn.cursor()
                 query = "SELECT user_id, username, email FROM users WHERE user_id = ?"
                 cursor.execute(query, (user_id,))
@@ -0,0 +1,202 @@
+import os
+import pathlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+"""
+Shared data-access layer. Every controller and api helper borrows its SQLite
+connection from here instead of calling sqlite3.connect() itself, so a request
+reuses warm, already-configured connections from a pool.
+"""
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.absolute()
+DB_PATH = os.path.join(PROJECT_ROOT, 'app.db')
+
+# Pool sizing, the Flask dev server is threaded so allow a few concurrent checkouts
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+
+# Prepared statements kept per pooled connection by sqlite3, survives across requests
+STATEMENT_CACHE_SIZE = 256
+
+# Applied to every new DBAPI connection, single place to tune SQLite
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+)
+
+# Temporarily applied by bulk_load(), a crash mid-load just means reloading from the source file
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+)
+
+# Version counter per dataset, see get_data_version()
+DATA_VERSIONS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+)
+'''
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    """Run the shared pragmas on a freshly opened connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+def get_engine(db_path=DB_PATH):
+    """
+    Return the pooled engine for a database file, creating it on first use.
+
+    Args:
+        db_path: Path to the SQLite database file
+
+    Returns:
+        sqlalchemy.Engine shared by all callers in this process
+    """
+    db_path = os.path.abspath(db_path)
+
+    engine = _engines.get(db_path)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = create_engine(
+                f"sqlite:///{db_path}",
+                poolclass=QueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                connect_args={
+                    "check_same_thread": False,
+                    "cached_statements": STATEMENT_CACHE_SIZE,
+                },
+            )
+            event.listen(engine, "connect", _apply_pragmas)
+            _engines[db_path] = engine
+
+    return engine
+
+@contextmanager
+def connect(db_path=DB_PATH):
+    """
+    Borrow a pooled sqlite3 connection for the duration of a with block.
+
+    Behaves like `with sqlite3.connect(db_path) as conn`: pending changes are
+    committed on success and rolled back on error. The connection goes back to
+    the pool afterwards, so callers must not close it themselves.
+
+    Yields:
+        sqlite3.Connection with row_factory set to sqlite3.Row
+    """
+    pooled = get_engine(db_path).raw_connection()
+    conn = pooled.driver_connection
+    conn.row_factory = sqlite3.Row
+
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        # Returns the connection to the pool rather than closing it
+        pooled.close()
+
+@contextmanager
+def bulk_load(conn):
+    """
+    Run a large rebuild in one transaction with durability relaxed.
+
+    The connection's normal PRAGMAS are restored afterwards since it goes back to the pool.
+    Commits on success, rolls back on error.
+    """
+    for pragma in BULK_LOAD_PRAGMAS:
+        conn.execute(pragma)
+
+    try:
+        conn.execute("BEGIN")
+        yield conn
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        _apply_pragmas(conn, None)
+
+def fetch_all(query: str, params=(), db_path=DB_PATH) -> list:
+    """
+    Run a read query on a pooled connection.
+
+    Return: List of dicts, one per row
+    """
+    with connect(db_path) as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+def fetch_one(query: str, params=(), db_path=DB_PATH):
+    """
+    Run a read query on a pooled connection.
+
+    Return: 1 dict of the first row or None if nothing matched
+    """
+    with connect(db_path) as conn:
+        row = conn.execute(query, params).fetchone()
+        return dict(row) if row else None
+
+def get_data_version(name: str, db_path=DB_PATH) -> int:
+    """
+    Current version of a dataset, in-memory caches compare against it to know when to rebuild.
+
+    Args:
+        name: Dataset name, e.g. 'locations'
+    Return: Version number, 0 if the dataset was never bumped
+    """
+    try:
+        row = fetch_one("SELECT version FROM data_versions WHERE name = ?", (name,), db_path=db_path)
+    except sqlite3.OperationalError:
+        # Database created before data_versions existed
+        return 0
+    return row['version'] if row else 0
+
+def bump_data_version(name: str, db_path=DB_PATH, conn=None) -> None:
+    """
+    Mark a dataset as changed, call this after every write to the dataset's tables.
+
+    Args:
+        name: Dataset name, e.g. 'locations'
+        conn: Optional open connection, so the bump commits together with the write
+    """
+    if conn is None:
+        with connect(db_path) as conn:
+            return bump_data_version(name, db_path=db_path, conn=conn)
+
+    conn.execute(DATA_VERSIONS_SCHEMA)
+    conn.execute('''
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+def dispose_engines():
+    """Close every pooled connection, used by scripts and tests that swap database files."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
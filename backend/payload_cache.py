@@ -0,0 +1,118 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    # Optional, responses fall back to gzip
+    brotli = None
+
+"""
+Process-wide cache of ready-to-send JSON responses.
+Each payload is serialised once per data version, requests then only pick the encoding the
+client accepts and compare ETags. Compressed bodies are made the first time a client asks
+for that encoding and kept with the payload, only the fixed full-dataset payloads are
+compressed up front.
+"""
+
+# Distinct payloads kept, bbox queries can create many keys
+MAX_ENTRIES = 256
+
+# Levels cheap enough to run inside a request on a cache miss
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Encodings in order of preference
+ENCODINGS = ('br', 'gzip')
+
+# key -> payload dict, least recently used first
+_payloads = OrderedDict()
+_payloads_lock = threading.Lock()
+
+def encode_payload(obj, version, precompress=False) -> dict:
+    """
+    Serialise obj the same way flask.jsonify does outside debug mode.
+
+    Args:
+        precompress: Also compress every encoding now, for payloads served to every client
+    Return: Dict with keys
+        'version': data version the payload was built from
+        'json': JSON encoded bytes
+        'gzip', 'br': compressed 'json', added by get_body() or precompress
+    """
+    body = (json.dumps(obj, sort_keys=True, separators=(",", ":")) + "\n").encode('utf-8')
+
+    payload = {
+        'version': version,
+        'json': body,
+    }
+    if precompress:
+        for encoding in ENCODINGS:
+            if supports(payload, encoding):
+                get_body(payload, encoding)
+
+    return payload
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def supports(payload: dict, encoding: str) -> bool:
+    """Return: Whether get_body() can serve the payload in encoding."""
+    if encoding in payload:
+        return True
+    if encoding == 'br':
+        return brotli is not None and 'json' in payload
+    return encoding == 'gzip' and 'json' in payload
+
+def get_body(payload: dict, encoding: str = None) -> bytes:
+    """
+    Return the payload's body in an encoding, compressing and keeping it on first use.
+
+    Args:
+        encoding: 'br', 'gzip' or None for the uncompressed JSON
+    """
+    if encoding is None:
+        # Some payloads, e.g. map tiles, are only stored compressed
+        return payload['json'] if 'json' in payload else gzip.decompress(payload['gzip'])
+
+    body = payload.get(encoding)
+    if body is None:
+        # Two requests may compress the same payload at once, both results are identical
+        body = _compress(payload['json'], encoding)
+        payload[encoding] = body
+    return body
+
+def get_payload(key, version, build, precompress=False) -> dict:
+    """
+    Return the cached payload for key, rebuilding it if it was built from another data version.
+
+    Args:
+        key: Hashable identifying the response, e.g. ('coords', 'topo', level)
+        version: Current data version of the payload's sources
+        build: Callable with no arguments returning the object to serialise
+        precompress: Compress every encoding when building, see encode_payload()
+    """
+    with _payloads_lock:
+        cached = _payloads.get(key)
+        if cached and cached['version'] == version:
+            _payloads.move_to_end(key)
+            return cached
+
+    payload = encode_payload(build(), version, precompress=precompress)
+
+    with _payloads_lock:
+        _payloads[key] = payload
+        _payloads.move_to_end(key)
+        while len(_payloads) > MAX_ENTRIES:
+            _payloads.popitem(last=False)
+
+    return payload
+
+def clear():
+    """Drop every cached payload."""
+    with _payloads_lock:
+        _payloads.clear()
@@ -1,4 +1,7 @@
 import sqlite3
+from database import DATA_VERSIONS_SCHEMA
+from api.fetch_resale import RESALE_SCHEMA, RESALE_INDEXES, RESALE_TRANSACTIONS_VIEW
+from api.fetch_crimes import CRIME_EVENTS_SCHEMA, CRIME_COUNTS_SCHEMA, CRIME_RATES_SCHEMA
 
 def create_database():
     conn = sqlite3.connect("app.db")  # Single database file
@@ -46,6 +49,8 @@ def create_database():
         location_name TEXT PRIMARY KEY,
         crime_rate REAL,
         price REAL,
+        latest_price REAL,
+        price_volume INTEGER,
         num_transport REAL,
         num_malls REAL,
         num_schools REAL
@@ -54,7 +59,7 @@ def create_database():
 
     # Location Details table
     # retail_prices contains JSON data of default retail prices
-    # crime TEXT, contains JSON data of location specific major crime updates
+    # crimes is no longer written, crimes are stored one per row in crime_events
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS location_details (
         location_name TEXT PRIMARY KEY,
@@ -78,19 +83,19 @@ def create_database():
     )
     ''')
 
-    # Create the table to store location transactions, csv is too slow
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS resale_transactions (
-        _id TEXT PRIMARY KEY,
-        month TEXT,
-        town TEXT,
-        flat_type TEXT,
-        block TEXT,
-        street_name TEXT,
-        resale_price REAL
-    )
-    ''')
+    # Create the tables to store location transactions, csv is too slow
+    # resale_transactions is a view over the normalised resale_sales table
+    for schema in RESALE_SCHEMA + RESALE_INDEXES + [RESALE_TRANSACTIONS_VIEW]:
+        cursor.execute(schema)
     
+    # Major crimes with parsed dates, indexed by planning area and date
+    for schema in CRIME_EVENTS_SCHEMA:
+        cursor.execute(schema)
+
+    # Crime counts of every NPC and year, and the crime rate of every location and year
+    cursor.execute(CRIME_COUNTS_SCHEMA)
+    cursor.execute(CRIME_RATES_SCHEMA)
+
     # New
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS notification_logs (
@@ -104,6 +109,9 @@ def create_database():
     )
     ''')
 
+    # Version counter per dataset, bumped by ingest so in-memory caches know when to rebuild
+    cursor.execute(DATA_VERSIONS_SCHEMA)
+
     conn.commit()
     conn.close()
 
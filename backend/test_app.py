@@ -1,6 +1,20 @@
 import pytest
+import gzip
 import json
+import sqlite3
+import itertools
+import threading
+import time
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from app import app
+from controllers import Locations, Notifications, Scoring
+from api import fetch_crimes, fetch_resale, fetcher, resale_snapshot
+import database
+import payload_cache
+import table_models
 
 """
 This script is for testing the rest api endpoints
@@ -12,6 +26,14 @@ def client():
     with app.test_client() as client:
         yield client
 
+@pytest.fixture
+def app_db_copy(tmp_path):
+    """Path of a copy of app.db, for tests that write to it"""
+    db_path = str(tmp_path / "app.db")
+    with database.connect() as conn, sqlite3.connect(db_path) as copy:
+        conn.backup(copy)
+    return db_path
+
 @pytest.fixture
 def create_test_user(client):
     """Create a test user for sorting by score tests"""
@@ -92,6 +114,648 @@ def test_sort_endpoint(client, create_test_user):
     response = client.get('/sort?sort_by=invalid_category')
     assert response.status_code == 400
 
+def test_sort_by_flat_type(client, app_db_copy):
+    """Test that price rankings and scores can use another flat type's prices"""
+    fetch_resale.ensure_resale_schema(app_db_copy)
+    assert fetch_resale.save_resale_price_to_db(db_path=app_db_copy)
+    prices = fetch_resale.get_location_flat_type_prices(db_path=app_db_copy)
+
+    def ranking(flat_type=None):
+        snapshot = Locations.LocationsController.get_ranking_snapshot('price', flat_type=flat_type, db_name=app_db_copy)
+        return json.loads(payload_cache.get_body(snapshot, None))
+
+    data = ranking('5 ROOM')
+    assert data and all(location['flat_type'] == '5 ROOM' for location, _ in data)
+    assert all(location['price'] == prices.get(location['location_name'], {}).get('5 ROOM', 0) for location, _ in data)
+    assert data != ranking()
+
+    matrix, category_scores = Locations.LocationsController.get_location_matrix(db_name=app_db_copy)
+    preferences = {"price": 500000, "importance_rank": ["price", "crime_rate", "schools", "malls", "transport"]}
+    data = Scoring.ScoringController.rank_top_k(matrix=matrix, preferences=preferences, category_scores=category_scores,
+                                                flat_type='EXECUTIVE')
+    assert len(data) == 5
+    for location, _ in data:
+        assert location['price'] == prices[location['location_name']]['EXECUTIVE']
+
+    assert 'CASTLE' not in Locations.LocationsController.get_flat_types(db_name=app_db_copy)
+    assert client.get('/sort?sort_by=price&flat_type=CASTLE').status_code == 400
+
+def reference_score_for_preferences(locations: list, preferences: dict, k: int = 5):
+    """Per-location scoring as it was before the NumPy engine, the reference for its results"""
+    weights = {category: len(preferences['importance_rank']) - i for i, category in enumerate(preferences['importance_rank'])}
+    total_weight = sum(weights.values())
+
+    bounds = {category: [float('inf'), 0] for category in ('price', 'crime_rate', 'schools', 'malls', 'transport')}
+    for location in locations:
+        for category, bound in bounds.items():
+            if category in location:
+                bound[0], bound[1] = min(bound[0], location[category]), max(bound[1], location[category])
+
+    scored_locations = []
+    for location in locations:
+        category_scores = {}
+        if 'price' in location and 'price' in preferences:
+            ideal_price = preferences['price']
+            difference = abs(location['price'] - ideal_price) / ideal_price if ideal_price > 0 else 1
+            category_scores['price'] = 10 * (1 - min(difference, 1))
+        else:
+            category_scores['price'] = 0
+
+        min_val, max_val = bounds['crime_rate']
+        if 'crime_rate' not in location:
+            category_scores['crime_rate'] = 0
+        elif max_val > min_val:
+            category_scores['crime_rate'] = (max_val - location['crime_rate']) / (max_val - min_val) * 10
+        else:
+            category_scores['crime_rate'] = 10
+
+        for category in ['schools', 'malls', 'transport']:
+            min_val, max_val = bounds[category]
+            if category not in location:
+                category_scores[category] = 0
+            elif max_val > min_val:
+                category_scores[category] = (location[category] - min_val) / (max_val - min_val) * 10
+            else:
+                category_scores[category] = 10 if location[category] > 0 else 0
+
+        weighted_score = sum(score * weights[category] for category, score in category_scores.items() if category in weights)
+        final_score = round(weighted_score / total_weight if total_weight > 0 else 0, 2)
+
+        location_copy = location.copy()
+        location_copy['category_scores'] = {category: round(score, 2) for category, score in category_scores.items()}
+        scored_locations.append((location_copy, final_score))
+
+    return sorted(scored_locations, key=lambda x: x[1], reverse=True)[:k]
+
+def test_vectorised_scoring_matches_reference():
+    """Test that the NumPy scorer ranks and scores like the per-location reference"""
+    rng = np.random.default_rng(3)
+    locations = [
+        {"location_name": f"L{i}", "price": float(rng.integers(200, 1200) * 1000), "crime_rate": float(rng.integers(0, 40)),
+         "schools": int(rng.integers(0, 6)), "malls": 2, "transport": float(rng.integers(0, 4))}
+        for i in range(40)
+    ]
+    # Missing categories, a price more than double the ideal and duplicates that tie
+    del locations[3]["schools"], locations[7]["price"], locations[9]["crime_rate"]
+    locations[11]["price"] = 5000000.0
+    locations[20] = dict(locations[5], location_name="L20")
+
+    for importance_rank in (["price", "crime_rate", "schools", "malls", "transport"],
+                            ["transport", "schools", "crime_rate"], ["malls"]):
+        for ideal_price in (500000, 0):
+            preferences = {"price": ideal_price, "importance_rank": importance_rank}
+            for k in (5, len(locations)):
+                expected = reference_score_for_preferences(locations, preferences, k=k)
+                assert Scoring.ScoringController.calculate_score_for_preferences(locations, preferences, k=k) == expected
+
+def test_location_matrix_cache(app_db_copy):
+    """Test that the normalised location matrix is reused within a data version and rebuilt after a bump"""
+    matrix, category_scores = Locations.LocationsController.get_location_matrix(db_name=app_db_copy)
+    assert len(matrix) > 0
+    assert Locations.LocationsController.get_location_matrix(db_name=app_db_copy)[0] is matrix
+
+    # Make the safest location the least safe
+    crime_rate = Scoring.LocationMatrix.CATEGORIES.index('crime_rate')
+    safest = int(np.nanargmin(matrix.values[:, crime_rate]))
+    location_name = matrix.locations[safest]['location_name']
+    with database.connect(app_db_copy) as conn:
+        conn.execute("UPDATE locations SET crime_rate = (SELECT MAX(crime_rate) + 1 FROM locations) WHERE location_name = ?",
+                     (location_name,))
+
+    # Stale until the write bumps the version
+    assert Locations.LocationsController.get_location_matrix(db_name=app_db_copy)[0] is matrix
+    database.bump_data_version('locations', db_path=app_db_copy)
+
+    rebuilt, rebuilt_scores = Locations.LocationsController.get_location_matrix(db_name=app_db_copy)
+    assert rebuilt is not matrix
+    row = [location['location_name'] for location in rebuilt.locations].index(location_name)
+    assert rebuilt.values[row, crime_rate] == np.nanmax(matrix.values[:, crime_rate]) + 1
+    assert rebuilt_scores[0][row, crime_rate] == 0 and category_scores[0][safest, crime_rate] == 10
+
+def test_sort_snapshot_gzip(client):
+    """Test that category rankings are served pre-compressed when the client accepts gzip"""
+    for cat in ["price", "crime_rate", "num_schools", "num_malls", "num_transport"]:
+        plain = client.get(f'/sort?sort_by={cat}')
+        compressed = client.get(f'/sort?sort_by={cat}', headers={'Accept-Encoding': 'gzip'})
+        assert plain.status_code == 200
+        assert compressed.status_code == 200
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(compressed.data) == plain.data
+        assert plain.headers['ETag'] == compressed.headers['ETag']
+
+def test_get_all_coords_lod(client):
+    """Test that zoomed-out maps get simplified outlines for the same planning areas"""
+    full = json.loads(client.get('/get_all_coords').data)
+    coarse = json.loads(client.get('/get_all_coords?zoom=5').data)
+
+    assert [loc['location_name'] for loc in full] == [loc['location_name'] for loc in coarse]
+    # location_details order, the cached payload and its ETag need stable bytes
+    names = [row['location_name'] for row in database.fetch_all("SELECT location_name FROM location_details ORDER BY rowid")]
+    coarse_names = [loc['location_name'] for loc in coarse]
+    assert coarse_names == sorted(coarse_names, key=names.index)
+    assert sum(len(loc['geodata']) for loc in coarse) < sum(len(loc['geodata']) for loc in full)
+
+    response = client.get('/get_all_coords?zoom=abc')
+    assert response.status_code == 400
+
+def test_get_all_coords_etag(client):
+    """Test that returning visitors get a 304 for unchanged boundaries"""
+    response = client.get('/get_all_coords', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    cached = client.get('/get_all_coords', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    # Another LOD level or viewport is another response
+    etag = {'If-None-Match': response.headers['ETag']}
+    assert client.get('/get_all_coords?zoom=11', headers=etag).status_code == 200
+    assert client.get('/get_all_coords?bbox=103.8,1.3,103.9,1.4', headers=etag).status_code == 200
+    assert client.get('/get_all_coords?format=topo', headers=etag).status_code == 200
+
+def test_get_all_coords_bbox(client):
+    """Test that a viewport bbox only returns the planning areas around it"""
+    data = json.loads(client.get('/get_all_coords?bbox=103.84,1.36,103.86,1.38').data)
+    names = [loc['location_name'] for loc in data]
+    assert 'Ang Mo Kio' in names
+    assert 'Tuas' not in names
+
+    assert client.get('/get_all_coords?bbox=1,2,3').status_code == 400
+
+    # Viewport subsets are only compressed in the encoding a client asks for
+    bbox = (103.8, 1.3, 103.9, 1.4)
+    response = client.get('/get_all_coords?bbox=103.8,1.3,103.9,1.4', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    payload = Locations.LocationsController.get_all_coords_payload(bbox=bbox)
+    assert 'gzip' in payload and 'br' not in payload
+    assert gzip.decompress(payload['gzip']) == payload['json']
+
+    plain = payload_cache.encode_payload({'a': 1}, 1)
+    assert set(plain) == {'version', 'json'}
+    assert payload_cache.get_body(plain) == b'{"a":1}\n'
+
+def test_get_all_coords_topo(client):
+    """Test that the TopoJSON format covers every planning area with fewer bytes"""
+    full = client.get('/get_all_coords')
+    topo = client.get('/get_all_coords?format=topo')
+    assert topo.status_code == 200
+
+    data = json.loads(topo.data)
+    geometries = data['objects']['planning_areas']['geometries']
+    assert data['type'] == 'Topology'
+    assert [g['properties']['location_name'] for g in geometries] == [loc['location_name'] for loc in json.loads(full.data)]
+    assert len(topo.data) < len(full.data)
+
+def test_map_tiles(client):
+    """Test that a tile over Ang Mo Kio has its outline and amenities, and empty tiles return 204"""
+    # z14 tile containing AMK Hub
+    response = client.get('/tiles/14/12918/8129', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    data = json.loads(gzip.decompress(response.data))
+    assert 'Ang Mo Kio' in [f['properties']['location_name'] for f in data['planning_areas']['features']]
+
+    cached = client.get('/tiles/14/12918/8129', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+    # Middle of the Atlantic
+    assert client.get('/tiles/14/0/0').status_code == 204
+
+def test_price_bands(client):
+    """Test that fan-chart bands are ordered percentiles per month"""
+    response = client.get('/price_bands?location_name=Ang Mo Kio&flat_type=3 ROOM')
+    assert response.status_code == 200
+
+    data = json.loads(response.data)
+    series = data['series']['3 ROOM']
+    assert len(series['months']) == len(series['p50']) > 0
+    for i in range(len(series['months'])):
+        assert series['p10'][i] <= series['p25'][i] <= series['p50'][i] <= series['p75'][i] <= series['p90'][i]
+
+    # Same data version, but another location or flat type is another response
+    etag = {'If-None-Match': response.headers['ETag']}
+    assert client.get('/price_bands?location_name=Ang Mo Kio&flat_type=3 ROOM', headers=etag).status_code == 304
+    assert client.get('/price_bands?location_name=Ang Mo Kio&flat_type=4 ROOM', headers=etag).status_code == 200
+    assert client.get('/price_bands?location_name=Bishan&flat_type=3 ROOM', headers=etag).status_code == 200
+    assert client.get('/price_bands?location_name=Ang Mo Kio', headers=etag).status_code == 200
+
+    assert client.get('/price_bands').status_code == 400
+
+def test_transactions_pagination(client):
+    """Test that keyset pages and the NDJSON stream return the same transactions, newest first"""
+    url = '/transactions?location_name=Ang Mo Kio&flat_type=3 ROOM'
+
+    paged = []
+    cursor = None
+    while True:
+        response = client.get(url + '&limit=40' + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        paged += data['transactions']
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+
+    expected = [t for t in fetch_resale.get_all_transactions_by_location('Ang Mo Kio') if t['flat_type'] == '3 ROOM']
+    assert len(paged) == len(expected) > 40
+    assert len({t['_id'] for t in paged}) == len(paged)
+    assert [t['month'] for t in paged] == sorted((t['month'] for t in paged), reverse=True)
+
+    response = client.get(url + '&format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    streamed = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert streamed == paged
+
+    data = json.loads(client.get(url + '&start_month=2018-01&end_month=2018-12&limit=1000').data)
+    assert data['transactions'] and all(t['month'].startswith('2018') for t in data['transactions'])
+
+    assert client.get('/transactions').status_code == 400
+    assert client.get(url + '&cursor=bogus').status_code == 400
+    assert client.get(url + '&start_month=2018').status_code == 400
+
+def test_location_prices_match_reference(tmp_path):
+    """Test the windowed price query against a pandas 12-month median, latest median and volume"""
+    rng = np.random.default_rng(18)
+    months = [year * 100 + month for year in (2022, 2023, 2024) for month in range(1, 13)]
+    sales = pd.DataFrame({
+        "month": rng.choice(months, 600),
+        "town": rng.choice(["Bishan", "Bedok", "Yishun"], 600),
+        "flat_type": rng.choice(["3 ROOM", "4 ROOM"], 600),
+        "resale_price": rng.integers(300, 900, 600) * 1000.0,
+    })
+    # Yishun 4 ROOM ends early, so its window is not the global latest 12 months
+    sales = sales[~((sales.town == "Yishun") & (sales.flat_type == "4 ROOM") & (sales.month > 202306))]
+
+    db_path = str(tmp_path / "prices.db")
+    fetch_resale.ensure_resale_schema(db_path)
+    with database.connect(db_path) as conn:
+        cursor = conn.cursor()
+        towns = fetch_resale._lookup_ids(cursor, "towns", sales.town)
+        flat_types = fetch_resale._lookup_ids(cursor, "flat_types", sales.flat_type)
+        streets = fetch_resale._lookup_ids(cursor, "streets", ["ST"])
+        cursor.executemany(
+            "INSERT INTO resale_sales (month, town_id, flat_type_id, block, street_id, resale_price) VALUES (?, ?, ?, '1', ?, ?)",
+            [(int(s.month), towns[s.town], flat_types[s.flat_type], streets["ST"], s.resale_price) for s in sales.itertuples()])
+        prices = fetch_resale.compute_location_prices(cursor)
+
+    expected = {}
+    for (town, flat_type), group in sales.groupby(["town", "flat_type"]):
+        latest = group.month.max()
+        start = pd.Period(f"{latest // 100}-{latest % 100:02d}", "M") - (fetch_resale.PRICE_WINDOW_MONTHS - 1)
+        window = group[group.month >= start.year * 100 + start.month]
+        expected[(town, flat_type)] = (window.resale_price.median(),
+                                       group[group.month == latest].resale_price.median(), len(window))
+
+    assert prices.keys() == expected.keys()
+    for key, (price, latest_price, volume) in expected.items():
+        assert prices[key] == (pytest.approx(price), pytest.approx(latest_price), volume)
+
+def test_legacy_resale_table_conversion(tmp_path):
+    """Test that the old text-keyed resale_transactions table is converted to resale_sales and the view"""
+    db_path = str(tmp_path / "legacy.db")
+    rows = [
+        ("7", "2017-01", "BISHAN", "3 ROOM", "1", "BISHAN ST 11", 400000.0),
+        ("3", "2024-12", "BEDOK", "4 ROOM", "2", "BEDOK NTH RD", 550000.0),
+        ("12", "2024-12", "BISHAN", "4 ROOM", "3", "BISHAN ST 11", 620000.0),
+        ("csv-1", "bad month", "BEDOK", "3 ROOM", "4", "BEDOK NTH RD", 380000.0),
+    ]
+    with database.connect(db_path) as conn:
+        conn.execute('''CREATE TABLE resale_transactions (_id TEXT PRIMARY KEY, month TEXT, town TEXT, flat_type TEXT,
+                        block TEXT, street_name TEXT, resale_price REAL)''')
+        conn.executemany("INSERT INTO resale_transactions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    fetch_resale.ensure_resale_schema(db_path)
+
+    count = lambda table: database.fetch_one(f"SELECT COUNT(*) AS n FROM {table}", db_path=db_path)["n"]
+    assert (count("resale_sales"), count("towns"), count("flat_types"), count("streets")) == (4, 2, 2, 2)
+    assert database.fetch_one("SELECT type FROM sqlite_master WHERE name = 'resale_transactions'", db_path=db_path)["type"] == "view"
+
+    # Numeric ids are kept, the others are numbered after them; months become yyyymm
+    sales = database.fetch_all('''SELECT s.sale_id, s.month, t.name AS town, f.name AS flat_type FROM resale_sales s
+                                  JOIN towns t USING (town_id) JOIN flat_types f USING (flat_type_id) ORDER BY s.sale_id''', db_path=db_path)
+    assert [tuple(sale.values()) for sale in sales] == [
+        (3, 202412, "BEDOK", "4 ROOM"), (7, 201701, "BISHAN", "3 ROOM"),
+        (12, 202412, "BISHAN", "4 ROOM"), (13, None, "BEDOK", "3 ROOM")]
+
+    view = database.fetch_all("SELECT * FROM resale_transactions ORDER BY _id", db_path=db_path)
+    assert [tuple(row.values()) for row in view] == [
+        (3, *rows[1][1:]), (7, *rows[0][1:]), (12, *rows[2][1:]), (13, "", *rows[3][2:])]
+
+def test_csv_bulk_load(tmp_path):
+    """Test that the CSV export is loaded chunk by chunk, duplicates replaced and the connection settings restored"""
+    csv_path = tmp_path / "resale.csv"
+    csv_path.write_text(
+        "month,town,flat_type,block,street_name,resale_price\n"
+        "2024-01,BISHAN,3 ROOM,1,BISHAN ST 11,400000\n"
+        "2024-1,BEDOK,4 ROOM,2,BEDOK NTH RD,550000\n"
+        "2024-02,BISHAN,4 ROOM,3,BISHAN ST 11,620000\n"
+        "2024-01,BISHAN,3 ROOM,1,BISHAN ST 11,400000\n"
+        "2024-03,BEDOK,3 ROOM,4,BEDOK NTH RD,not a price\n", encoding="utf-8")
+    db_path = str(tmp_path / "load.db")
+
+    # A checkpoint left by an earlier sync of other rows
+    with database.connect(db_path) as conn:
+        fetch_resale._ensure_sync_state_table(conn.cursor())
+        fetch_resale._save_sync_state(conn.cursor(), 900, 900, "2030-01", set())
+
+    assert fetch_resale._migrate_csv_to_db(csv_path=str(csv_path), db_path=db_path, chunk_size=2) == 5
+
+    # The duplicate in the second chunk replaces the first row
+    sales = database.fetch_all("SELECT _id, month, town, flat_type, resale_price FROM resale_transactions ORDER BY _id", db_path=db_path)
+    assert [tuple(sale.values()) for sale in sales] == [
+        (2, "2024-01", "BEDOK", "4 ROOM", 550000), (3, "2024-02", "BISHAN", "4 ROOM", 620000),
+        (4, "2024-01", "BISHAN", "3 ROOM", 400000), (5, "2024-03", "BEDOK", "3 ROOM", 0)]
+    towns = database.fetch_all("SELECT town_id, name FROM towns ORDER BY town_id", db_path=db_path)
+    assert [(town["town_id"], town["name"]) for town in towns] == [(1, "BEDOK"), (2, "BISHAN")]
+    assert database.fetch_one("SELECT COUNT(*) AS n FROM resale_sales s JOIN towns t USING (town_id) JOIN flat_types f USING (flat_type_id)",
+                              db_path=db_path)["n"] == 4
+    assert database.fetch_one("SELECT SUM(num_transactions) AS n FROM resale_monthly", db_path=db_path)["n"] == 4
+
+    state = fetch_resale.get_sync_state(db_path=db_path)
+    assert (state["last_offset"], state["last_id"], state["last_month"]) == (5, 5, "2024-03")
+    assert json.loads(state["pending_towns"]) == ["BEDOK", "BISHAN"]
+
+    # The pooled connection goes back with the normal pragmas
+    with database.connect(db_path) as conn:
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -16000
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def serve_datastore(state: dict, resource_id: str):
+    """Serve state["records"] like the data.gov.sg datastore_search API, sets state["url"]. Return: The server"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            offset, limit = int(query["offset"][0]), int(query["limit"][0])
+
+            if state["failures"] or (state["fail_from_offset"] is not None and offset >= state["fail_from_offset"]):
+                state["failures"] = max(state["failures"] - 1, 0)
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            state["offsets"].append(offset)
+
+            body = json.dumps({"result": {"total": len(state["records"]), "records": state["records"][offset:offset + limit]}})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/api/action/datastore_search?resource_id={resource_id}"
+    return server
+
+@pytest.fixture
+def resale_api():
+    """Local stand-in for the data.gov.sg resale prices API"""
+    state = {"records": [], "offsets": [], "failures": 0, "fail_from_offset": None}
+    server = serve_datastore(state, "resale")
+    yield state
+    server.shutdown()
+
+@pytest.fixture
+def crime_api():
+    """Local stand-in for the data.gov.sg crime dataset API"""
+    state = {"records": [], "offsets": [], "failures": 0, "fail_from_offset": None}
+    server = serve_datastore(state, "crimes")
+    yield state
+    server.shutdown()
+
+def test_incremental_resale_sync(resale_api, tmp_path):
+    """Test that a second sync only fetches records added after the checkpoint"""
+    def add_records(start, count):
+        resale_api["records"] += [
+            {"_id": i, "month": "2024-01", "town": "Ang Mo Kio", "flat_type": "3 ROOM",
+             "block": str(i), "street_name": "ST", "resale_price": str(400000 + i)}
+            for i in range(start, start + count)
+        ]
+
+    db_path = str(tmp_path / "sync.db")
+    add_records(1, 25)
+    assert fetch_resale.sync_resale_data(api_url=resale_api["url"], db_path=db_path, limit=10, update_prices=False) == 25
+
+    add_records(26, 3)
+    resale_api["offsets"].clear()
+    assert fetch_resale.sync_resale_data(api_url=resale_api["url"], db_path=db_path, limit=10, update_prices=False) == 3
+    assert resale_api["offsets"] == [25]
+
+    assert fetch_resale.get_sync_state(db_path=db_path)["last_id"] == 28
+    assert database.fetch_one("SELECT num_transactions FROM resale_monthly", db_path=db_path)["num_transactions"] == 28
+
+    # The columnar snapshot is re-exported after the ingest
+    snapshot = resale_snapshot.load_snapshot(db_path=db_path)
+    assert len(snapshot) == 28
+    assert snapshot.prices.max() == 400028
+    assert snapshot.decode("town").tolist() == ["Ang Mo Kio"] * 28
+
+def test_interrupted_resale_sync(resale_api, tmp_path, monkeypatch):
+    """Test that pages committed before a failure keep their rollups and a shrunk dataset is replaced"""
+    monkeypatch.setattr(fetcher, "BACKOFF_SECONDS", 0)
+    resale_api["records"] = [
+        {"_id": i, "month": "2024-01", "town": "Bishan" if i <= 10 else "Bedok", "flat_type": "3 ROOM",
+         "block": str(i), "street_name": "ST", "resale_price": "500000"}
+        for i in range(1, 21)
+    ]
+    db_path = str(tmp_path / "sync.db")
+
+    # The second page keeps failing, the first one stays committed with its rollup
+    resale_api["fail_from_offset"] = 10
+    with pytest.raises(Exception):
+        fetch_resale.sync_resale_data(api_url=resale_api["url"], db_path=db_path, limit=10, max_workers=1)
+
+    state = fetch_resale.get_sync_state(db_path=db_path)
+    assert state["last_offset"] == 10 and json.loads(state["pending_towns"]) == ["Bishan"]
+    assert database.fetch_all("SELECT town, num_transactions FROM resale_monthly", db_path=db_path) == [
+        {"town": "Bishan", "num_transactions": 10}]
+
+    resale_api["fail_from_offset"] = None
+    assert fetch_resale.sync_resale_data(api_url=resale_api["url"], db_path=db_path, limit=10, update_prices=False) == 10
+    assert json.loads(fetch_resale.get_sync_state(db_path=db_path)["pending_towns"]) == ["Bedok", "Bishan"]
+
+    # Republished with fewer records: the old rows are deleted before fetching again
+    resale_api["records"] = resale_api["records"][:5]
+    fetch_resale.sync_resale_data(api_url=resale_api["url"], db_path=db_path, limit=10, update_prices=False)
+    assert database.fetch_one("SELECT COUNT(*) AS n FROM resale_sales", db_path=db_path)["n"] == 5
+    assert database.fetch_all("SELECT town, num_transactions FROM resale_monthly", db_path=db_path) == [
+        {"town": "Bishan", "num_transactions": 5}]
+
+def test_concurrent_fetch_pages_in_order(resale_api, monkeypatch):
+    """Test that concurrently fetched pages come back in offset order and transient errors are retried"""
+    monkeypatch.setattr(fetcher, "BACKOFF_SECONDS", 0)
+    resale_api["records"] = [{"_id": i} for i in range(95)]
+    resale_api["failures"] = 2
+
+    pages = list(fetcher.fetch_pages(resale_api["url"], page_size=10, max_workers=4))
+
+    assert [offset for offset, _ in pages] == list(range(0, 100, 10))
+    assert [record["_id"] for _, result in pages for record in result["records"]] == list(range(95))
+
+def test_fetch_pages_early_close(monkeypatch):
+    """Test that a consumer stopping early does not wait for the prefetched pages"""
+    def slow_fetch_json(url, params=None, **kwargs):
+        if params["offset"]:
+            time.sleep(0.5)
+        return {"result": {"total": 1000, "records": [{}] * params["limit"]}}
+
+    monkeypatch.setattr(fetcher, "fetch_json", slow_fetch_json)
+    pages = fetcher.fetch_pages("http://localhost/datastore_search", page_size=10, max_workers=2)
+    assert [offset for offset, _ in itertools.islice(pages, 2)] == [0, 10]
+
+    start = time.perf_counter()
+    pages.close()
+    assert time.perf_counter() - start < 0.25
+
+def test_crime_events_by_date(tmp_path):
+    """Test that crimes are indexed by planning area and filtered by date range"""
+    def crime(date, area):
+        return {"Date": date, "Time": "Null", "Type of Crime": "Robbery", "Planning Area": area,
+                "Summary": "", "Link to Reference": "Link"}
+
+    db_path = str(tmp_path / "crimes.db")
+    crimes = [crime("3 Mar 2021", "Bishan"), crime("Dec 2002", "Bishan"), crime("unknown", "Bishan"),
+              crime("9 Jan 2024", "Bishan"), crime("1 Feb 2024", "Toa Payoh")]
+    assert fetch_crimes.save_crime_events_to_db(crimes, db_path=db_path) == 5
+
+    all_bishan = fetch_crimes.fetch_all_crimes_by_location("Bishan", db_path=db_path)
+    assert all_bishan == crimes[:4]
+
+    # Date ranges keep the crimes.csv order too
+    recent = fetch_crimes.fetch_all_crimes_by_location("Bishan", start_date="2002-01-01", db_path=db_path)
+    assert [c["Date"] for c in recent] == ["3 Mar 2021", "Dec 2002", "9 Jan 2024"]
+    recent = fetch_crimes.fetch_all_crimes_by_location("Bishan", start_date="2019-04-01", db_path=db_path)
+    assert [c["Date"] for c in recent] == ["3 Mar 2021", "9 Jan 2024"]
+    older = fetch_crimes.fetch_all_crimes_by_location("Bishan", end_date="2002-12-01", db_path=db_path)
+    assert [c["Date"] for c in older] == ["Dec 2002"]
+    assert fetch_crimes.fetch_all_crimes_by_location("Novena", db_path=db_path) == []
+
+    # A new save replaces the events and the in-memory index
+    fetch_crimes.save_crime_events_to_db(crimes[:1], db_path=db_path)
+    assert len(fetch_crimes.fetch_all_crimes_by_location("Bishan", db_path=db_path)) == 1
+
+def test_crime_rates_all_years():
+    """Test that the batch crime rates cover every year and match the single-location lookup"""
+    years, rates = fetch_crimes.compute_crime_rates(["Bishan", "bedok", "Nowhere"])
+    assert years == sorted(years) and len(years) > 1
+    assert rates.shape == (3, len(years))
+
+    assert rates[0, -1] == fetch_crimes.fetch_crime_rate_by_location("Bishan") > 0
+    assert rates[1, 0] == fetch_crimes.fetch_crime_rate_by_location("Bedok", year=years[0]) > 0
+    assert not rates[2].any()
+
+def test_crime_trends(client, app_db_copy, monkeypatch):
+    """Test the crime trend endpoint for one location and for all of them"""
+    # Reading never saves the rates, ensure_crime_rates does it once
+    version = database.get_data_version('crime_rates', db_path=app_db_copy)
+    fetch_crimes.get_crime_trends(db_path=app_db_copy)
+    assert database.get_data_version('crime_rates', db_path=app_db_copy) == version
+    assert fetch_crimes.ensure_crime_rates(db_path=app_db_copy)
+    version = database.get_data_version('crime_rates', db_path=app_db_copy)
+    assert fetch_crimes.ensure_crime_rates(db_path=app_db_copy)
+    assert database.get_data_version('crime_rates', db_path=app_db_copy) == version > 0
+
+    get_crime_trends = fetch_crimes.get_crime_trends
+    monkeypatch.setattr(fetch_crimes, "get_crime_trends", lambda: get_crime_trends(db_path=app_db_copy))
+
+    response = client.get('/crime_trends?location_name=Bishan')
+    assert response.status_code == 200
+    trend = json.loads(response.data)
+
+    assert trend['location_name'] == 'Bishan'
+    assert len(trend['years']) == len(trend['crime_rate']) == len(trend['change']) > 1
+    assert trend['change'][0] is None
+    assert trend['change'][-1] == pytest.approx(trend['crime_rate'][-1] - trend['crime_rate'][-2])
+    assert trend['crime_rate'][-1] == pytest.approx(fetch_crimes.fetch_crime_rate_by_location('Bishan'))
+
+    # Flat rates have no slope, a steady rise has its yearly step as slope
+    trends = fetch_crimes.CrimeTrends(0, ['A', 'B'], [2020, 2021, 2022], np.array([[5.0, 5.0, 5.0], [1.0, 3.0, 5.0]]))
+    assert trends.slopes.tolist() == pytest.approx([0.0, 2.0])
+
+    response = client.get('/crime_trends?location_name=Bishan', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    # The ETag differs per location and from the list of all of them
+    assert client.get('/crime_trends?location_name=Bedok', headers={'If-None-Match': response.headers['ETag']}).status_code == 200
+    assert client.get('/crime_trends', headers={'If-None-Match': response.headers['ETag']}).status_code == 200
+    all_trends = json.loads(client.get('/crime_trends').data)
+    assert trend in all_trends
+
+    assert client.get('/crime_trends?location_name=Nowhere').status_code == 404
+
+def test_incremental_crime_fetch(crime_api, tmp_path, monkeypatch):
+    """Test that only crimes missing from crime_events are stored, appended to the cache and notified"""
+    def crime(date, area):
+        return {"Date": date, "Time": "Null", "Type of Crime": "Robbery", "Planning Area": area,
+                "Summary": "Test", "Link to Reference": "Link"}
+
+    monkeypatch.chdir(tmp_path)
+    table_models.create_database()
+    db_path = str(tmp_path / "app.db")
+
+    # Existing cache without a trailing newline, like the one shipped in api_cache
+    cache_file = tmp_path / "crimes.csv"
+    cache_file.write_text("Date,Time,Type of Crime,Planning Area,Summary,Link to Reference\r\n"
+                          "1 Jan 2020,Null,Robbery,Bishan,Test,Link", encoding="utf-8")
+    monkeypatch.setattr(fetch_crimes, "CACHE_CRIME_DATA_FILE", str(cache_file))
+
+    crime_api["records"] = [crime("1 Jan 2020", "Bishan"), crime("2 Feb 2024", "Bishan"), crime("3 Mar 2024", "Bedok")]
+    records, notification_ids = fetch_crimes.fetch_crime_data_from_api(api_url=crime_api["url"], db_path=db_path)
+    assert len(records) == 3 and len(notification_ids) == 2
+    # Crime rates come from the yearly counts, the fetch leaves them alone
+    assert database.get_data_version('crime_rates', db_path=db_path) == 0
+
+    logs = database.fetch_all("SELECT notification_id, location_name FROM notification_logs ORDER BY notification_id", db_path=db_path)
+    assert [log["notification_id"] for log in logs] == notification_ids
+    assert [log["location_name"] for log in logs] == ["Bishan", "Bedok"]
+
+    assert [c["Date"] for c in fetch_crimes.load_crime_data_from_cache(str(cache_file))] == ["1 Jan 2020", "2 Feb 2024", "3 Mar 2024"]
+    assert len(fetch_crimes.fetch_all_crimes_by_location("Bishan", db_path=db_path)) == 2
+
+    # Nothing new the second time
+    assert fetch_crimes.fetch_crime_data_from_api(api_url=crime_api["url"], db_path=db_path)[1] == []
+    assert len(fetch_crimes.load_crime_data_from_cache(str(cache_file))) == 3
+
+def test_notification_logs_bulk(tmp_path, monkeypatch):
+    """Test that bulk notification logs are validated together and get their IDs in order"""
+    monkeypatch.chdir(tmp_path)
+    table_models.create_database()
+    db_path = str(tmp_path / "app.db")
+
+    events = [
+        {"location_name": "Bishan", "notification_type": "price", "message": "Price changed"},
+        {"location_name": "Bishan", "notification_type": "weather", "message": "Invalid type"},
+        {"location_name": "Bedok", "notification_type": "malls", "message": "Malls changed"},
+    ]
+    ids = Notifications.NotificationsController.create_notification_logs_bulk(events, db_name=db_path)
+    assert ids[1] == -1 and 0 < ids[0] < ids[2]
+
+    logs = database.fetch_all("SELECT notification_id, type, message FROM notification_logs ORDER BY notification_id", db_path=db_path)
+    assert [(log["notification_id"], log["type"], log["message"]) for log in logs] == [
+        (ids[0], "price", "Price changed"), (ids[2], "malls", "Malls changed")]
+
+    assert Notifications.NotificationsController.create_notification_log("Bedok", "crime", "Crime", db_name=db_path) == ids[2] + 1
+    assert Notifications.NotificationsController.create_notification_logs_bulk([], db_name=db_path) == []
+
+    # A failed insert on the caller's connection only rolls back its own logs
+    with database.connect(db_path) as conn:
+        conn.execute("CREATE TRIGGER fail_boom BEFORE INSERT ON notification_logs WHEN NEW.message = 'boom' "
+                     "BEGIN SELECT RAISE(ABORT, 'boom'); END")
+        conn.execute("INSERT INTO data_versions (name, version) VALUES ('caller', 1)")
+        failed = Notifications.NotificationsController.create_notification_logs_bulk([
+            {"location_name": "Bedok", "notification_type": "crime", "message": "kept?"},
+            {"location_name": "Bedok", "notification_type": "crime", "message": "boom"},
+        ], conn=conn)
+        assert failed == [-1, -1]
+        conn.commit()
+
+    assert database.fetch_one("SELECT COUNT(*) AS n FROM notification_logs", db_path=db_path)["n"] == 3
+    assert database.get_data_version("caller", db_path=db_path) == 1
+
 # def test_search_endpoint(client):
 #     """Test the search endpoint"""
 #     # Test with a valid sorting category